@@ -1,8 +1,138 @@
+import base64
 import json
 import os
-import psycopg2
-from typing import Dict, Any
+import sys
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 
+# Deployed functions carry their own copy of shared (backend/bundle.py); in the repo it is a sibling
+if not os.path.isdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared')):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import audit, db, events, metrics, queries, responses, serialization, sessions, streaming
+
+MAX_LIMIT = 1000
+
+def parse_timestamp(value: str, name: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).replace(tzinfo=None)
+    except ValueError:
+        raise ValueError(f'Invalid {name} timestamp')
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def build_filters(params: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
+    """
+    WHERE clauses shared by listing and export: action_type, admin_username, from, to, q.
+    from/to are plain created_at comparisons so admin_actions partitions outside the range are pruned.
+    """
+    clauses: List[str] = []
+    args: List[Any] = []
+    if params.get('action_type'):
+        clauses.append('action_type = %s')
+        args.append(params['action_type'])
+    if params.get('admin_username'):
+        clauses.append('admin_username = %s')
+        args.append(params['admin_username'])
+    if params.get('from'):
+        clauses.append('created_at >= %s')
+        args.append(parse_timestamp(params['from'], 'from'))
+    if params.get('to'):
+        clauses.append('created_at < %s')
+        args.append(parse_timestamp(params['to'], 'to'))
+    if params.get('q'):
+        # Served by the trigram GIN indexes on details and admin_username
+        pattern = '%' + params['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        clauses.append('(details ILIKE %s OR admin_username ILIKE %s)')
+        args.extend([pattern, pattern])
+    return clauses, args
+
+def export_logs(event: Dict[str, Any], params: Dict[str, Any], username: str) -> Dict[str, Any]:
+    '''
+    Stream every matching row as NDJSON or CSV: ?export=ndjson|csv[&gzip=1] plus the
+    listing filters. Rows come from a server-side cursor, so memory stays flat.
+    '''
+    json_headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+    export_format = params.get('export')
+    if export_format not in streaming.FORMATS:
+        return {
+            'statusCode': 400,
+            'headers': json_headers,
+            'body': json.dumps({'error': 'export must be one of: ' + ', '.join(sorted(streaming.FORMATS))}),
+            'isBase64Encoded': False
+        }
+    if not streaming.supported(event):
+        return {
+            'statusCode': 501,
+            'headers': json_headers,
+            'body': json.dumps({'error': 'Export is only available through the backend server'}),
+            'isBase64Encoded': False
+        }
+    try:
+        clauses, args = build_filters(params)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'headers': json_headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+    chunks = streaming.query_chunks(
+        f"SELECT {queries.AUDIT_COLUMNS} FROM admin_actions {where} ORDER BY created_at DESC, id DESC",
+        args,
+        name='audit_export'
+    )
+    compress = params.get('gzip') in ('1', 'true')
+    filters = ', '.join(f'{key}={params[key]}' for key in ('action_type', 'admin_username', 'from', 'to', 'q') if params.get(key))
+    audit.record(username, 'export_audit_log', 'admin_actions',
+                 details=f'Exported audit log as {export_format}' + (f' ({filters})' if filters else ''),
+                 ip_address=audit.client_ip(event))
+    return streaming.response(
+        export_format,
+        'audit-log-' + datetime.now().strftime('%Y%m%d-%H%M%S'),
+        streaming.encode(export_format, chunks, compress),
+        compress,
+        {'Access-Control-Allow-Origin': '*'}
+    )
+
+def stream_events(event: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Live feed of new audit entries as Server-Sent Events: ?action=events[&token=...].
+    Each event only says that admin_actions changed; the page refetches its first page.
+    '''
+    json_headers = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+    if not streaming.supported(event):
+        return {
+            'statusCode': 501,
+            'headers': json_headers,
+            'body': json.dumps({'error': 'Live updates are only available through the backend server'}),
+            'isBase64Encoded': False
+        }
+    try:
+        subscription = events.subscribe(('admin_actions',), responses.get_header(event, 'Last-Event-ID'))
+    except events.TooManySubscribers as e:
+        return {
+            'statusCode': 503,
+            'headers': {**json_headers, 'Retry-After': '30'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    return events.response(subscription, {'Access-Control-Allow-Origin': '*'})
+
+db.prewarm()
+
+@metrics.instrument('audit')
+@responses.compressible
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
     Business: Get audit logs for admin actions monitoring
@@ -26,7 +156,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
     
     headers = event.get('headers', {})
+    params = event.get('queryStringParameters') or {}
     token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    if not token and params.get('action') == 'events':
+        # EventSource cannot send headers
+        token = params.get('token')
     
     if not token:
         return {
@@ -36,8 +170,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    if not dsn:
+    if not os.environ.get('DATABASE_URL'):
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -45,82 +178,86 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    conn = psycopg2.connect(dsn)
-    cur = conn.cursor()
-    
-    # Verify token and check if superadmin
-    cur.execute(
-        "SELECT username, role FROM users WHERE token = %s",
-        (token,)
-    )
-    user_row = cur.fetchone()
+    # Journal scans are read-only and go to a replica when one is configured
+    with db.connection(readonly=method == 'GET') as conn:
+        cur = conn.cursor()
     
-    if not user_row:
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 401,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Invalid token'}),
-            'isBase64Encoded': False
-        }
+        # Verify token and check if superadmin
+        session = sessions.verify(token, cur)
     
-    username, role = user_row
+        if not session:
+            cur.close()
+            return {
+                'statusCode': 401,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Invalid token'}),
+                'isBase64Encoded': False
+            }
     
-    if role != 'superadmin':
-        cur.close()
-        conn.close()
-        return {
-            'statusCode': 403,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Access denied. Superadmin only.'}),
-            'isBase64Encoded': False
-        }
+        if session.role != 'superadmin':
+            cur.close()
+            return {
+                'statusCode': 403,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Access denied. Superadmin only.'}),
+                'isBase64Encoded': False
+            }
     
-    if method == 'GET':
-        params = event.get('queryStringParameters') or {}
-        limit = int(params.get('limit', 100))
-        offset = int(params.get('offset', 0))
+        if method == 'GET':
+            if params.get('action') == 'events':
+                cur.close()
+                return stream_events(event)
+            if params.get('export'):
+                cur.close()
+                return export_logs(event, params, session.username)
+            try:
+                limit = min(max(int(params.get('limit', 100)), 1), MAX_LIMIT)
+                clauses, args = build_filters(params)
+                if params.get('cursor'):
+                    # Keyset pagination on (created_at, id) instead of deep OFFSETs
+                    cursor_created_at, cursor_id = decode_cursor(params['cursor'])
+                    # The plain created_at bound lets the planner prune newer monthly partitions
+                    clauses.append('created_at <= %s AND (created_at, id) < (%s, %s)')
+                    args.extend([cursor_created_at, cursor_created_at, cursor_id])
+                if int(params.get('offset') or 0) != 0:
+                    # Deep OFFSETs scan and discard every skipped row; pages follow next_cursor
+                    raise ValueError('offset is not supported, page with the next_cursor of the previous response')
+            except ValueError as e:
+                cur.close()
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': str(e)}),
+                    'isBase64Encoded': False
+                }
         
-        cur.execute("""
-            SELECT id, admin_username, action_type, target_type, target_id, 
-                   details, ip_address, created_at
-            FROM admin_actions
-            ORDER BY created_at DESC
-            LIMIT %s OFFSET %s
-        """, (limit, offset))
+            where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+            # One prepared statement per combination of filters
+            queries.execute(cur, 'audit.page', (*args, limit + 1), where=where)
         
-        rows = cur.fetchall()
-        logs = []
+            rows = cur.fetchall()
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+            logs = serialization.records(cur, rows)
+            cur.close()
         
-        for row in rows:
-            logs.append({
-                'id': row[0],
-                'admin_username': row[1],
-                'action_type': row[2],
-                'target_type': row[3],
-                'target_id': row[4],
-                'details': row[5],
-                'ip_address': row[6],
-                'created_at': row[7].isoformat() if row[7] else None
-            })
+            next_cursor: Optional[str] = None
+            if has_more and rows[-1][7] is not None:
+                next_cursor = encode_cursor(rows[-1][7], rows[-1][0])
+            body = serialization.encode({'logs': logs, 'next_cursor': next_cursor})
         
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': body.decode('utf-8'),
+                'isBase64Encoded': False
+            }
+    
         cur.close()
-        conn.close()
-        
+    
         return {
-            'statusCode': 200,
+            'statusCode': 405,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'logs': logs}),
+            'body': json.dumps({'error': 'Method not allowed'}),
             'isBase64Encoded': False
         }
-    
-    cur.close()
-    conn.close()
-    
-    return {
-        'statusCode': 405,
-        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-        'body': json.dumps({'error': 'Method not allowed'}),
-        'isBase64Encoded': False
-    }
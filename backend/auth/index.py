@@ -6,21 +6,29 @@ Returns: HTTP response with auth token and user role
 
 import json
 import os
-import secrets
+import sys
 from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
-import bcrypt
 
-def get_db_connection():
-    """Create database connection using simple query protocol"""
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url)
+# Deployed functions carry their own copy of shared (backend/bundle.py); in the repo it is a sibling
+if not os.path.isdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared')):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import audit, db, metrics, passwords, queries, ratelimit, sessions
 
 def verify_password(password: str, password_hash: str) -> bool:
-    """Verify password against bcrypt hash"""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    """Verify password against bcrypt hash on the shared worker pool"""
+    return passwords.verify_password(password, password_hash)
 
+def too_many_requests(headers: Dict[str, str], retry_after: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {**headers, 'Retry-After': str(retry_after)},
+        'body': json.dumps({'error': message}),
+        'isBase64Encoded': False
+    }
+
+db.prewarm()
+
+@metrics.instrument('auth')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'POST')
     
@@ -30,8 +38,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Methods': 'POST, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -43,6 +51,45 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    # Shared across workers and checked before any database or bcrypt work
+    retry_after = ratelimit.check('auth', audit.client_ip(event))
+    if retry_after:
+        return too_many_requests(headers, retry_after, 'Too many requests')
+    
+    if method == 'DELETE':
+        # Logout: revoke the presented session token
+        token = sessions.get_token(event)
+        if not token:
+            return {
+                'statusCode': 401,
+                'headers': headers,
+                'body': json.dumps({'error': 'Authentication required'}),
+                'isBase64Encoded': False
+            }
+        try:
+            with db.connection() as conn:
+                cur = conn.cursor()
+                session = sessions.verify(token, cur)
+                sessions.revoke(cur, [token])
+                conn.commit()
+                cur.close()
+            if session:
+                audit.record(session.username, 'logout', ip_address=audit.client_ip(event),
+                             details='Logged out')
+        except Exception as e:
+            return {
+                'statusCode': 500,
+                'headers': headers,
+                'body': json.dumps({'error': str(e)}),
+                'isBase64Encoded': False
+            }
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({'message': 'Logged out'}),
+            'isBase64Encoded': False
+        }
+    
     if method != 'POST':
         return {
             'statusCode': 405,
@@ -72,18 +119,28 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
-        cur.execute(
-            'SELECT id, username, role, password_hash FROM users WHERE username = %s',
-            (username,)
-        )
-        user = cur.fetchone()
+        # Reject abusive clients before spending a DB lookup or bcrypt time
+        ip = audit.client_ip(event)
+        retry_after = max(ratelimit.check('login', username.lower()),
+                          passwords.login_by_username.retry_after(username),
+                          passwords.login_by_ip.retry_after(ip))
+        if retry_after:
+            return too_many_requests(headers, retry_after, 'Too many login attempts')
         
-        if not user or not verify_password(password, user['password_hash']):
+        with db.connection(readonly=True) as conn:
+            cur = db.dict_cursor(conn)
+            queries.execute(cur, 'users.credentials', (username,))
+            user = cur.fetchone()
             cur.close()
-            conn.close()
+        
+        try:
+            valid = bool(user) and verify_password(password, user['password_hash'])
+        except passwords.Saturated as e:
+            return too_many_requests(headers, e.retry_after, 'Server busy, try again')
+        
+        if not valid:
+            passwords.login_by_username.fail(username)
+            passwords.login_by_ip.fail(ip)
             return {
                 'statusCode': 401,
                 'headers': headers,
@@ -91,11 +148,29 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'isBase64Encoded': False
             }
         
-        # Generate auth token
-        auth_token = secrets.token_urlsafe(32)
+        passwords.login_by_username.reset(username)
+        
+        # Transparently upgrade hashes made with an older cost factor
+        new_hash = None
+        if passwords.needs_rehash(user['password_hash']):
+            try:
+                new_hash = passwords.hash_password(password)
+            except passwords.Saturated:
+                new_hash = None
         
-        cur.close()
-        conn.close()
+        # Issue a session token and clear out expired ones while we hold a connection
+        with db.connection() as conn:
+            cur = db.dict_cursor(conn)
+            if new_hash:
+                queries.execute(cur, 'users.set_password', (new_hash, user['id']))
+            auth_token, expires_at = sessions.issue(cur, user['id'], user['username'], user['role'])
+            sessions.sweep_expired(cur)
+            # Requests with the new token must find its session row even on a lagging replica
+            db.pin(conn, auth_token)
+            conn.commit()
+            cur.close()
+        audit.record(user['username'], 'login', ip_address=ip,
+                     details='Successful login')
         
         return {
             'statusCode': 200,
@@ -103,7 +178,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({
                 'token': auth_token,
                 'role': user['role'],
-                'username': user['username']
+                'username': user['username'],
+                'expires_at': expires_at.isoformat()
             }),
             'isBase64Encoded': False
         }
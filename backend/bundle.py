@@ -0,0 +1,76 @@
+'''
+Business: Package backend/shared into every cloud function before it is deployed
+Each directory of func2url.json is uploaded on its own, so the sibling backend/shared
+package never reaches the function. This copies it into <function>/shared, next to
+index.py, where the handler imports it first; in the repository (and under server.py)
+handlers fall back to the parent backend directory.
+
+Run before publishing the functions:
+    python backend/bundle.py                  # copy shared into backend/<function>/shared
+    python backend/bundle.py --out build/fn   # or write self-contained copies elsewhere
+    python backend/bundle.py --clean          # remove the in-place copies again
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from typing import List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SHARED_DIR = os.path.join(BACKEND_DIR, 'shared')
+
+_IGNORE = shutil.ignore_patterns('__pycache__', '*.pyc')
+
+
+def functions() -> List[str]:
+    """Function directories: those of func2url.json plus any other backend/<name>/index.py"""
+    with open(os.path.join(BACKEND_DIR, 'func2url.json'), encoding='utf-8') as fh:
+        names = set(json.load(fh))
+    for entry in os.listdir(BACKEND_DIR):
+        if os.path.isfile(os.path.join(BACKEND_DIR, entry, 'index.py')):
+            names.add(entry)
+    return sorted(names)
+
+
+def bundle(out: Optional[str] = None) -> List[str]:
+    """Copy shared into each function (into out/<function> when given); returns the targets"""
+    targets = []
+    for name in functions():
+        source = os.path.join(BACKEND_DIR, name)
+        target = source
+        if out:
+            target = os.path.join(out, name)
+            shutil.rmtree(target, ignore_errors=True)
+            shutil.copytree(source, target, ignore=shutil.ignore_patterns('__pycache__', '*.pyc', 'shared'))
+        shared = os.path.join(target, 'shared')
+        shutil.rmtree(shared, ignore_errors=True)
+        shutil.copytree(SHARED_DIR, shared, ignore=_IGNORE)
+        targets.append(target)
+    return targets
+
+
+def clean() -> List[str]:
+    """Remove the in-place copies made by bundle()"""
+    removed = []
+    for name in functions():
+        shared = os.path.join(BACKEND_DIR, name, 'shared')
+        if os.path.isdir(shared):
+            shutil.rmtree(shared)
+            removed.append(shared)
+    return removed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Copy backend/shared into each cloud function')
+    parser.add_argument('--out', help='write self-contained function directories here instead of in place')
+    parser.add_argument('--clean', action='store_true', help='remove the in-place copies')
+    args = parser.parse_args(argv)
+    for path in (clean() if args.clean else bundle(args.out)):
+        print(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
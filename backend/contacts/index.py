@@ -4,23 +4,128 @@ Args: event with httpMethod, body, queryStringParameters; context with request_i
 Returns: HTTP response with contacts data or status messages
 '''
 
+import base64
 import json
 import os
+import sys
 from typing import Dict, Any, List, Optional
-from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
 
-def json_serial(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
+from psycopg2 import errors as pg_errors
 
-def get_db_connection():
-    """Create database connection using simple query protocol"""
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url)
+# Deployed functions carry their own copy of shared (backend/bundle.py); in the repo it is a sibling
+if not os.path.isdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared')):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import audit, cache, db, events, images, metrics, queries, ratelimit, responses, serialization, sessions, snapshot, streaming
 
+def parse_reorder(body_data: Dict[str, Any]) -> Optional[List[tuple]]:
+    """Validate {contacts: [{id, sort_order}]} into (id, display_order) pairs"""
+    items = body_data.get('contacts')
+    if not isinstance(items, list) or not items:
+        return None
+    pairs = []
+    seen = set()
+    for item in items:
+        if not isinstance(item, dict):
+            return None
+        order = item.get('sort_order', item.get('display_order'))
+        try:
+            contact_id = int(item.get('id'))
+            order = int(order)
+        except (TypeError, ValueError):
+            return None
+        if contact_id in seen:
+            return None
+        seen.add(contact_id)
+        pairs.append((contact_id, order))
+    return pairs
+
+def split_packed_description(description: Optional[str]) -> tuple:
+    """Older clients send 'description|||avatar_url' in one field"""
+    if description and '|||' in description:
+        text, _, avatar_url = description.partition('|||')
+        return text, avatar_url or None
+    return description, None
+
+def reorder_contacts(cur, pairs: List[tuple]) -> List[int]:
+    """Apply a whole ordering in one statement, skipping rows whose position is unchanged"""
+    # Two arrays instead of a VALUES list, so the statement text (and its prepared plan) is the same for any length
+    queries.execute(cur, 'contacts.reorder', ([pair[0] for pair in pairs], [pair[1] for pair in pairs]))
+    return [row['id'] if isinstance(row, dict) else row[0] for row in cur.fetchall()]
+
+CONTACT_FIELDS = ('title', 'description', 'telegram_link', 'display_order', 'avatar_url')
+
+def contact_fields(body_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Writable fields present in a PUT/PATCH body; absent keys are left untouched"""
+    fields = {name: body_data[name] for name in CONTACT_FIELDS if name in body_data}
+    if 'description' in fields:
+        fields['description'], packed_avatar_url = split_packed_description(fields['description'])
+        if packed_avatar_url and 'avatar_url' not in fields:
+            fields['avatar_url'] = packed_avatar_url
+    if 'avatar_url' in fields:
+        fields['avatar_url'] = fields['avatar_url'] or None
+    return fields
+
+def patch_contact(cur, contact_id: Any, fields: Dict[str, Any], expected: Optional[int] = None) -> tuple:
+    """
+    Write only the given columns, and only if one of them differs, so a no-op save creates no
+    row version, WAL or cache invalidation. expected is the row_version the client last read.
+    Returns (outcome, row) with outcome 'updated', 'unchanged', 'conflict' or 'missing'.
+    """
+    assignments = ['%s = %%s' % name for name in fields]
+    differs = ['%s IS DISTINCT FROM %%s' % name for name in fields]
+    values = list(fields.values())
+    if 'avatar_url' in fields and 'avatar_variants' not in fields:
+        # Uploaded variants only stay attached while avatar_url still points at them
+        assignments.append('avatar_variants = CASE WHEN avatar_url IS NOT DISTINCT FROM %s THEN avatar_variants END')
+        values.append(fields['avatar_url'])
+    values.append(contact_id)
+    values.extend(fields.values())
+    condition = ''
+    if expected is not None:
+        condition = ' AND row_version = %s'
+        values.append(expected)
+    queries.execute(cur, 'contacts.patch', values,
+                    assignments=', '.join(assignments), differs=' OR '.join(differs), condition=condition)
+    row = cur.fetchone()
+    if row:
+        return 'updated', row
+    queries.execute(cur, 'contacts.version', (contact_id,))
+    row = cur.fetchone()
+    if not row:
+        return 'missing', None
+    if expected is not None and row['row_version'] != expected:
+        return 'conflict', row
+    return 'unchanged', row
+
+def sync_contacts(cur, since: int) -> bytes:
+    """
+    Rows written at or after since plus ids deleted since then, with the next high-water mark.
+    since=0 returns the whole table. The mark is the snapshot xmin read before the data, so
+    transactions still running now (and committing later) are picked up by the next call.
+    """
+    queries.execute(cur, 'contacts.sync_mark')
+    version = cur.fetchone()[0]
+    if since > 0:
+        queries.execute(cur, 'contacts.changed_since', (since,))
+        changed = serialization.records(cur)
+        queries.execute(cur, 'contacts.deleted_since', (since,))
+        deleted = [row[0] for row in cur.fetchall()]
+    else:
+        queries.execute(cur, 'contacts.list')
+        changed = serialization.records(cur)
+        deleted = []
+    return serialization.encode({'contacts': changed, 'deleted': deleted, 'version': version, 'full': since <= 0})
+
+def warm_cache(cur) -> None:
+    """Fill the response cache for the first GET while the module initializes"""
+    version = cache.current_version(cur, 'contacts')
+    queries.execute(cur, 'contacts.list')
+    cache.put('contacts', version, serialization.rows_json(cur))
+
+db.prewarm(warm_cache)
+
+@metrics.instrument('contacts')
+@responses.compressible
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -30,8 +135,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, PATCH, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -43,140 +148,462 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    params = event.get('queryStringParameters') or {}
+    action = params.get('action', '')
+    
+    # Per-client limit shared by all workers; answered before the cache or the database
+    retry_after = ratelimit.check('contacts', audit.client_ip(event))
+    if retry_after:
+        return ratelimit.too_many_requests(headers, retry_after)
+    
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
+        if method == 'GET' and action not in ('export', 'events') and 'since' not in params:
+            cached = cache.get('contacts')
+            if cached is not None:
+                body, version = cached
+                etag = responses.etag_for('contacts', version)
+                if responses.if_none_match(event, etag):
+                    return responses.not_modified(headers, etag)
+                return {
+                    'statusCode': 200,
+                    'headers': {**headers, **responses.cache_headers(etag), 'X-Cache': 'HIT'},
+                    'body': body.decode('utf-8'),
+                    'isBase64Encoded': False
+                }
         
-        if method == 'GET':
-            # Get all contacts
-            cur.execute('SELECT * FROM contacts ORDER BY display_order ASC')
-            contacts = cur.fetchall()
-            cur.close()
-            conn.close()
+        # Reads may go to a replica; a write pins the admin's token to the primary for a while
+        with db.connection(readonly=method == 'GET', pin_key=sessions.get_token(event)) as conn:
+            # Reads stay on tuple rows for the serializer; writes use dict rows
+            cur = conn.cursor() if method == 'GET' else db.dict_cursor(conn)
+        
+            if method == 'GET' and action == 'export':
+                # Streamed export of all contacts (auth required)
+                session = sessions.authenticate(event, cur)
+                cur.close()
             
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps([dict(row) for row in contacts], default=json_serial),
-                'isBase64Encoded': False
-            }
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
+            
+                export_format = params.get('format', 'csv')
+                if export_format not in streaming.FORMATS:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'format must be one of: ' + ', '.join(sorted(streaming.FORMATS))}),
+                        'isBase64Encoded': False
+                    }
+                if not streaming.supported(event):
+                    return {
+                        'statusCode': 501,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Export is only available through the backend server'}),
+                        'isBase64Encoded': False
+                    }
+            
+                from shared import bulk
+                compress = params.get('gzip') in ('1', 'true')
+                return streaming.response(export_format, 'contacts', bulk.export(export_format, compress),
+                                          compress, {'Access-Control-Allow-Origin': '*'})
         
-        elif method == 'POST':
-            # Add new contact (auth required)
-            body_data = json.loads(event.get('body', '{}'))
-            auth_token = event.get('headers', {}).get('X-Auth-Token')
+            elif method == 'GET' and action == 'events':
+                # Live feed of contacts and page settings changes (auth via header or ?token=, EventSource cannot set headers)
+                token = sessions.get_token(event) or params.get('token', '')
+                session = sessions.verify(token, cur) if token else None
+                cur.close()
+            
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
+                if not streaming.supported(event):
+                    return {
+                        'statusCode': 501,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Live updates are only available through the backend server'}),
+                        'isBase64Encoded': False
+                    }
+            
+                try:
+                    subscription = events.subscribe(('contacts', 'page_settings'),
+                                                    responses.get_header(event, 'Last-Event-ID'))
+                except events.TooManySubscribers as e:
+                    return {
+                        'statusCode': 503,
+                        'headers': {**headers, 'Retry-After': '30'},
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+                return events.response(subscription, {'Access-Control-Allow-Origin': '*'})
+        
+            elif method == 'GET' and 'since' in params:
+                # Delta sync: changed and deleted contacts since a high-water mark
+                try:
+                    since = max(int(params['since']), 0)
+                except ValueError:
+                    cur.close()
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'since must be an integer version'}),
+                        'isBase64Encoded': False
+                    }
+                body = sync_contacts(cur, since)
+                cur.close()
             
-            if not auth_token:
                 return {
-                    'statusCode': 401,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Authentication required'}),
+                    'statusCode': 200,
+                    'headers': {**headers, 'Cache-Control': 'no-store'},
+                    'body': body.decode('utf-8'),
+                    'isBase64Encoded': False
+                }
+        
+            elif method == 'GET':
+                # Get all contacts
+                version = cache.current_version(cur, 'contacts')
+                etag = responses.etag_for('contacts', version)
+                if responses.if_none_match(event, etag):
+                    cur.close()
+                    return responses.not_modified(headers, etag)
+                queries.execute(cur, 'contacts.list')
+                body = serialization.rows_json(cur)
+                cur.close()
+                cache.put('contacts', version, body)
+            
+                return {
+                    'statusCode': 200,
+                    'headers': {**headers, **responses.cache_headers(etag), 'X-Cache': 'MISS'},
+                    'body': body.decode('utf-8'),
                     'isBase64Encoded': False
                 }
+        
+            elif method == 'POST' and action == 'reorder-contacts':
+                # Bulk reorder (auth required)
+                session = sessions.authenticate(event, cur)
             
-            title = body_data.get('title', 'Новый контакт')
-            description = body_data.get('description', 'Описание')
-            telegram_link = body_data.get('telegram_link', 'https://t.me/username')
-            display_order = body_data.get('display_order', 999)
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
             
-            cur.execute(
-                "INSERT INTO contacts (title, description, telegram_link, display_order) VALUES (%s, %s, %s, %s) RETURNING id",
-                (title, description, telegram_link, display_order)
-            )
-            new_id = cur.fetchone()['id']
-            conn.commit()
-            cur.close()
-            conn.close()
+                pairs = parse_reorder(json.loads(event.get('body') or '{}'))
+                if pairs is None:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Expected contacts: [{id, sort_order}] with unique integer ids'}),
+                        'isBase64Encoded': False
+                    }
             
-            return {
-                'statusCode': 201,
-                'headers': headers,
-                'body': json.dumps({'id': new_id, 'message': 'Contact created'}),
-                'isBase64Encoded': False
-            }
-        
-        elif method == 'PUT':
-            # Update contact (auth required)
-            body_data = json.loads(event.get('body', '{}'))
-            auth_token = event.get('headers', {}).get('X-Auth-Token')
+                changed = reorder_contacts(cur, pairs)
+                if changed:
+                    cache.bump(cur, 'contacts')
+                conn.commit()
+                cur.close()
+                if changed:
+                    snapshot.schedule()
+                    audit.record(session.username, 'reorder_contacts', 'contact',
+                                 details=f'Reordered {len(changed)} of {len(pairs)} contacts',
+                                 ip_address=audit.client_ip(event))
             
-            if not auth_token:
                 return {
-                    'statusCode': 401,
+                    'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Authentication required'}),
+                    'body': json.dumps({'message': 'Contacts reordered', 'updated': len(changed)}),
                     'isBase64Encoded': False
                 }
+        
+            elif method == 'POST' and action == 'upload-avatar':
+                # Avatar upload: raw image body, stored as resized WebP/JPEG variants (auth required)
+                session = sessions.authenticate(event, cur)
+            
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
+            
+                contact_id = params.get('id')
+                if not contact_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Contact ID required'}),
+                        'isBase64Encoded': False
+                    }
+                if not images.enabled():
+                    return {
+                        'statusCode': 501,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Image uploads are only available through the backend server'}),
+                        'isBase64Encoded': False
+                    }
+            
+                try:
+                    variants = images.store(images.body_bytes(event), 'avatar')
+                except images.ImageError as e:
+                    return {
+                        'statusCode': e.status,
+                        'headers': headers,
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+            
+                from psycopg2.extras import Json
+                outcome, row = patch_contact(cur, contact_id,
+                                             {'avatar_url': variants['src'], 'avatar_variants': Json(variants)})
+                if outcome == 'missing':
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Contact not found'}),
+                        'isBase64Encoded': False
+                    }
+                if outcome == 'updated':
+                    cache.bump(cur, 'contacts')
+                conn.commit()
+                cur.close()
+                if outcome == 'updated':
+                    snapshot.schedule()
+                    audit.record(session.username, 'upload_avatar', 'contact', contact_id,
+                                 f"Uploaded avatar for contact: {row['title']}", audit.client_ip(event))
             
-            contact_id = body_data.get('id')
-            if not contact_id:
                 return {
-                    'statusCode': 400,
+                    'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Contact ID required'}),
+                    'body': json.dumps({'avatar_url': variants['src'], 'avatar_variants': variants,
+                                        'version': row['row_version']}),
                     'isBase64Encoded': False
                 }
+        
+            elif method == 'POST' and action == 'import':
+                # Bulk import from CSV / JSON / NDJSON (auth required)
+                session = sessions.authenticate(event, cur)
             
-            title = body_data.get('title')
-            description = body_data.get('description')
-            telegram_link = body_data.get('telegram_link')
-            display_order = body_data.get('display_order')
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
             
-            cur.execute(
-                "UPDATE contacts SET title = %s, description = %s, telegram_link = %s, display_order = %s WHERE id = %s",
-                (title, description, telegram_link, display_order, contact_id)
-            )
-            conn.commit()
-            cur.close()
-            conn.close()
+                from shared import bulk
+                try:
+                    data = event.get('body') or ''
+                    if event.get('isBase64Encoded'):
+                        data = base64.b64decode(data).decode('utf-8')
+                    rows, errors = bulk.validate(bulk.parse(data, responses.get_header(event, 'Content-Type')))
+                except ValueError as e:
+                    rows, errors = [], [str(e)]
+                if errors or not rows:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Import rejected', 'details': errors or ['No contacts to import']}),
+                        'isBase64Encoded': False
+                    }
             
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'message': 'Contact updated'}),
-                'isBase64Encoded': False
-            }
+                result = bulk.import_contacts(cur, rows, session.username, audit.client_ip(event))
+                cur.close()
+            
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({
+                        'message': 'Contacts imported',
+                        'total': result.total,
+                        'created': result.created,
+                        'updated': result.updated,
+                        'unchanged': result.unchanged
+                    }),
+                    'isBase64Encoded': False
+                }
         
-        elif method == 'DELETE':
-            # Delete contact (auth required)
-            params = event.get('queryStringParameters', {})
-            auth_token = event.get('headers', {}).get('X-Auth-Token')
+            elif method == 'POST':
+                # Add new contact (auth required)
+                body_data = json.loads(event.get('body', '{}'))
+                session = sessions.authenticate(event, cur)
+            
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
+            
+                title = body_data.get('title', 'Новый контакт')
+                description = body_data.get('description', 'Описание')
+                telegram_link = body_data.get('telegram_link', 'https://t.me/username')
+                display_order = body_data.get('display_order', 999)
+            
+                try:
+                    queries.execute(cur, 'contacts.insert', (title, description, telegram_link, display_order))
+                except pg_errors.UniqueViolation:
+                    # idx_contacts_telegram_link_unique (V0008)
+                    conn.rollback()
+                    return {
+                        'statusCode': 409,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Another contact already uses this telegram_link'}),
+                        'isBase64Encoded': False
+                    }
+                new_id = cur.fetchone()['id']
+                cache.bump(cur, 'contacts')
+                conn.commit()
+                cur.close()
+                snapshot.schedule()
+                audit.record(session.username, 'create_contact', 'contact', new_id,
+                             f'Created contact: {title}', audit.client_ip(event))
             
-            if not auth_token:
                 return {
-                    'statusCode': 401,
+                    'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Authentication required'}),
+                    'body': json.dumps({'id': new_id, 'message': 'Contact created'}),
                     'isBase64Encoded': False
                 }
+        
+            elif method in ('PUT', 'PATCH'):
+                # Partial update of the fields present in the body (auth required);
+                # If-Match: "<row_version>" (or body "version") rejects the write if someone saved in between
+                body_data = json.loads(event.get('body') or '{}')
+                session = sessions.authenticate(event, cur)
+            
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
+            
+                contact_id = body_data.get('id') or params.get('id')
+                if not contact_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Contact ID required'}),
+                        'isBase64Encoded': False
+                    }
+            
+                fields = contact_fields(body_data)
+                if not fields:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'No fields to update: ' + ', '.join(CONTACT_FIELDS)}),
+                        'isBase64Encoded': False
+                    }
+                try:
+                    expected = responses.expected_version(event, body_data)
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+            
+                try:
+                    outcome, row = patch_contact(cur, contact_id, fields, expected)
+                except pg_errors.UniqueViolation:
+                    conn.rollback()
+                    return {
+                        'statusCode': 409,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Another contact already uses this telegram_link'}),
+                        'isBase64Encoded': False
+                    }
+                if outcome == 'missing':
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Contact not found'}),
+                        'isBase64Encoded': False
+                    }
+                if outcome == 'conflict':
+                    return {
+                        'statusCode': 412,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Contact was changed by someone else',
+                                            'version': row['row_version']}),
+                        'isBase64Encoded': False
+                    }
+                if outcome == 'updated':
+                    cache.bump(cur, 'contacts')
+                conn.commit()
+                cur.close()
+                if outcome == 'updated':
+                    snapshot.schedule()
+                    audit.record(session.username, 'update_contact', 'contact', contact_id,
+                                 f"Updated contact: {row['title']}", audit.client_ip(event))
             
-            contact_id = params.get('id')
-            if not contact_id:
                 return {
-                    'statusCode': 400,
+                    'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Contact ID required'}),
+                    'body': json.dumps({
+                        'message': 'Contact updated' if outcome == 'updated' else 'Contact unchanged',
+                        'updated': outcome == 'updated',
+                        'version': row['row_version']
+                    }),
                     'isBase64Encoded': False
                 }
+        
+            elif method == 'DELETE':
+                # Delete contact (auth required)
+                session = sessions.authenticate(event, cur)
+            
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
             
-            cur.execute("DELETE FROM contacts WHERE id = %s", (contact_id,))
-            conn.commit()
-            cur.close()
-            conn.close()
+                contact_id = params.get('id')
+                if not contact_id:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Contact ID required'}),
+                        'isBase64Encoded': False
+                    }
             
+                queries.execute(cur, 'contacts.delete', (contact_id,))
+                cache.bump(cur, 'contacts')
+                conn.commit()
+                cur.close()
+                snapshot.schedule()
+                audit.record(session.username, 'delete_contact', 'contact', contact_id,
+                             f'Deleted contact #{contact_id}', audit.client_ip(event))
+            
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'message': 'Contact deleted'}),
+                    'isBase64Encoded': False
+                }
+        
             return {
-                'statusCode': 200,
+                'statusCode': 405,
                 'headers': headers,
-                'body': json.dumps({'message': 'Contact deleted'}),
+                'body': json.dumps({'error': 'Method not allowed'}),
                 'isBase64Encoded': False
             }
-        
-        return {
-            'statusCode': 405,
-            'headers': headers,
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
     
     except Exception as e:
         return {
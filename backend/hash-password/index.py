@@ -5,11 +5,18 @@ Returns: bcrypt hash
 '''
 
 import json
+import os
+import sys
 from typing import Dict, Any
-import bcrypt
 
+# Deployed functions carry their own copy of shared (backend/bundle.py); in the repo it is a sibling
+if not os.path.isdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared')):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import metrics, passwords
+
+@metrics.instrument('hash-password')
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    params = event.get('queryStringParameters', {})
+    params = event.get('queryStringParameters') or {}
     password = params.get('password', '')
     
     if not password:
@@ -20,15 +27,23 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    # Generate bcrypt hash
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=12))
+    # Generate bcrypt hash on the shared worker pool
+    try:
+        password_hash = passwords.hash_password(password)
+    except passwords.Saturated as e:
+        return {
+            'statusCode': 429,
+            'headers': {'Content-Type': 'application/json', 'Retry-After': str(e.retry_after)},
+            'body': json.dumps({'error': 'Server busy, try again'}),
+            'isBase64Encoded': False
+        }
     
     return {
         'statusCode': 200,
         'headers': {'Content-Type': 'application/json'},
         'body': json.dumps({
             'password': password,
-            'hash': password_hash.decode('utf-8')
+            'hash': password_hash
         }),
         'isBase64Encoded': False
     }
@@ -0,0 +1,333 @@
+'''
+Business: Single WSGI/ASGI application serving every backend function in one process
+Translates HTTP requests into the cloud-function event dict, routes by the first path
+segment (optionally behind /api) to that function's handler(event, context) and turns the
+returned dict back into an HTTP response. All functions share one connection pool,
+response cache and audit writer per worker. Iterable bodies are streamed; live event
+streams (shared.events) are iterated asynchronously under ASGI, so they hold no threads.
+
+/_health returns pool, replica, cache, audit, rate-limit and compression stats and the
+slowest catalog statements (shared.queries) as JSON; /_metrics returns the same plus
+per-function latency histograms (shared.metrics) in Prometheus text format. Both are per
+worker process and are not proxied publicly by nginx.
+
+    gunicorn --chdir backend --workers 2 --threads 8 server:application   (WSGI)
+    uvicorn --app-dir backend --workers 2 server:asgi_app                (ASGI)
+
+The serverless deployment (func2url.json) keeps calling each index.handler directly.
+
+Configuration (environment):
+    TRUSTED_PROXIES  - comma-separated peer addresses whose X-Real-IP is taken as the client
+                       address, i.e. the local nginx (default 127.0.0.1,::1)
+'''
+
+import asyncio
+import base64
+import importlib.util
+import json
+import os
+import sys
+import threading
+import uuid
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from shared import audit, cache, db, events, metrics, queries, ratelimit, responses
+
+FUNCTIONS = ('contacts', 'auth', 'settings', 'users', 'audit', 'hash-password')
+
+# Header names whose canonical spelling is not plain Title-Case
+HEADER_SPELLING = {'x-real-ip': 'X-Real-IP', 'x-forwarded-for': 'X-Forwarded-For', 'etag': 'ETag',
+                   'last-event-id': 'Last-Event-ID'}
+
+TEXT_TYPES = ('application/json', 'application/x-www-form-urlencoded', 'text/')
+
+_handlers: Dict[str, Callable[[Dict[str, Any], Any], Dict[str, Any]]] = {}
+_handlers_lock = threading.Lock()
+
+
+def load_handler(name: str) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    """Import backend/<name>/index.py once per process and return its handler"""
+    handler = _handlers.get(name)
+    if handler is not None:
+        return handler
+    with _handlers_lock:
+        if name not in _handlers:
+            path = os.path.join(BACKEND_DIR, name, 'index.py')
+            spec = importlib.util.spec_from_file_location('functions.%s' % name.replace('-', '_'), path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _handlers[name] = module.handler
+        return _handlers[name]
+
+
+def route(path: str) -> Tuple[Optional[str], str]:
+    """Map /contacts/..., /api/audit/logs, ... to (function name, remaining path)"""
+    parts = [part for part in path.split('/') if part]
+    if parts and parts[0] == 'api':
+        parts = parts[1:]
+    if not parts or parts[0] not in FUNCTIONS:
+        return None, path
+    return parts[0], '/' + '/'.join(parts[1:])
+
+
+def canonical_header(name: str) -> str:
+    lowered = name.lower()
+    return HEADER_SPELLING.get(lowered) or '-'.join(word.capitalize() for word in lowered.split('-'))
+
+
+def client_address(peer: str, headers: Dict[str, str]) -> str:
+    """The connecting peer, or the X-Real-IP nginx sets when the peer is a trusted proxy"""
+    trusted = {address.strip() for address in os.environ.get('TRUSTED_PROXIES', '127.0.0.1,::1').split(',')}
+    forwarded = headers.get('X-Real-IP', '').strip()
+    if forwarded and peer in trusted:
+        return forwarded
+    return peer
+
+
+def build_event(method: str, path: str, query: str, headers: Dict[str, str],
+                body: bytes, peer: str) -> Dict[str, Any]:
+    """Event dict in the shape the cloud-function gateway delivers"""
+    content_type = headers.get('Content-Type', '')
+    is_text = not body or any(content_type.startswith(kind) for kind in TEXT_TYPES)
+    if is_text:
+        try:
+            body_value = body.decode('utf-8')
+        except UnicodeDecodeError:
+            is_text = False
+    if not is_text:
+        body_value = base64.b64encode(body).decode('ascii')
+    return {
+        'httpMethod': method.upper(),
+        'path': path,
+        'headers': headers,
+        'queryStringParameters': dict(parse_qsl(query, keep_blank_values=True)),
+        'body': body_value,
+        'isBase64Encoded': not is_text,
+        'requestContext': {
+            'requestId': uuid.uuid4().hex,
+            'identity': {'sourceIp': client_address(peer, headers)},
+            # Handlers may return an iterable of bytes as body (see shared.streaming)
+            'streaming': True,
+        },
+    }
+
+
+def json_result(status: int, payload: Any) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(payload),
+        'isBase64Encoded': False
+    }
+
+
+def gauges() -> Dict[str, Dict[str, float]]:
+    """Pool, cache and audit counters of this worker as Prometheus gauges"""
+    result: Dict[str, Dict[str, float]] = {}
+    for pool, stats in db.pool_stats().items():
+        for key, value in stats.items():
+            result.setdefault('backend_db_pool_' + key, {})['pool="%s"' % pool] = value
+    cache_stats = cache.stats()
+    for key in ('hits', 'misses', 'invalidations', 'entries'):
+        result['backend_cache_' + key] = {'worker="%d"' % os.getpid(): cache_stats.get(key, 0)}
+    for key, value in audit.stats().items():
+        result['backend_audit_' + key] = {'worker="%d"' % os.getpid(): value}
+    for key, value in events.stats().items():
+        result['backend_events_' + key] = {'worker="%d"' % os.getpid(): value}
+    for key, value in responses.compression_stats().items():
+        result['backend_compression_' + key] = {'worker="%d"' % os.getpid(): value}
+    for route, counters in ratelimit.stats()['routes'].items():
+        for key, value in counters.items():
+            result.setdefault('backend_ratelimit_' + key, {})['worker="%d",route="%s"' % (os.getpid(), route)] = value
+    replica_stats = db.replica_stats()
+    for key in ('replica_reads', 'primary_reads', 'pinned_reads', 'replica_failovers'):
+        result['backend_db_' + key] = {'worker="%d"' % os.getpid(): replica_stats[key]}
+    for replica in replica_stats['replicas']:
+        label = 'replica="%s"' % replica['replica']
+        result.setdefault('backend_db_replica_healthy', {})[label] = 1 if replica['healthy'] else 0
+        if replica['lag_s'] is not None:
+            result.setdefault('backend_db_replica_lag_seconds', {})[label] = replica['lag_s']
+    for row in queries.report():
+        label = 'worker="%d",statement="%s"' % (os.getpid(), row['statement'])
+        result.setdefault('backend_query_calls', {})[label] = row['calls']
+        result.setdefault('backend_query_seconds', {})[label] = row['total_ms'] / 1000
+        result.setdefault('backend_query_max_seconds', {})[label] = row['max_ms'] / 1000
+    return result
+
+
+def dispatch(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the handler the event's path routes to"""
+    path = event.get('path', '/')
+    if path.rstrip('/') in ('/_health', '/api/_health'):
+        return json_result(200, {'pools': db.pool_stats(), 'replicas': db.replica_stats(), 'cache': cache.stats(),
+                                 'audit': audit.stats(), 'events': events.stats(), 'ratelimit': ratelimit.stats(),
+                                 'compression': responses.compression_stats(), 'queries': queries.report(20)})
+    if path.rstrip('/') in ('/_metrics', '/api/_metrics'):
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+            'body': metrics.render(gauges()),
+            'isBase64Encoded': False
+        }
+    name, rest = route(path)
+    if name is None:
+        return json_result(404, {'error': 'Not found'})
+    event['path'] = rest
+    context = SimpleNamespace(request_id=event['requestContext']['requestId'], function_name=name)
+    try:
+        return load_handler(name)(event, context)
+    except Exception as e:
+        return json_result(500, {'error': str(e)})
+
+
+def encode_result(result: Dict[str, Any]) -> Tuple[int, List[Tuple[str, str]], Any]:
+    """(status, headers, payload); payload is bytes or, for streamed bodies, an iterator of bytes"""
+    status = int(result.get('statusCode', 200))
+    headers = [(str(key), str(value)) for key, value in (result.get('headers') or {}).items()]
+    body = result.get('body') or ''
+    if hasattr(body, '__aiter__'):
+        # Async-capable bodies (shared.events) are iterated natively by asgi_app
+        return status, headers, body
+    if not isinstance(body, (str, bytes, dict, list)):
+        return status, headers, iter(body)
+    if isinstance(body, (dict, list)):
+        body = json.dumps(body)
+    if result.get('isBase64Encoded'):
+        payload = base64.b64decode(body)
+    elif isinstance(body, bytes):
+        payload = body
+    else:
+        payload = body.encode('utf-8')
+    return status, headers, payload
+
+
+STATUS_TEXT = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 304: 'Not Modified', 400: 'Bad Request',
+    401: 'Unauthorized', 403: 'Forbidden', 404: 'Not Found', 405: 'Method Not Allowed',
+    409: 'Conflict', 412: 'Precondition Failed', 413: 'Payload Too Large', 429: 'Too Many Requests',
+    500: 'Internal Server Error', 503: 'Service Unavailable',
+}
+
+
+def application(environ: Dict[str, Any], start_response: Callable) -> Iterable[bytes]:
+    """WSGI entry point"""
+    headers = {}
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            headers[canonical_header(key[5:].replace('_', '-'))] = value
+    if environ.get('CONTENT_TYPE'):
+        headers['Content-Type'] = environ['CONTENT_TYPE']
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        length = 0
+    body = environ['wsgi.input'].read(length) if length > 0 else b''
+    event = build_event(
+        environ.get('REQUEST_METHOD', 'GET'),
+        environ.get('PATH_INFO', '/'),
+        environ.get('QUERY_STRING', ''),
+        headers,
+        body,
+        environ.get('REMOTE_ADDR', ''),
+    )
+    status, response_headers, payload = encode_result(dispatch(event))
+    streamed = not isinstance(payload, bytes)
+    if event['httpMethod'] == 'HEAD':
+        if streamed and hasattr(payload, 'close'):
+            payload.close()
+        payload, streamed = b'', False
+    start_response('%d %s' % (status, STATUS_TEXT.get(status, 'Unknown')), response_headers)
+    # The server calls close() on a streamed iterator, which releases its connection
+    return payload if streamed else [payload]
+
+
+async def stream_async(payload: Any, receive: Callable, send: Callable) -> None:
+    """Send an async-iterable body (long-lived event streams) until it ends or the client goes away"""
+    disconnected = asyncio.ensure_future(receive())
+    try:
+        async for chunk in payload:
+            if disconnected.done():
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        else:
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        payload.close()
+
+
+async def asgi_app(scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+    """ASGI entry point; blocking handlers run in the default thread pool"""
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                audit.flush()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+    chunks = []
+    more = True
+    while more:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        more = message.get('more_body', False)
+    headers = {}
+    for raw_name, raw_value in scope.get('headers', []):
+        headers[canonical_header(raw_name.decode('latin-1'))] = raw_value.decode('latin-1')
+    client = scope.get('client') or ('', 0)
+    event = build_event(
+        scope['method'],
+        scope.get('path', '/'),
+        scope.get('query_string', b'').decode('latin-1'),
+        headers,
+        b''.join(chunks),
+        client[0] or '',
+    )
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, dispatch, event)
+    status, response_headers, payload = encode_result(result)
+    streamed = not isinstance(payload, bytes)
+    if event['httpMethod'] == 'HEAD':
+        if streamed and hasattr(payload, 'close'):
+            payload.close()
+        payload, streamed = b'', False
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in response_headers],
+    })
+    if not streamed:
+        await send({'type': 'http.response.body', 'body': payload})
+        return
+    if hasattr(payload, '__aiter__'):
+        await stream_async(payload, receive, send)
+        return
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, next, payload, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(payload, 'close'):
+            await loop.run_in_executor(None, payload.close)
+
+
+if __name__ == '__main__':
+    from wsgiref.simple_server import make_server
+
+    port = int(os.environ.get('PORT', 8000))
+    print('Serving backend functions on http://127.0.0.1:%d' % port)
+    make_server('127.0.0.1', port, application).serve_forever()
@@ -6,21 +6,66 @@ Returns: HTTP response with page settings data
 
 import json
 import os
-from typing import Dict, Any
-from datetime import datetime
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import sys
+from typing import Dict, Any, Optional
 
-def json_serial(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
+# Deployed functions carry their own copy of shared (backend/bundle.py); in the repo it is a sibling
+if not os.path.isdir(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared')):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared import audit, cache, db, images, metrics, queries, ratelimit, responses, serialization, sessions, snapshot
 
-def get_db_connection():
-    """Create database connection using simple query protocol"""
-    database_url = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(database_url)
+SETTINGS_FIELDS = ('main_title', 'main_description', 'background_image_url')
 
+def upsert_settings(cur, fields: Dict[str, Any], expected: Optional[int] = None) -> tuple:
+    """
+    Write the given columns of the single settings row in one statement: inserted if the table
+    is empty, otherwise updated only when a value differs. expected is the row_version the
+    client last read. The row is read first: even an ON CONFLICT that updates nothing locks the
+    row and assigns a transaction id, so a no-op or stale save must not reach the upsert.
+    Returns (outcome, row) with outcome 'updated', 'unchanged' or 'conflict'.
+    """
+    queries.execute(cur, 'settings.get')
+    current = cur.fetchone()
+    if current is not None:
+        if expected is not None and current['row_version'] != expected:
+            return 'conflict', current
+        if all(current[name] == value for name, value in fields.items()):
+            return 'unchanged', current
+    names = list(fields)
+    assignments = ['%s = EXCLUDED.%s' % (name, name) for name in names]
+    differs = ['p.%s IS DISTINCT FROM EXCLUDED.%s' % (name, name) for name in names]
+    if 'background_image_url' in fields and 'background_variants' not in fields:
+        # Uploaded variants only stay attached while background_image_url still points at them
+        assignments.append('background_variants = CASE WHEN p.background_image_url IS NOT DISTINCT FROM '
+                           'EXCLUDED.background_image_url THEN p.background_variants END')
+    values = list(fields.values())
+    condition = ''
+    if expected is not None:
+        condition = ' AND p.row_version = %s'
+        values.append(expected)
+    queries.execute(cur, 'settings.upsert', values,
+                    names=', '.join(names), values=', '.join(['%s'] * len(names)),
+                    assignments=', '.join(assignments), differs=' OR '.join(differs), condition=condition)
+    row = cur.fetchone()
+    if row:
+        return 'updated', row
+    queries.execute(cur, 'settings.version')
+    row = cur.fetchone()
+    if expected is not None and row['row_version'] != expected:
+        return 'conflict', row
+    return 'unchanged', row
+
+def warm_cache(cur) -> None:
+    """Fill the response cache for the first GET while the module initializes"""
+    version = cache.current_version(cur, 'settings')
+    queries.execute(cur, 'settings.get')
+    settings = serialization.record(cur, cur.fetchone())
+    cache.put('settings', version, serialization.encode(settings or snapshot.DEFAULT_SETTINGS))
+
+db.prewarm(warm_cache)
+
+@metrics.instrument('settings')
+@responses.compressible
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -30,8 +75,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, PATCH, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, If-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -43,85 +88,169 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    # Per-client limit shared by all workers; answered before the cache or the database
+    retry_after = ratelimit.check('settings', audit.client_ip(event))
+    if retry_after:
+        return ratelimit.too_many_requests(headers, retry_after)
+    
     try:
-        conn = get_db_connection()
-        cur = conn.cursor(cursor_factory=RealDictCursor)
-        
         if method == 'GET':
-            # Get page settings
-            cur.execute('SELECT * FROM page_settings LIMIT 1')
-            settings = cur.fetchone()
-            cur.close()
-            conn.close()
-            
-            if not settings:
+            cached = cache.get('settings')
+            if cached is not None:
+                body, version = cached
+                etag = responses.etag_for('settings', version)
+                if responses.if_none_match(event, etag):
+                    return responses.not_modified(headers, etag)
                 return {
                     'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps({
-                        'id': 1,
-                        'main_title': 'Мои контакты',
-                        'main_description': 'Свяжитесь со мной в Telegram',
-                        'background_image_url': None
-                    }),
+                    'headers': {**headers, **responses.cache_headers(etag), 'X-Cache': 'HIT'},
+                    'body': body.decode('utf-8'),
                     'isBase64Encoded': False
                 }
+        
+        # Reads may go to a replica; a write pins the admin's token to the primary for a while
+        with db.connection(readonly=method == 'GET', pin_key=sessions.get_token(event)) as conn:
+            # Reads stay on tuple rows for the serializer; writes use dict rows
+            cur = conn.cursor() if method == 'GET' else db.dict_cursor(conn)
+        
+            if method == 'GET':
+                # Get page settings
+                version = cache.current_version(cur, 'settings')
+                etag = responses.etag_for('settings', version)
+                if responses.if_none_match(event, etag):
+                    cur.close()
+                    return responses.not_modified(headers, etag)
+                queries.execute(cur, 'settings.get')
+                settings = serialization.record(cur, cur.fetchone())
+                cur.close()
             
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps(dict(settings), default=json_serial),
-                'isBase64Encoded': False
-            }
+                body = serialization.encode(settings or snapshot.DEFAULT_SETTINGS)
+                cache.put('settings', version, body)
+            
+                return {
+                    'statusCode': 200,
+                    'headers': {**headers, **responses.cache_headers(etag), 'X-Cache': 'MISS'},
+                    'body': body.decode('utf-8'),
+                    'isBase64Encoded': False
+                }
         
-        elif method == 'PUT':
-            # Update page settings (auth required)
-            body_data = json.loads(event.get('body', '{}'))
-            auth_token = event.get('headers', {}).get('X-Auth-Token')
+            elif method == 'POST' and (event.get('queryStringParameters') or {}).get('action') == 'upload-background':
+                # Background upload: raw image body, stored as responsive WebP/JPEG widths (auth required)
+                session = sessions.authenticate(event, cur)
+            
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
+                if not images.enabled():
+                    return {
+                        'statusCode': 501,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Image uploads are only available through the backend server'}),
+                        'isBase64Encoded': False
+                    }
+            
+                try:
+                    variants = images.store(images.body_bytes(event), 'background')
+                except images.ImageError as e:
+                    return {
+                        'statusCode': e.status,
+                        'headers': headers,
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+            
+                from psycopg2.extras import Json
+                outcome, row = upsert_settings(cur, {'background_image_url': variants['src'],
+                                                     'background_variants': Json(variants)})
+                if outcome == 'updated':
+                    cache.bump(cur, 'settings')
+                conn.commit()
+                cur.close()
+                if outcome == 'updated':
+                    snapshot.schedule()
+                    audit.record(session.username, 'upload_background', 'settings',
+                                 details='Uploaded page background', ip_address=audit.client_ip(event))
             
-            if not auth_token:
                 return {
-                    'statusCode': 401,
+                    'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Authentication required'}),
+                    'body': json.dumps({'background_image_url': variants['src'], 'background_variants': variants,
+                                        'version': row['row_version']}),
                     'isBase64Encoded': False
                 }
+        
+            elif method in ('PUT', 'PATCH'):
+                # Partial update of the fields present in the body (auth required);
+                # If-Match: "<row_version>" (or body "version") rejects the write if someone saved in between
+                body_data = json.loads(event.get('body') or '{}')
+                session = sessions.authenticate(event, cur)
             
-            main_title = body_data.get('main_title', 'Мои контакты')
-            main_description = body_data.get('main_description', 'Свяжитесь со мной в Telegram')
-            background_image_url = body_data.get('background_image_url')
-            
-            cur.execute('SELECT id FROM page_settings LIMIT 1')
-            existing = cur.fetchone()
+                if not session:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Authentication required'}),
+                        'isBase64Encoded': False
+                    }
             
-            if existing:
-                cur.execute(
-                    'UPDATE page_settings SET main_title = %s, main_description = %s, background_image_url = %s WHERE id = %s',
-                    (main_title, main_description, background_image_url, existing['id'])
-                )
-            else:
-                cur.execute(
-                    'INSERT INTO page_settings (main_title, main_description, background_image_url) VALUES (%s, %s, %s)',
-                    (main_title, main_description, background_image_url)
-                )
+                fields = {name: body_data[name] for name in SETTINGS_FIELDS if name in body_data}
+                if not fields:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'No fields to update: ' + ', '.join(SETTINGS_FIELDS)}),
+                        'isBase64Encoded': False
+                    }
+                try:
+                    expected = responses.expected_version(event, body_data)
+                except ValueError as e:
+                    return {
+                        'statusCode': 400,
+                        'headers': headers,
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
             
-            conn.commit()
-            cur.close()
-            conn.close()
+                outcome, row = upsert_settings(cur, fields, expected)
+                if outcome == 'conflict':
+                    return {
+                        'statusCode': 412,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Settings were changed by someone else',
+                                            'version': row['row_version']}),
+                        'isBase64Encoded': False
+                    }
+                if outcome == 'updated':
+                    cache.bump(cur, 'settings')
+                conn.commit()
+                cur.close()
+                if outcome == 'updated':
+                    snapshot.schedule()
+                    audit.record(session.username, 'update_settings', 'settings',
+                                 details=f"Updated page settings: {row['main_title']}",
+                                 ip_address=audit.client_ip(event))
             
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({
+                        'message': 'Settings updated' if outcome == 'updated' else 'Settings unchanged',
+                        'updated': outcome == 'updated',
+                        'version': row['row_version']
+                    }),
+                    'isBase64Encoded': False
+                }
+        
             return {
-                'statusCode': 200,
+                'statusCode': 405,
                 'headers': headers,
-                'body': json.dumps({'message': 'Settings updated'}),
+                'body': json.dumps({'error': 'Method not allowed'}),
                 'isBase64Encoded': False
             }
-        
-        return {
-            'statusCode': 405,
-            'headers': headers,
-            'body': json.dumps({'error': 'Method not allowed'}),
-            'isBase64Encoded': False
-        }
     
     except Exception as e:
         return {
@@ -0,0 +1,5 @@
+'''
+Shared helpers imported by every backend function (database pool, caching, responses).
+Handlers import ``shared.<module>``: from a copy inside the function directory when deployed
+(``backend/bundle.py``), otherwise from the parent ``backend`` directory added to ``sys.path``.
+'''
@@ -0,0 +1,283 @@
+'''
+Business: Asynchronous batched writer for the admin_actions audit log
+record() only appends to an in-memory queue; a background thread flushes batches
+with one multi-row INSERT when AUDIT_BATCH_SIZE events are queued or every
+AUDIT_FLUSH_INTERVAL seconds. If Postgres is unavailable the batch goes to an
+append-only NDJSON spool file, which is replayed after the next successful flush.
+The spool is shared by all workers: appends hold an fcntl lock and a replaying worker
+first renames the file to a name of its own. Spooled records Postgres still rejects
+(as opposed to connection failures) are moved to <spool>.quarantine instead of
+blocking the replay. The queue is drained at interpreter shutdown.
+
+Configuration (environment):
+    AUDIT_BATCH_SIZE      - events per INSERT / flush trigger (default 100)
+    AUDIT_FLUSH_INTERVAL  - max seconds an event waits in memory (default 1.0)
+    AUDIT_MAX_QUEUE       - events kept in memory before spilling to the spool (default 10000)
+    AUDIT_SPOOL_PATH      - spool file (default /tmp/contacts-audit-spool.ndjson)
+'''
+
+import atexit
+import fcntl
+import glob
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from shared import db, responses
+
+COLUMNS = ('admin_username', 'action_type', 'target_type', 'target_id', 'details', 'ip_address', 'created_at')
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _spool_path() -> str:
+    return os.environ.get('AUDIT_SPOOL_PATH', '/tmp/contacts-audit-spool.ndjson')
+
+
+_cond = threading.Condition()
+_queue: List[tuple] = []
+_flush_lock = threading.Lock()
+_worker: Optional[threading.Thread] = None
+_worker_pid: Optional[int] = None
+_stats = {'recorded': 0, 'flushed': 0, 'batches': 0, 'spooled': 0, 'replayed': 0, 'quarantined': 0,
+          'errors': 0}
+
+
+def client_ip(event: Dict[str, Any]) -> str:
+    """
+    Client address as seen by the function gateway (server.py puts the X-Real-IP of a
+    trusted nginx there). Request headers are client-controlled, so without a gateway
+    address only the last X-Forwarded-For hop, appended by the nearest proxy, is used.
+    """
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    ip = identity.get('sourceIp') or ''
+    if not ip:
+        hops = [hop.strip() for hop in responses.get_header(event, 'X-Forwarded-For').split(',') if hop.strip()]
+        ip = hops[-1] if hops else ''
+    return ip[:45]
+
+
+def record(admin_username: str, action_type: str, target_type: Optional[str] = None,
+           target_id: Any = None, details: Optional[str] = None, ip_address: str = '') -> None:
+    """Queue one admin action; never blocks on the database"""
+    row = (
+        admin_username,
+        action_type,
+        target_type,
+        None if target_id is None else str(target_id),
+        details,
+        ip_address,
+        datetime.now(),
+    )
+    with _cond:
+        _queue.append(row)
+        _stats['recorded'] += 1
+        overflow = len(_queue) > _env_int('AUDIT_MAX_QUEUE', 10000)
+        if len(_queue) >= _env_int('AUDIT_BATCH_SIZE', 100):
+            _cond.notify()
+    if overflow:
+        flush()
+    _ensure_worker()
+
+
+def _take_batch() -> List[tuple]:
+    with _cond:
+        batch = _queue[:]
+        del _queue[:]
+        return batch
+
+
+def _insert(rows: List[tuple]) -> None:
+    from psycopg2.extras import execute_values
+    with db.connection() as conn:
+        cur = conn.cursor()
+        batch_size = _env_int('AUDIT_BATCH_SIZE', 100)
+        execute_values(
+            cur,
+            'INSERT INTO admin_actions (%s) VALUES %%s' % ', '.join(COLUMNS),
+            rows,
+            page_size=max(batch_size, 1)
+        )
+        conn.commit()
+        cur.close()
+
+
+def _spool_lines(path: str, lines: List[str]) -> None:
+    while True:
+        with open(path, 'a', encoding='utf-8') as spool:
+            fcntl.lockf(spool.fileno(), fcntl.LOCK_EX)
+            try:
+                # A replaying worker may have renamed the file while we waited for the lock
+                if os.fstat(spool.fileno()).st_ino != os.stat(path).st_ino:
+                    continue
+            except FileNotFoundError:
+                continue
+            spool.write(''.join(lines))
+            spool.flush()
+            os.fsync(spool.fileno())
+            return
+
+
+def _spool(rows: List[tuple]) -> None:
+    lines = []
+    for row in rows:
+        item = dict(zip(COLUMNS, row))
+        item['created_at'] = item['created_at'].isoformat()
+        lines.append(json.dumps(item, ensure_ascii=False) + '\n')
+    _spool_lines(_spool_path(), lines)
+    _stats['spooled'] += len(rows)
+
+
+def _quarantine(lines: List[str]) -> None:
+    _spool_lines(_spool_path() + '.quarantine', lines)
+    _stats['quarantined'] += len(lines)
+
+
+def _rejected(exc: Exception) -> bool:
+    """True when Postgres refused the data itself; connection problems are worth retrying"""
+    import psycopg2
+    return isinstance(exc, psycopg2.DatabaseError) and not isinstance(exc, psycopg2.OperationalError)
+
+
+def _claim_spool() -> List[str]:
+    """Rename the spool, and files left by replaying workers that died, to names owned by this process"""
+    path = _spool_path()
+    claimed = []
+    candidates = [path] if os.path.exists(path) else []
+    for leftover in glob.glob(glob.escape(path) + '.replaying*'):
+        owner = leftover[len(path) + len('.replaying.'):].split('.')[0]
+        if owner.isdigit() and int(owner) != os.getpid():
+            try:
+                os.kill(int(owner), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+        candidates.append(leftover)
+    for candidate in candidates:
+        target = '%s.replaying.%d.%d' % (path, os.getpid(), time.monotonic_ns())
+        try:
+            if candidate == path:
+                with open(path, 'a', encoding='utf-8') as spool:
+                    # Waits for appends in progress; later ones reopen the new path
+                    fcntl.lockf(spool.fileno(), fcntl.LOCK_EX)
+                    os.replace(path, target)
+            else:
+                os.replace(candidate, target)
+        except FileNotFoundError:
+            continue
+        claimed.append(target)
+    return claimed
+
+
+def _replay_file(claimed: str) -> None:
+    rows, lines, bad = [], [], []
+    with open(claimed, encoding='utf-8') as spool:
+        for line in spool:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                item['created_at'] = datetime.fromisoformat(item['created_at'])
+            except (ValueError, TypeError, KeyError):
+                bad.append(line if line.endswith('\n') else line + '\n')
+                continue
+            rows.append(tuple(item.get(column) for column in COLUMNS))
+            lines.append(line if line.endswith('\n') else line + '\n')
+    if bad:
+        _quarantine(bad)
+    try:
+        if rows:
+            _insert(rows)
+            _stats['replayed'] += len(rows)
+    except Exception as exc:
+        if not _rejected(exc):
+            # Left for the next replay; nothing of it was committed
+            raise
+        # Find the offending records one by one
+        for index, row in enumerate(rows):
+            try:
+                _insert([row])
+                _stats['replayed'] += 1
+            except Exception as row_exc:
+                if not _rejected(row_exc):
+                    _spool(rows[index:])
+                    os.remove(claimed)
+                    raise
+                _quarantine([lines[index]])
+    os.remove(claimed)
+
+
+def _replay_spool() -> None:
+    for claimed in _claim_spool():
+        _replay_file(claimed)
+
+
+def flush() -> int:
+    """Write everything queued so far; returns the number of events handled"""
+    with _flush_lock:
+        batch = _take_batch()
+        try:
+            if batch:
+                _insert(batch)
+                _stats['flushed'] += len(batch)
+                _stats['batches'] += 1
+        except Exception:
+            _stats['errors'] += 1
+            _spool(batch)
+            return len(batch)
+        try:
+            _replay_spool()
+        except Exception:
+            _stats['errors'] += 1
+        return len(batch)
+
+
+def _run() -> None:
+    while True:
+        with _cond:
+            _cond.wait_for(
+                lambda: len(_queue) >= _env_int('AUDIT_BATCH_SIZE', 100),
+                timeout=_env_float('AUDIT_FLUSH_INTERVAL', 1.0)
+            )
+            pending = bool(_queue)
+        if pending:
+            flush()
+
+
+def _ensure_worker() -> None:
+    global _worker, _worker_pid
+    if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+        return
+    with _cond:
+        if _worker is not None and _worker_pid == os.getpid() and _worker.is_alive():
+            return
+        _worker_pid = os.getpid()
+        _worker = threading.Thread(target=_run, name='audit-writer', daemon=True)
+        _worker.start()
+
+
+def stats() -> Dict[str, Any]:
+    with _cond:
+        data = dict(_stats)
+        data['queued'] = len(_queue)
+        return data
+
+
+atexit.register(flush)
@@ -0,0 +1,225 @@
+'''
+Business: Bulk import and streaming export of contacts
+Import validates every row in one pass, COPYs the batch into a temporary staging table
+and merges it with a single INSERT ... ON CONFLICT (telegram_link): new links are
+appended, known links are updated in place, identical rows are left untouched. One
+summarized admin_actions entry is written per batch.
+
+Accepted input: a JSON array, {"contacts": [...]}, NDJSON, or CSV with a header row
+(title, description, telegram_link, display_order).
+
+    cd backend
+    python -m shared.bulk import contacts.csv --admin alice
+    python -m shared.bulk export --format csv > contacts.csv
+'''
+
+import csv
+import io
+import json
+import re
+import sys
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from shared import audit, cache, db, snapshot, streaming
+
+# Placeholder link given to contacts created from the admin page; excluded from the natural key
+PLACEHOLDER_LINK = 'https://t.me/username'
+
+# Whole link at most 500 characters: contacts.telegram_link is VARCHAR(500)
+TELEGRAM_LINK = re.compile(r'^(?=.{1,500}$)https://(t\.me|telegram\.me)/[A-Za-z0-9_+][A-Za-z0-9_/+-]*$')
+
+MAX_ROWS = 50000
+MAX_ERRORS = 100
+
+EXPORT_SQL = 'SELECT id, title, description, telegram_link, display_order, created_at FROM contacts ORDER BY display_order ASC, id ASC'
+
+
+class ImportResult(NamedTuple):
+    total: int
+    created: int
+    updated: int
+
+    @property
+    def unchanged(self) -> int:
+        return self.total - self.created - self.updated
+
+    def summary(self) -> str:
+        return (f'Imported {self.total} contacts: {self.created} created, '
+                f'{self.updated} updated, {self.unchanged} unchanged')
+
+
+def parse(data: str, content_type: str = '') -> List[Dict[str, Any]]:
+    """Raw records from CSV, NDJSON or JSON text; raises ValueError on malformed input"""
+    text = data.lstrip('\ufeff').strip()
+    if not text:
+        return []
+    if 'csv' in content_type or text[0] not in '[{':
+        return [dict(row) for row in csv.DictReader(io.StringIO(text))]
+    try:
+        document = json.loads(text)
+    except ValueError:
+        document = [json.loads(line) for line in text.splitlines() if line.strip()]
+    records = document.get('contacts') if isinstance(document, dict) else document
+    if not isinstance(records, list):
+        raise ValueError('Expected a list of contacts')
+    return records
+
+
+def validate(records: List[Any]) -> Tuple[List[Tuple[str, Optional[str], str, Optional[int]]], List[str]]:
+    """Single pass over records: (rows ready for COPY, error messages with 1-based row numbers)"""
+    rows = []
+    errors: List[str] = []
+    seen: Dict[str, int] = {}
+    if len(records) > MAX_ROWS:
+        return [], [f'Too many rows: {len(records)} (max {MAX_ROWS})']
+    for number, record in enumerate(records, start=1):
+        if len(errors) >= MAX_ERRORS:
+            break
+        if not isinstance(record, dict):
+            errors.append(f'Row {number}: expected an object')
+            continue
+        title = str(record.get('title') or '').strip()
+        description = record.get('description')
+        description = None if description in (None, '') else str(description)
+        link = str(record.get('telegram_link') or '').strip()
+        order = record.get('display_order')
+        if not title:
+            errors.append(f'Row {number}: title is required')
+        elif len(title) > 255:
+            errors.append(f'Row {number}: title is longer than 255 characters')
+        if not TELEGRAM_LINK.match(link) or link == PLACEHOLDER_LINK:
+            errors.append(f'Row {number}: telegram_link must be a https://t.me/... link')
+        elif link in seen:
+            errors.append(f'Row {number}: duplicate telegram_link (also row {seen[link]})')
+        else:
+            seen[link] = number
+        if order in (None, ''):
+            order = None
+        else:
+            try:
+                order = int(order)
+            except (TypeError, ValueError):
+                errors.append(f'Row {number}: display_order must be an integer')
+        rows.append((title, description, link, order))
+    return ([] if errors else rows), errors
+
+
+def _copy_payload(rows: List[Tuple[str, Optional[str], str, Optional[int]]]) -> io.StringIO:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for position, (title, description, link, order) in enumerate(rows, start=1):
+        # None is written as an unquoted empty field, which COPY reads as NULL
+        writer.writerow((position, title, description, link, order))
+    buffer.seek(0)
+    return buffer
+
+
+def load(cur: Any, rows: List[Tuple[str, Optional[str], str, Optional[int]]]) -> ImportResult:
+    """COPY rows into staging and merge them into contacts; the caller commits"""
+    cur.execute("""
+        CREATE TEMP TABLE contacts_staging (
+            position integer NOT NULL,
+            title varchar(255) NOT NULL,
+            description text,
+            telegram_link varchar(500) PRIMARY KEY,
+            display_order integer
+        ) ON COMMIT DROP
+    """)
+    cur.copy_expert(
+        "COPY contacts_staging (position, title, description, telegram_link, display_order) "
+        "FROM STDIN WITH (FORMAT csv)",
+        _copy_payload(rows)
+    )
+    cur.execute("""
+        INSERT INTO contacts AS c (title, description, telegram_link, display_order)
+        SELECT s.title, s.description, s.telegram_link,
+               COALESCE(s.display_order, base.max_order + s.position)
+        FROM contacts_staging s
+        CROSS JOIN (SELECT COALESCE(MAX(display_order), 0) AS max_order FROM contacts) base
+        ORDER BY s.position
+        ON CONFLICT (telegram_link) WHERE telegram_link <> 'https://t.me/username'
+        DO UPDATE SET
+            title = EXCLUDED.title,
+            description = EXCLUDED.description,
+            display_order = COALESCE(
+                (SELECT s.display_order FROM contacts_staging s WHERE s.telegram_link = EXCLUDED.telegram_link),
+                c.display_order
+            )
+        WHERE (c.title, c.description) IS DISTINCT FROM (EXCLUDED.title, EXCLUDED.description)
+           OR c.display_order IS DISTINCT FROM COALESCE(
+                (SELECT s.display_order FROM contacts_staging s WHERE s.telegram_link = EXCLUDED.telegram_link),
+                c.display_order
+            )
+        RETURNING (xmax = 0) AS created
+    """)
+    flags = [row[0] if not isinstance(row, dict) else row['created'] for row in cur.fetchall()]
+    created = sum(1 for flag in flags if flag)
+    return ImportResult(len(rows), created, len(flags) - created)
+
+
+def import_contacts(cur: Any, rows: List[Tuple[str, Optional[str], str, Optional[int]]],
+                    admin_username: str, ip_address: str = '') -> ImportResult:
+    """Merge validated rows, commit, and publish the change (cache, snapshot, audit)"""
+    result = load(cur, rows)
+    if result.created or result.updated:
+        cache.bump(cur, 'contacts')
+    cur.connection.commit()
+    if result.created or result.updated:
+        snapshot.schedule()
+    audit.record(admin_username, 'import_contacts', 'contact', details=result.summary(), ip_address=ip_address)
+    return result
+
+
+def export(export_format: str, compress: bool = False) -> Iterator[bytes]:
+    """All contacts in display order as streamed NDJSON or CSV"""
+    return streaming.encode(export_format, streaming.query_chunks(EXPORT_SQL, (), name='contacts_export'), compress)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description='Bulk import/export of contacts')
+    sub = parser.add_subparsers(dest='command', required=True)
+    import_parser = sub.add_parser('import', help='validate and upsert contacts from a CSV/JSON/NDJSON file')
+    import_parser.add_argument('path', help="input file, '-' for stdin")
+    import_parser.add_argument('--admin', default='cli', help='username recorded in the audit log')
+    import_parser.add_argument('--format', choices=('csv', 'json'), help='input format (default: detect)')
+    import_parser.add_argument('--dry-run', action='store_true', help='validate only')
+    export_parser = sub.add_parser('export', help='write all contacts to stdout')
+    export_parser.add_argument('--format', choices=sorted(streaming.FORMATS), default='csv')
+    export_parser.add_argument('--gzip', action='store_true')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        for chunk in export(args.format, args.gzip):
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return 0
+
+    if args.path == '-':
+        data = sys.stdin.read()
+    else:
+        with open(args.path, encoding='utf-8') as handle:
+            data = handle.read()
+    content_type = {'csv': 'text/csv', 'json': 'application/json'}.get(args.format or '', '')
+    try:
+        rows, errors = validate(parse(data, content_type))
+    except ValueError as e:
+        errors = [str(e)]
+    if errors:
+        print('\n'.join(errors), file=sys.stderr)
+        return 1
+    if args.dry_run:
+        print(f'{len(rows)} contacts are valid')
+        return 0
+    with db.connection() as conn:
+        cur = conn.cursor()
+        result = import_contacts(cur, rows, args.admin)
+        cur.close()
+    audit.flush()
+    snapshot.rebuild()
+    print(result.summary())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
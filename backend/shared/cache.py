@@ -0,0 +1,121 @@
+'''
+Business: In-process read-through cache for public GET responses
+Holds serialized response bodies per namespace ('contacts', 'settings') tagged with
+the namespace version from the cache_versions table. Writers bump the version in the
+same transaction and NOTIFY cache_invalidate, so every worker drops stale entries
+(received on the process-wide shared.notify connection).
+A hit only compares in-memory versions and never touches the database; the TTL bounds
+staleness if the listener connection is down.
+
+Configuration (environment):
+    CACHE_TTL     - seconds an entry may be served (default 60, 0 disables caching)
+    CACHE_LISTEN  - '0' disables the LISTEN/NOTIFY thread (default enabled)
+'''
+
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from shared import notify, queries
+
+CHANNEL = 'cache_invalidate'
+
+_lock = threading.Lock()
+# namespace -> (body, version, stored_at)
+_entries: Dict[str, Tuple[bytes, int, float]] = {}
+# namespace -> newest version this process has heard of
+_versions: Dict[str, int] = {}
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _ttl() -> float:
+    try:
+        return float(os.environ.get('CACHE_TTL', 60))
+    except ValueError:
+        return 60.0
+
+
+def _note_version(namespace: str, version: int) -> None:
+    with _lock:
+        if version > _versions.get(namespace, -1):
+            _versions[namespace] = version
+            if namespace in _entries and _entries[namespace][1] < version:
+                del _entries[namespace]
+                _stats['invalidations'] += 1
+
+
+def get(namespace: str) -> Optional[Tuple[bytes, int]]:
+    """Return (body, version) for namespace or None when missing, expired or stale"""
+    ttl = _ttl()
+    if ttl <= 0:
+        return None
+    _ensure_listener()
+    with _lock:
+        entry = _entries.get(namespace)
+        if entry is not None:
+            body, version, stored_at = entry
+            if time.monotonic() - stored_at < ttl and version >= _versions.get(namespace, -1):
+                _stats['hits'] += 1
+                return body, version
+            del _entries[namespace]
+        _stats['misses'] += 1
+        return None
+
+
+def put(namespace: str, version: int, body: bytes) -> None:
+    """Store body produced from data read at the given namespace version"""
+    if _ttl() <= 0:
+        return
+    with _lock:
+        # An older version is still stored; get() rejects it once a newer one is known
+        _entries[namespace] = (body, version, time.monotonic())
+
+
+def current_version(cur: Any, namespace: str) -> int:
+    """Read the namespace version; call before reading the data it tags"""
+    queries.execute(cur, 'cache.version', (namespace,))
+    row = cur.fetchone()
+    if not row:
+        return 0
+    return row['version'] if isinstance(row, dict) else row[0]
+
+
+def bump(cur: Any, namespace: str) -> int:
+    """Increment the namespace version inside the caller's write transaction"""
+    queries.execute(cur, 'cache.bump', (namespace,))
+    row = cur.fetchone()
+    version = row['version'] if isinstance(row, dict) else row[0]
+    queries.execute(cur, 'cache.notify', (CHANNEL, '%s:%d' % (namespace, version)))
+    # Drop the local entry now; the committed version arrives through the listener
+    with _lock:
+        if _entries.pop(namespace, None) is not None:
+            _stats['invalidations'] += 1
+    return version
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        data = dict(_stats)
+        data['entries'] = len(_entries)
+        data['versions'] = dict(_versions)
+        data['listener'] = notify.connected()
+        return data
+
+
+def _on_notify(payload: str) -> None:
+    namespace, _, version = payload.partition(':')
+    if version.isdigit():
+        _note_version(namespace, int(version))
+
+
+def _on_reconnect() -> None:
+    # Notifications may have been missed while disconnected
+    with _lock:
+        _entries.clear()
+
+
+def _ensure_listener() -> None:
+    if os.environ.get('CACHE_LISTEN', '1') == '0':
+        return
+    notify.listen(CHANNEL, _on_notify, _on_reconnect)
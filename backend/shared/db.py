@@ -0,0 +1,582 @@
+'''
+Business: Shared PostgreSQL connection pool for all backend handlers
+Keeps warm connections in module scope so they survive across warm invocations
+and gunicorn worker lifetimes instead of paying a TCP + auth handshake per request.
+
+Read-only handler branches may pass readonly=True to be served by a streaming replica
+from DATABASE_REPLICA_URLS. Each replica is health- and lag-checked at most every
+DB_REPLICA_CHECK_INTERVAL seconds; a replica that is down, promoted or more than
+DB_REPLICA_MAX_LAG seconds behind is skipped, and without a usable replica the read goes
+to the primary. Read-your-writes: a commit on a primary connection borrowed with
+pin_key (the caller's auth token) pins that key to the primary for DB_PRIMARY_STICKY
+seconds. The pin is sent with NOTIFY inside the committing transaction, so every worker
+process knows it before the write's response leaves the server.
+
+Configuration (environment):
+    DATABASE_URL               - primary DSN
+    DATABASE_REPLICA_URLS      - comma-separated standby DSNs for read-only queries (default none)
+    DB_POOL_MIN                - connections opened eagerly on first use (default 1)
+    DB_POOL_MAX                - hard cap on open connections (default 5)
+    DB_POOL_MAX_AGE            - seconds before a connection is recycled (default 300)
+    DB_POOL_TIMEOUT            - seconds to wait for a free connection (default 5)
+    DB_POOL_PING_AFTER         - idle seconds after which checkout runs SELECT 1 (default 30)
+    DB_REPLICA_MAX_LAG         - replay lag in seconds above which a replica is skipped (default 5)
+    DB_REPLICA_CHECK_INTERVAL  - seconds between replica health checks (default 5)
+    DB_PRIMARY_STICKY          - seconds a writer stays on the primary; keep >= DB_REPLICA_MAX_LAG (default 10)
+    DB_PREWARM                 - 0 disables opening the pool while a function module loads (default 1)
+
+Pooled connections report checkout, statement and commit time to shared.metrics.
+'''
+
+import hashlib
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+
+from shared import metrics, notify
+
+PIN_CHANNEL = 'db_primary_pin'
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout"""
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_timed_cursors: Dict[type, type] = {}
+
+
+def _timed_cursor_class(base: type) -> type:
+    """Subclass of a cursor factory that reports execute/fetch time as the query phase"""
+    timed = _timed_cursors.get(base)
+    if timed is not None:
+        return timed
+
+    class TimedCursor(base):
+        def execute(self, query: Any, vars: Any = None) -> Any:
+            if metrics.current() is None:
+                return super().execute(query, vars)
+            with metrics.phase('query'):
+                result = super().execute(query, vars)
+            metrics.count_rows(self.rowcount)
+            return result
+
+        def executemany(self, query: Any, vars_list: Any) -> Any:
+            with metrics.phase('query'):
+                result = super().executemany(query, vars_list)
+            metrics.count_rows(self.rowcount)
+            return result
+
+        def copy_expert(self, sql: Any, file: Any, size: int = 8192) -> Any:
+            with metrics.phase('query'):
+                result = super().copy_expert(sql, file, size)
+            metrics.count_rows(self.rowcount)
+            return result
+
+        def fetchone(self) -> Any:
+            with metrics.phase('query'):
+                return super().fetchone()
+
+        def fetchmany(self, size: Optional[int] = None) -> Any:
+            with metrics.phase('query'):
+                return super().fetchmany(size) if size is not None else super().fetchmany()
+
+        def fetchall(self) -> Any:
+            with metrics.phase('query'):
+                return super().fetchall()
+
+    TimedCursor.__name__ = TimedCursor.__qualname__ = 'Timed' + base.__name__
+    _timed_cursors[base] = TimedCursor
+    return TimedCursor
+
+
+class TimedConnection(extensions.connection):
+    """psycopg2 connection whose cursors and commits feed the per-request timings"""
+
+    # Digest of the session to pin to the primary when this connection commits
+    pin_key: Optional[str] = None
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # Server-side prepared statements of this session (shared.queries)
+        self.prepared: Set[str] = set()
+
+    def cursor(self, *args: Any, **kwargs: Any) -> Any:
+        base = kwargs.get('cursor_factory') or self.cursor_factory or extensions.cursor
+        kwargs['cursor_factory'] = _timed_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self) -> None:
+        pin_key = self.pin_key
+        if pin_key is not None and self.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            cur = super().cursor()
+            cur.execute('SELECT pg_notify(%s, %s)', (PIN_CHANNEL, pin_key))
+            cur.close()
+        else:
+            pin_key = None
+        with metrics.phase('commit'):
+            super().commit()
+        if pin_key is not None:
+            _pin(pin_key)
+
+
+class ConnectionPool:
+    """Thread-safe pool with health checks on checkout and max-age recycling"""
+
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 5,
+                 max_age: float = 300.0, timeout: float = 5.0, ping_after: float = 30.0):
+        self.dsn = dsn
+        self.minconn = max(0, minconn)
+        self.maxconn = max(1, maxconn, self.minconn)
+        self.max_age = max_age
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        # idle entries: (connection, created_at, last_used_at)
+        self._idle: List[Tuple[Any, float, float]] = []
+        # id(connection) -> created_at for checked-out connections
+        self._in_use: Dict[int, float] = {}
+        # Slots reserved by a thread that is connecting, pinging or rolling back without the lock
+        self._pending = 0
+        self._stats = {
+            'checkouts': 0,
+            'connections_created': 0,
+            'connections_recycled': 0,
+            'connections_discarded': 0,
+            'health_check_failures': 0,
+            'timeouts': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+        }
+
+    def _open(self) -> Tuple[Any, float]:
+        conn = psycopg2.connect(self.dsn, connection_factory=TimedConnection)
+        return conn, time.monotonic()
+
+    def _count(self, key: str) -> None:
+        with self._cond:
+            self._stats[key] += 1
+
+    def _release_slot(self) -> None:
+        with self._cond:
+            self._pending -= 1
+            self._cond.notify()
+
+    def _reset_after_fork(self) -> None:
+        """Drop sockets inherited from the parent process (gunicorn --preload)"""
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._idle = []
+        self._in_use = {}
+        self._pending = 0
+
+    def _healthy(self, conn: Any, created_at: float, last_used: float, now: float) -> bool:
+        """Called without the lock: the SELECT 1 ping is a network round trip"""
+        if conn.closed:
+            return False
+        if self.max_age and now - created_at > self.max_age:
+            self._count('connections_recycled')
+            return False
+        if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if self.ping_after and now - last_used > self.ping_after:
+            try:
+                cur = conn.cursor()
+                cur.execute('SELECT 1')
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                self._count('health_check_failures')
+                return False
+        return True
+
+    def _close_quietly(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def warm(self) -> None:
+        """Open connections up to minconn so the first request does not pay for them"""
+        while True:
+            with self._cond:
+                self._reset_after_fork()
+                if len(self._idle) + len(self._in_use) + self._pending >= self.minconn:
+                    return
+                self._pending += 1
+            try:
+                conn, created_at = self._open()
+            except Exception:
+                self._release_slot()
+                raise
+            with self._cond:
+                self._pending -= 1
+                self._stats['connections_created'] += 1
+                self._idle.append((conn, created_at, created_at))
+                self._cond.notify()
+
+    def getconn(self) -> Any:
+        """
+        Check out a healthy connection, opening or waiting for one as needed. The slot is
+        reserved under the lock; connecting and the health check run without it.
+        """
+        started = time.monotonic()
+        deadline = started + self.timeout
+        while True:
+            with self._cond:
+                self._reset_after_fork()
+                while True:
+                    now = time.monotonic()
+                    if self._idle:
+                        idle = self._idle.pop()
+                        break
+                    if len(self._in_use) + self._pending < self.maxconn:
+                        idle = None
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout('No database connection available within %.1fs' % self.timeout)
+                    self._cond.wait(remaining)
+                self._pending += 1
+            if idle is None:
+                try:
+                    conn, created_at = self._open()
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self._pending -= 1
+                    self._stats['connections_created'] += 1
+                    return self._checked_out(conn, created_at, started)
+            conn, created_at, last_used = idle
+            if self._healthy(conn, created_at, last_used, now):
+                with self._cond:
+                    self._pending -= 1
+                    return self._checked_out(conn, created_at, started)
+            self._close_quietly(conn)
+            with self._cond:
+                self._pending -= 1
+                self._stats['connections_discarded'] += 1
+                self._cond.notify()
+
+    def _checked_out(self, conn: Any, created_at: float, started: float) -> Any:
+        waited_ms = (time.monotonic() - started) * 1000
+        self._in_use[id(conn)] = created_at
+        self._stats['checkouts'] += 1
+        self._stats['wait_time_total_ms'] += waited_ms
+        self._stats['wait_time_max_ms'] = max(self._stats['wait_time_max_ms'], waited_ms)
+        return conn
+
+    def putconn(self, conn: Any, discard: bool = False) -> None:
+        """Return a connection; broken or mid-transaction connections are rolled back or dropped"""
+        with self._cond:
+            created_at = self._in_use.pop(id(conn), None)
+            if created_at is None:
+                # Checked out before a fork or already returned
+                self._close_quietly(conn)
+                return
+            self._pending += 1
+        if not discard and not conn.closed:
+            status = conn.get_transaction_status()
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    discard = True
+        if discard or conn.closed:
+            self._close_quietly(conn)
+        with self._cond:
+            self._pending -= 1
+            if discard or conn.closed:
+                self._stats['connections_discarded'] += 1
+            else:
+                self._idle.append((conn, created_at, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def closeall(self) -> None:
+        with self._cond:
+            for conn, _, _ in self._idle:
+                self._close_quietly(conn)
+            self._idle = []
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            data = dict(self._stats)
+            data['idle'] = len(self._idle)
+            data['in_use'] = len(self._in_use)
+            data['min_size'] = self.minconn
+            data['max_size'] = self.maxconn
+            checkouts = data['checkouts']
+            data['wait_time_avg_ms'] = data['wait_time_total_ms'] / checkouts if checkouts else 0.0
+            return data
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: Optional[str] = None) -> ConnectionPool:
+    """Return the process-wide pool for dsn (DATABASE_URL by default)"""
+    dsn = dsn or os.environ.get('DATABASE_URL')
+    if not dsn:
+        raise RuntimeError('DATABASE_URL is not configured')
+    pool = _pools.get(dsn)
+    if pool is None:
+        created = False
+        with _pools_lock:
+            pool = _pools.get(dsn)
+            if pool is None:
+                pool = ConnectionPool(
+                    dsn,
+                    minconn=_env_int('DB_POOL_MIN', 1),
+                    maxconn=_env_int('DB_POOL_MAX', 5),
+                    max_age=_env_float('DB_POOL_MAX_AGE', 300.0),
+                    timeout=_env_float('DB_POOL_TIMEOUT', 5.0),
+                    ping_after=_env_float('DB_POOL_PING_AFTER', 30.0),
+                )
+                _pools[dsn] = pool
+                created = True
+        # Connect outside _pools_lock: a slow or unreachable DSN must not stall the other pools.
+        # Only the caller that registered the pool warms it; others check out as usual.
+        if created:
+            pool.warm()
+    return pool
+
+
+class Replica:
+    """A standby DSN with its last health check: reachable, in recovery and within the lag limit"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self.checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def usable(self) -> bool:
+        """Re-check when the last result is older than DB_REPLICA_CHECK_INTERVAL; one thread checks at a time"""
+        if time.monotonic() - self.checked_at >= _env_float('DB_REPLICA_CHECK_INTERVAL', 5.0):
+            if self._lock.acquire(blocking=False):
+                try:
+                    self.check()
+                finally:
+                    self._lock.release()
+        return self.healthy
+
+    def check(self) -> None:
+        max_lag = _env_float('DB_REPLICA_MAX_LAG', 5.0)
+        try:
+            with get_pool(self.dsn).connection() as conn:
+                cur = conn.cursor()
+                # A caught-up standby on an idle primary has an old replay timestamp but no lag
+                cur.execute(
+                    """SELECT pg_is_in_recovery(),
+                              CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                                   ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+                              END"""
+                )
+                in_recovery, lag = cur.fetchone()
+                cur.close()
+        except (psycopg2.Error, PoolTimeout) as e:
+            self.mark_down(str(e).strip() or type(e).__name__)
+            return
+        self.lag = float(lag) if lag is not None else None
+        if not in_recovery:
+            self.healthy, self.error = False, 'not in recovery'
+        elif self.lag is None or self.lag > max_lag:
+            self.healthy, self.error = False, 'replication lag above %.1fs' % max_lag
+        else:
+            self.healthy, self.error = True, None
+        self.checked_at = time.monotonic()
+
+    def mark_down(self, error: str) -> None:
+        self.healthy, self.error = False, error
+        self.checked_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        params = extensions.parse_dsn(self.dsn)
+        return {
+            'replica': '%s/%s' % (params.get('host', 'local'), params.get('dbname', '')),
+            'healthy': self.healthy,
+            'lag_s': self.lag,
+            'error': self.error,
+        }
+
+
+_replicas: Optional[List[Replica]] = None
+_replicas_lock = threading.Lock()
+_round_robin = itertools.count()
+# session digest -> monotonic time its primary pin expires
+_pins: Dict[str, float] = {}
+_routing = {'replica_reads': 0, 'primary_reads': 0, 'pinned_reads': 0, 'replica_failovers': 0}
+
+
+def replicas() -> List[Replica]:
+    """Replicas from DATABASE_REPLICA_URLS; the first call subscribes to pins from other workers"""
+    global _replicas
+    if _replicas is None:
+        with _replicas_lock:
+            if _replicas is None:
+                dsns = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+                if dsns:
+                    notify.listen(PIN_CHANNEL, _pin)
+                _replicas = [Replica(dsn) for dsn in dsns]
+    return _replicas
+
+
+def _digest(key: str) -> str:
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+
+def _pin(digest: str) -> None:
+    now = time.monotonic()
+    with _replicas_lock:
+        _pins[digest] = now + _env_float('DB_PRIMARY_STICKY', 10.0)
+        if len(_pins) > 1024:
+            for key in [key for key, until in _pins.items() if until <= now]:
+                del _pins[key]
+
+
+def pinned(pin_key: Optional[str]) -> bool:
+    """True while pin_key's reads must stay on the primary after its last write"""
+    if not pin_key:
+        return False
+    return _pins.get(_digest(pin_key), 0.0) > time.monotonic()
+
+
+def pin(conn: Any, pin_key: Optional[str]) -> None:
+    """Pin pin_key to the primary when conn commits (e.g. a token issued in this transaction)"""
+    if pin_key and replicas():
+        conn.pin_key = _digest(pin_key)
+
+
+def _replica_for(pin_key: Optional[str]) -> Optional[Replica]:
+    candidates = replicas()
+    if not candidates:
+        return None
+    if pinned(pin_key):
+        _routing['pinned_reads'] += 1
+        return None
+    usable = [replica for replica in candidates if replica.usable()]
+    if not usable:
+        _routing['primary_reads'] += 1
+        return None
+    return usable[next(_round_robin) % len(usable)]
+
+
+@contextmanager
+def connection(dsn: Optional[str] = None, readonly: bool = False,
+               pin_key: Optional[str] = None) -> Iterator[Any]:
+    """
+    Borrow a pooled connection for the duration of the with-block.
+    readonly=True may route to a replica unless pin_key wrote recently; on the primary,
+    committing pins pin_key so its following reads see the write.
+    """
+    pool = None
+    replica = _replica_for(pin_key) if readonly and dsn is None else None
+    if replica is not None:
+        try:
+            pool = get_pool(replica.dsn)
+            with metrics.phase('connect'):
+                conn = pool.getconn()
+            _routing['replica_reads'] += 1
+        except (psycopg2.OperationalError, PoolTimeout) as e:
+            replica.mark_down(str(e).strip() or type(e).__name__)
+            _routing['replica_failovers'] += 1
+            pool = None
+    if pool is None:
+        pool = get_pool(dsn)
+        with metrics.phase('connect'):
+            conn = pool.getconn()
+        pin(conn, pin_key)
+    discard = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        discard = True
+        raise
+    finally:
+        conn.pin_key = None
+        pool.putconn(conn, discard=discard)
+
+
+def dict_cursor(conn: Any) -> Any:
+    """Cursor returning dict rows; psycopg2.extras (which pulls in logging) is imported on first use"""
+    from psycopg2.extras import RealDictCursor
+    return conn.cursor(cursor_factory=RealDictCursor)
+
+
+def prewarm(*loaders: Callable[[Any], Any]) -> None:
+    """
+    Open the pool on a background thread while the function module is still initializing,
+    then run loaders (e.g. filling the response cache) on a read connection. A request
+    arriving meanwhile takes a warmed connection or opens its own. DB_PREWARM=0 disables it.
+    """
+    if not os.environ.get('DATABASE_URL') or os.environ.get('DB_PREWARM', '1') == '0':
+        return
+
+    def run() -> None:
+        try:
+            get_pool()
+            if loaders:
+                with connection(readonly=True) as conn:
+                    cur = conn.cursor()
+                    for loader in loaders:
+                        loader(cur)
+                    cur.close()
+        except Exception:
+            pass
+
+    threading.Thread(target=run, name='db-prewarm', daemon=True).start()
+
+
+def replica_stats() -> Dict[str, Any]:
+    """Routing counters and the last health check of each replica"""
+    return {**_routing, 'replicas': [replica.stats() for replica in replicas()]}
+
+
+def pool_stats() -> Dict[str, Dict[str, Any]]:
+    """Metrics for every pool in this process, keyed by DSN host"""
+    result = {}
+    for dsn, pool in list(_pools.items()):
+        params = extensions.parse_dsn(dsn)
+        key = '%s/%s' % (params.get('host', 'local'), params.get('dbname', ''))
+        result[key] = pool.stats()
+    return result
@@ -0,0 +1,246 @@
+'''
+Business: Live change feed over Server-Sent Events
+Statement-level triggers (V0012) NOTIFY change_feed with {"table", "op", "version"} after
+writes to contacts, page_settings and admin_actions. The process-wide shared.notify
+connection hands each payload to publish(), which numbers it, keeps it in a replay ring
+and fans it out to every subscription interested in that table.
+
+Each subscription has a bounded queue. A client that falls behind does not slow the
+listener down: its queue is dropped and it receives a single "reset" event, after which
+it should refetch (GET /contacts?since=..., the first audit page). Reconnecting clients
+send Last-Event-ID ("<process>-<seq>"); events still in the ring are replayed, otherwise
+(another worker, restart, ring overrun) the stream starts with "reset". A comment line is
+sent every SSE_HEARTBEAT seconds so proxies keep the connection open and dead clients
+are noticed.
+
+Subscriptions iterate synchronously for WSGI (one worker thread per open stream) and
+asynchronously for ASGI (server.asgi_app), where open streams cost no threads.
+
+Configuration (environment):
+    SSE_HEARTBEAT        - seconds between keepalive comments (default 15)
+    SSE_QUEUE_SIZE       - events buffered per client before it is reset (default 100)
+    SSE_REPLAY_SIZE      - recent events kept for Last-Event-ID replay (default 1000)
+    SSE_MAX_SUBSCRIBERS  - open streams per process (default 100)
+'''
+
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from shared import notify
+
+if TYPE_CHECKING:
+    # Only the ASGI path needs asyncio; WSGI workers and the function gateway never load it
+    import asyncio
+
+CHANNEL = 'change_feed'
+
+TABLES = frozenset(('contacts', 'page_settings', 'admin_actions'))
+
+# Distinguishes event ids of this process from those of other workers and earlier runs
+PROCESS_TOKEN = uuid.uuid4().hex[:12]
+
+
+class TooManySubscribers(Exception):
+    """Raised when SSE_MAX_SUBSCRIBERS streams are already open in this process"""
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_lock = threading.Lock()
+_seq = 0
+# (seq, table, encoded event)
+_ring: Deque[Tuple[int, str, bytes]] = deque(maxlen=max(_env_int('SSE_REPLAY_SIZE', 1000), 1))
+_subscriptions: Set['Subscription'] = set()
+_stats = {'published': 0, 'delivered': 0, 'resets': 0, 'rejected': 0}
+
+RESET = b'event: reset\ndata: {}\n\n'
+HEARTBEAT = b': ping\n\n'
+# First chunk: flushes the response headers and sets the client's reconnect delay
+PREAMBLE = b'retry: 3000\n: connected\n\n'
+
+
+def _encode(seq: int, table: str, data: str) -> bytes:
+    return ('id: %s-%d\nevent: %s\ndata: %s\n\n' % (PROCESS_TOKEN, seq, table, data)).encode('utf-8')
+
+
+class Subscription:
+    """Bounded per-client event queue, iterable with for and async for"""
+
+    def __init__(self, tables: FrozenSet[str]):
+        self.tables = tables
+        self.heartbeat = max(_env_float('SSE_HEARTBEAT', 15.0), 1.0)
+        self.limit = max(_env_int('SSE_QUEUE_SIZE', 100), 1)
+        self._cond = threading.Condition()
+        self._queue: Deque[bytes] = deque()
+        self._closed = False
+        self._started = False
+        self._loop: Optional['asyncio.AbstractEventLoop'] = None
+        self._wakeup: Optional['asyncio.Event'] = None
+
+    def push(self, chunk: bytes, reset: bool = False) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            if reset or len(self._queue) >= self.limit:
+                self._queue.clear()
+                self._queue.append(RESET)
+                _stats['resets'] += 1
+            else:
+                self._queue.append(chunk)
+            self._cond.notify()
+            loop, wakeup = self._loop, self._wakeup
+        if loop is not None and wakeup is not None:
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass
+
+    def _take(self) -> Optional[bytes]:
+        parts = [] if self._started else [PREAMBLE]
+        self._started = True
+        while self._queue:
+            parts.append(self._queue.popleft())
+            _stats['delivered'] += 1
+        return b''.join(parts) if parts else None
+
+    def __iter__(self) -> 'Subscription':
+        return self
+
+    def __next__(self) -> bytes:
+        with self._cond:
+            if self._closed:
+                raise StopIteration
+            if not self._queue and self._started:
+                self._cond.wait(self.heartbeat)
+            if self._closed:
+                raise StopIteration
+            return self._take() or HEARTBEAT
+
+    def __aiter__(self) -> 'Subscription':
+        return self
+
+    async def __anext__(self) -> bytes:
+        import asyncio
+        if self._wakeup is None:
+            with self._cond:
+                self._loop = asyncio.get_running_loop()
+                self._wakeup = asyncio.Event()
+        with self._cond:
+            if self._closed:
+                raise StopAsyncIteration
+            chunk = self._take()
+            if chunk is not None:
+                return chunk
+            self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), self.heartbeat)
+        except asyncio.TimeoutError:
+            pass
+        with self._cond:
+            if self._closed:
+                raise StopAsyncIteration
+            return self._take() or HEARTBEAT
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        with _lock:
+            _subscriptions.discard(self)
+
+
+def publish(payload: str) -> None:
+    """Number a change_feed payload and queue it for every interested subscription"""
+    global _seq
+    try:
+        table = json.loads(payload).get('table')
+    except (ValueError, AttributeError):
+        return
+    if table not in TABLES:
+        return
+    with _lock:
+        _seq += 1
+        chunk = _encode(_seq, table, payload)
+        _ring.append((_seq, table, chunk))
+        _stats['published'] += 1
+        targets = [subscription for subscription in _subscriptions if table in subscription.tables]
+    for subscription in targets:
+        subscription.push(chunk)
+
+
+def _reset_all() -> None:
+    """Notifications sent while the listener was disconnected are lost; every client resyncs"""
+    with _lock:
+        targets = list(_subscriptions)
+    for subscription in targets:
+        subscription.push(RESET, reset=True)
+
+
+def _replay(last_event_id: str, tables: FrozenSet[str]) -> Optional[Iterable[bytes]]:
+    """Ring events after last_event_id, or None when they are no longer all available"""
+    token, _, seq = last_event_id.rpartition('-')
+    if token != PROCESS_TOKEN or not seq.isdigit():
+        return None
+    last = int(seq)
+    if last > _seq or (last < _seq and (not _ring or _ring[0][0] > last + 1)):
+        return None
+    return [chunk for number, table, chunk in _ring if number > last and table in tables]
+
+
+def subscribe(tables: Iterable[str], last_event_id: str = '') -> Subscription:
+    """Open a stream of changes to tables; raises TooManySubscribers at the per-process cap"""
+    notify.listen(CHANNEL, publish, _reset_all)
+    subscription = Subscription(frozenset(tables) & TABLES)
+    with _lock:
+        if len(_subscriptions) >= _env_int('SSE_MAX_SUBSCRIBERS', 100):
+            _stats['rejected'] += 1
+            raise TooManySubscribers('Too many open event streams')
+        # Registered under the same lock as publish(), so nothing falls between replay and live events
+        _subscriptions.add(subscription)
+        if last_event_id:
+            replay = _replay(last_event_id, subscription.tables)
+            if replay is None:
+                subscription.push(RESET, reset=True)
+            else:
+                for chunk in replay:
+                    subscription.push(chunk)
+    return subscription
+
+
+def response(subscription: Subscription, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Handler result streaming the subscription as text/event-stream"""
+    return {
+        'statusCode': 200,
+        'headers': {
+            **(headers or {}),
+            'Content-Type': 'text/event-stream; charset=utf-8',
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no',
+        },
+        'body': subscription,
+        'isBase64Encoded': False
+    }
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        data = dict(_stats)
+        data['subscribers'] = len(_subscriptions)
+        data['last_event'] = _seq
+        return data
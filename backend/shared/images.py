@@ -0,0 +1,188 @@
+'''
+Business: Local image uploads with resized WebP/JPEG variants under content-hash names
+An uploaded avatar or page background is decoded once, EXIF-rotated and resized into
+every configured size; each variant is written as WebP and JPEG to
+MEDIA_DIR/<kind>/<sha256[:16]>-<size>.<ext>. Names depend only on the uploaded bytes,
+so nginx serves them with an immutable one-year Cache-Control and uploading the same
+file twice reuses the existing variants.
+
+store() returns the descriptor kept in contacts.avatar_variants and
+page_settings.background_variants:
+    {"hash": "...", "sizes": [64, 128, 256], "src": "<default jpeg>",
+     "webp": {"64": "/media/avatar/...-64.webp", ...}, "jpeg": {...}}
+
+Requires Pillow; without it, or without MEDIA_DIR (e.g. serverless), uploads answer 501.
+
+Configuration (environment):
+    MEDIA_DIR         - output directory; unset disables uploads
+    MEDIA_URL         - public URL prefix of MEDIA_DIR (default /media/)
+    MEDIA_MAX_BYTES   - largest accepted upload (default 10485760)
+    MEDIA_MAX_PIXELS  - largest accepted decoded image (default 40000000)
+'''
+
+import base64
+import hashlib
+import io
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# (Image, ImageOps) once Pillow has been imported; it is loaded on the first upload only
+_pil: Optional[Tuple[Any, Any]] = None
+
+# kind -> (variant sizes, default size for "src", square crop)
+KINDS: Dict[str, Tuple[Tuple[int, ...], int, bool]] = {
+    'avatar': ((64, 128, 256), 128, True),
+    'background': ((640, 1280, 1920, 2560), 1920, False),
+}
+
+FORMATS = ('webp', 'jpeg')
+
+ACCEPTED = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+
+class ImageError(ValueError):
+    """Upload rejected; status is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def media_dir() -> Optional[str]:
+    return os.environ.get('MEDIA_DIR') or None
+
+
+def media_url() -> str:
+    prefix = os.environ.get('MEDIA_URL', '/media/')
+    return prefix if prefix.endswith('/') else prefix + '/'
+
+
+def _load_pil() -> Tuple[Any, Any]:
+    """Pillow's Image and ImageOps modules, or (None, None) when Pillow is not installed"""
+    global _pil
+    if _pil is None:
+        try:
+            from PIL import Image, ImageOps
+            _pil = (Image, ImageOps)
+        except ImportError:
+            _pil = (None, None)
+    return _pil
+
+
+def enabled() -> bool:
+    return media_dir() is not None and _load_pil()[0] is not None
+
+
+def body_bytes(event: Dict[str, Any]) -> bytes:
+    """Raw request body; the gateway and server.py base64-encode binary uploads"""
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        return base64.b64decode(body)
+    return body.encode('latin-1') if isinstance(body, str) else body
+
+
+def _filename(digest: str, size: int, extension: str) -> str:
+    return '%s-%d.%s' % (digest, size, extension)
+
+
+def _descriptor(kind: str, digest: str, sizes: List[int]) -> Dict[str, Any]:
+    default = KINDS[kind][1]
+    base = media_url() + kind + '/'
+    variants = {
+        extension: {str(size): base + _filename(digest, size, extension) for size in sizes}
+        for extension in FORMATS
+    }
+    src_size = max([size for size in sizes if size <= default] or [min(sizes)])
+    return {'hash': digest, 'sizes': sizes, 'src': variants['jpeg'][str(src_size)], **variants}
+
+
+def _decode(data: bytes) -> Any:
+    Image, ImageOps = _load_pil()
+    Image.MAX_IMAGE_PIXELS = _env_int('MEDIA_MAX_PIXELS', 40000000)
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.format not in ACCEPTED:
+            raise ImageError('Unsupported image format; use JPEG, PNG, WebP or GIF', 415)
+        image.load()
+    except ImageError:
+        raise
+    except Image.DecompressionBombError:
+        raise ImageError('Image dimensions are too large', 413)
+    except (OSError, SyntaxError, ValueError):
+        raise ImageError('Not a valid image')
+    image = ImageOps.exif_transpose(image)
+    return image.convert('RGBA') if image.mode in ('RGBA', 'LA', 'P') else image.convert('RGB')
+
+
+def _sizes(kind: str, width: int, height: int) -> List[int]:
+    """Configured sizes that do not upscale the source; at least one is always produced"""
+    sizes, _, square = KINDS[kind]
+    limit = min(width, height) if square else width
+    fitting = [size for size in sizes if size <= limit]
+    return fitting or [max(limit, 1)]
+
+
+def _resize(image: Any, size: int, square: bool) -> Any:
+    Image, ImageOps = _load_pil()
+    if square:
+        return ImageOps.fit(image, (size, size), Image.LANCZOS)
+    height = max(round(image.height * size / image.width), 1)
+    return image.resize((size, height), Image.LANCZOS)
+
+
+def _encode(image: Any, extension: str) -> bytes:
+    Image = _load_pil()[0]
+    buffer = io.BytesIO()
+    if extension == 'webp':
+        image.save(buffer, 'WEBP', quality=80, method=6)
+    else:
+        if image.mode == 'RGBA':
+            flat = Image.new('RGB', image.size, (255, 255, 255))
+            flat.paste(image, mask=image.getchannel('A'))
+            image = flat
+        image.save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def _atomic_write(directory: str, name: str, data: bytes) -> None:
+    import tempfile
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + name, dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, os.path.join(directory, name))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def store(data: bytes, kind: str) -> Dict[str, Any]:
+    """Validate an upload, write its variants (unless already present) and return the descriptor"""
+    if not enabled():
+        raise RuntimeError('Image uploads need Pillow and MEDIA_DIR')
+    if not data:
+        raise ImageError('Empty upload')
+    if len(data) > _env_int('MEDIA_MAX_BYTES', 10485760):
+        raise ImageError('Image is too large', 413)
+    digest = hashlib.sha256(data).hexdigest()[:16]
+    image = _decode(data)
+    sizes = _sizes(kind, image.width, image.height)
+    directory = os.path.join(media_dir(), kind)
+    os.makedirs(directory, exist_ok=True)
+    for size in sizes:
+        names = {extension: _filename(digest, size, extension) for extension in FORMATS}
+        if all(os.path.exists(os.path.join(directory, name)) for name in names.values()):
+            continue
+        variant = _resize(image, size, KINDS[kind][2])
+        for extension, name in names.items():
+            _atomic_write(directory, name, _encode(variant, extension))
+    return _descriptor(kind, digest, sizes)
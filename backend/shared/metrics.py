@@ -0,0 +1,296 @@
+'''
+Business: Per-request phase timing, Server-Timing headers and Prometheus metrics
+@instrument('<function>') wraps a module's handler. Time spent inside phase('<name>')
+blocks during the request (connect, query, serialize, bcrypt, commit are recorded by
+the shared db and passwords modules) is summed per request, returned to the client as
+a Server-Timing header and aggregated into per-process histograms that server.py
+exposes in Prometheus text format on /_metrics.
+
+Slow requests can be profiled: with PROFILE_SLOW_MS set, a sampler thread snapshots
+the stacks of in-flight requests every PROFILE_INTERVAL_MS and, for each request that
+took longer than the threshold, hands the folded stacks to the slow-request hook
+(by default one line per stack on stderr; replace with set_slow_hook()).
+
+Configuration (environment):
+    SERVER_TIMING         - set to 0 to omit the Server-Timing header (default 1)
+    PROFILE_SLOW_MS       - profile requests slower than this; unset disables sampling
+    PROFILE_INTERVAL_MS   - sampling interval (default 5)
+'''
+
+import functools
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+PHASES = ('connect', 'query', 'serialize', 'bcrypt', 'commit')
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    try:
+        value = os.environ.get(name)
+        return default if value in (None, '') else float(value)
+    except ValueError:
+        return default
+
+
+class RequestTimings:
+    """Phase durations (ms), statement and row counts for the request on this thread"""
+
+    __slots__ = ('function', 'method', 'started', 'phases', 'statements', 'rows', 'samples')
+
+    def __init__(self, function: str, method: str):
+        self.function = function
+        self.method = method
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+        self.statements = 0
+        self.rows = 0
+        self.samples: Optional[Counter] = None
+
+    def add(self, phase_name: str, elapsed_ms: float) -> None:
+        self.phases[phase_name] = self.phases.get(phase_name, 0.0) + elapsed_ms
+
+
+_local = threading.local()
+
+
+def current() -> Optional[RequestTimings]:
+    return getattr(_local, 'request', None)
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Attribute the time spent in the with-block to phase name of the current request"""
+    request = current()
+    if request is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.add(name, (time.perf_counter() - started) * 1000)
+
+
+def count_rows(rows: int, statements: int = 1) -> None:
+    request = current()
+    if request is not None:
+        request.statements += statements
+        if rows > 0:
+            request.rows += rows
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[index] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+
+_metrics_lock = threading.Lock()
+_requests: Dict[Tuple[str, str, str], Histogram] = {}
+_phases: Dict[Tuple[str, str], Histogram] = {}
+_rows: Dict[str, int] = {}
+_statements: Dict[str, int] = {}
+
+
+def _observe(request: RequestTimings, status: int, total_ms: float) -> None:
+    with _metrics_lock:
+        key = (request.function, request.method, str(status))
+        histogram = _requests.get(key)
+        if histogram is None:
+            histogram = _requests[key] = Histogram()
+        histogram.observe(total_ms / 1000)
+        for name, elapsed_ms in request.phases.items():
+            phase_key = (request.function, name)
+            histogram = _phases.get(phase_key)
+            if histogram is None:
+                histogram = _phases[phase_key] = Histogram()
+            histogram.observe(elapsed_ms / 1000)
+        _rows[request.function] = _rows.get(request.function, 0) + request.rows
+        _statements[request.function] = _statements.get(request.function, 0) + request.statements
+
+
+def server_timing(request: RequestTimings, total_ms: float) -> str:
+    parts = []
+    for name in PHASES + tuple(sorted(set(request.phases) - set(PHASES))):
+        if name in request.phases:
+            entry = '%s;dur=%.2f' % (name, request.phases[name])
+            if name == 'query':
+                entry += ';desc="%d statements, %d rows"' % (request.statements, request.rows)
+            parts.append(entry)
+    parts.append('total;dur=%.2f' % total_ms)
+    return ', '.join(parts)
+
+
+# ---------------------------------------------------------------------------
+# Slow-request sampling profiler
+
+def _default_slow_hook(request: RequestTimings, total_ms: float, samples: Counter) -> None:
+    for stack, hits in samples.most_common():
+        sys.stderr.write('slow-request %s %s %.1fms %s %d\n' % (
+            request.function, request.method, total_ms, stack, hits))
+    sys.stderr.flush()
+
+
+_slow_hook: Callable[[RequestTimings, float, Counter], None] = _default_slow_hook
+_sampled: Dict[int, RequestTimings] = {}
+_sampler: Optional[threading.Thread] = None
+_sampler_pid: Optional[int] = None
+
+
+def set_slow_hook(hook: Callable[[RequestTimings, float, Counter], None]) -> None:
+    """Receive (timings, total_ms, Counter of folded stacks) for every profiled slow request"""
+    global _slow_hook
+    _slow_hook = hook
+
+
+def _fold(frame: Any) -> str:
+    names: List[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('%s:%s:%d' % (os.path.basename(code.co_filename), code.co_name, frame.f_lineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _sample_loop() -> None:
+    while True:
+        time.sleep((_env_float('PROFILE_INTERVAL_MS', 5.0) or 5.0) / 1000)
+        with _metrics_lock:
+            if not _sampled:
+                continue
+            in_flight = dict(_sampled)
+        frames = sys._current_frames()
+        for thread_id, request in in_flight.items():
+            frame = frames.get(thread_id)
+            if frame is not None and request.samples is not None:
+                request.samples[_fold(frame)] += 1
+
+
+def _ensure_sampler() -> None:
+    global _sampler, _sampler_pid
+    if _sampler is not None and _sampler_pid == os.getpid() and _sampler.is_alive():
+        return
+    with _metrics_lock:
+        if _sampler is not None and _sampler_pid == os.getpid() and _sampler.is_alive():
+            return
+        _sampler_pid = os.getpid()
+        _sampler = threading.Thread(target=_sample_loop, name='slow-request-sampler', daemon=True)
+        _sampler.start()
+
+
+# ---------------------------------------------------------------------------
+# Handler wrapper
+
+def instrument(function: str) -> Callable:
+    """Decorator for handler(event, context) that times the request and adds Server-Timing"""
+
+    def decorate(handler: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            request = RequestTimings(function, event.get('httpMethod', 'GET'))
+            previous = current()
+            _local.request = request
+            slow_ms = _env_float('PROFILE_SLOW_MS', None)
+            thread_id = threading.get_ident()
+            if slow_ms is not None:
+                request.samples = Counter()
+                _ensure_sampler()
+                with _metrics_lock:
+                    _sampled[thread_id] = request
+            status = 500
+            try:
+                result = handler(event, context)
+                status = int(result.get('statusCode', 200))
+                total_ms = (time.perf_counter() - request.started) * 1000
+                if os.environ.get('SERVER_TIMING', '1') != '0':
+                    result['headers'] = {
+                        **(result.get('headers') or {}),
+                        'Server-Timing': server_timing(request, total_ms),
+                        'Timing-Allow-Origin': '*',
+                    }
+                return result
+            finally:
+                total_ms = (time.perf_counter() - request.started) * 1000
+                _local.request = previous
+                if slow_ms is not None:
+                    with _metrics_lock:
+                        _sampled.pop(thread_id, None)
+                _observe(request, status, total_ms)
+                if slow_ms is not None and total_ms >= slow_ms and request.samples:
+                    try:
+                        _slow_hook(request, total_ms, request.samples)
+                    except Exception:
+                        pass
+
+        return wrapper
+
+    return decorate
+
+
+# ---------------------------------------------------------------------------
+# Prometheus exposition
+
+def _labels(**labels: str) -> str:
+    return ','.join('%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                    for key, value in labels.items())
+
+
+def _histogram_lines(name: str, labels: Dict[str, str], histogram: Histogram) -> List[str]:
+    lines = []
+    cumulative = 0
+    for bound, count in zip(BUCKETS, histogram.counts):
+        cumulative += count
+        lines.append('%s_bucket{%s} %d' % (name, _labels(**labels, le=repr(bound)), cumulative))
+    lines.append('%s_bucket{%s} %d' % (name, _labels(**labels, le='+Inf'), histogram.count))
+    lines.append('%s_sum{%s} %.6f' % (name, _labels(**labels), histogram.total))
+    lines.append('%s_count{%s} %d' % (name, _labels(**labels), histogram.count))
+    return lines
+
+
+def render(gauges: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    """Prometheus text format (0.0.4) for this process; gauges maps metric -> {label: value}"""
+    lines = [
+        '# HELP backend_request_duration_seconds Handler latency by function, method and status',
+        '# TYPE backend_request_duration_seconds histogram',
+    ]
+    with _metrics_lock:
+        for (function, method, status), histogram in sorted(_requests.items()):
+            lines.extend(_histogram_lines('backend_request_duration_seconds',
+                                          {'function': function, 'method': method, 'status': status}, histogram))
+        lines.append('# HELP backend_phase_duration_seconds Time per request spent in each phase')
+        lines.append('# TYPE backend_phase_duration_seconds histogram')
+        for (function, name), histogram in sorted(_phases.items()):
+            lines.extend(_histogram_lines('backend_phase_duration_seconds',
+                                          {'function': function, 'phase': name}, histogram))
+        lines.append('# HELP backend_rows_total Rows returned or affected by handler statements')
+        lines.append('# TYPE backend_rows_total counter')
+        for function, rows in sorted(_rows.items()):
+            lines.append('backend_rows_total{%s} %d' % (_labels(function=function), rows))
+        lines.append('# HELP backend_statements_total Statements executed by handlers')
+        lines.append('# TYPE backend_statements_total counter')
+        for function, statements in sorted(_statements.items()):
+            lines.append('backend_statements_total{%s} %d' % (_labels(function=function), statements))
+    for metric, values in sorted((gauges or {}).items()):
+        lines.append('# TYPE %s gauge' % metric)
+        for label, value in sorted(values.items()):
+            lines.append('%s{%s} %s' % (metric, label, value))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,115 @@
+'''
+Business: One LISTEN connection per process shared by every NOTIFY consumer
+Modules register a callback per channel with listen(); a daemon thread holds a single
+autocommit connection, LISTENs on every registered channel (channels registered later
+are picked up within a second) and hands each payload to its callbacks. After a
+reconnect the on_reconnect hooks run, since notifications sent while disconnected are lost.
+'''
+
+import os
+import select
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2 import extensions
+
+KEEPALIVE = 30.0
+
+_lock = threading.Lock()
+_callbacks: Dict[str, List[Callable[[str], None]]] = {}
+_reconnect_hooks: List[Callable[[], None]] = []
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+_connected = False
+
+
+def listen(channel: str, callback: Callable[[str], None],
+           on_reconnect: Optional[Callable[[], None]] = None) -> None:
+    """Deliver every NOTIFY payload on channel to callback (idempotent per callback)"""
+    with _lock:
+        callbacks = _callbacks.setdefault(channel, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+        if on_reconnect is not None and on_reconnect not in _reconnect_hooks:
+            _reconnect_hooks.append(on_reconnect)
+    _ensure_thread()
+
+
+def connected() -> bool:
+    return bool(_connected and _thread is not None and _thread.is_alive())
+
+
+def _ensure_thread() -> None:
+    global _thread, _thread_pid
+    if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+        return
+    with _lock:
+        if _thread is not None and _thread_pid == os.getpid() and _thread.is_alive():
+            return
+        dsn = os.environ.get('DATABASE_URL')
+        if not dsn:
+            return
+        _thread_pid = os.getpid()
+        _thread = threading.Thread(target=_listen_forever, args=(dsn,), name='notify-listener', daemon=True)
+        _thread.start()
+
+
+def _dispatch(channel: str, payload: str) -> None:
+    with _lock:
+        callbacks = list(_callbacks.get(channel, ()))
+    for callback in callbacks:
+        try:
+            callback(payload)
+        except Exception:
+            pass
+
+
+def _listen_forever(dsn: str) -> None:
+    """Dedicated LISTEN connection; reconnects with backoff"""
+    global _connected
+    backoff = 1.0
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(dsn)
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            with _lock:
+                listening = set(_callbacks)
+                hooks = list(_reconnect_hooks)
+            for channel in listening:
+                cur.execute('LISTEN %s' % channel)
+            for hook in hooks:
+                hook()
+            _connected = True
+            backoff = 1.0
+            last_activity = time.monotonic()
+            while True:
+                with _lock:
+                    pending = [channel for channel in _callbacks if channel not in listening]
+                for channel in pending:
+                    cur.execute('LISTEN %s' % channel)
+                    listening.add(channel)
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    if time.monotonic() - last_activity > KEEPALIVE:
+                        cur.execute('SELECT 1')
+                        last_activity = time.monotonic()
+                    continue
+                last_activity = time.monotonic()
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    _dispatch(notify.channel, notify.payload)
+        except Exception:
+            _connected = False
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+        finally:
+            _connected = False
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
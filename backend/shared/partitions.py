@@ -0,0 +1,205 @@
+'''
+Business: Monthly partition maintenance and retention for the admin_actions audit log
+admin_actions is range-partitioned by created_at into admin_actions_pYYYYMM tables (V0009).
+run() creates the current month and AUDIT_PARTITION_PREMAKE months ahead so inserts never
+miss a partition (rows that still landed in admin_actions_default, V0014, are moved into
+their month), then every month older than AUDIT_RETENTION_MONTHS is detached, copied
+into a gzip-compressed CSV in AUDIT_ARCHIVE_DIR and dropped. A partition is only dropped
+after its archive has been written and fsynced; one left detached by an interrupted run
+is archived on the next one.
+
+Run daily (deploy.sh installs a systemd timer):
+    cd backend && python -m shared.partitions
+    python -m shared.partitions --dry-run
+
+Configuration (environment):
+    AUDIT_PARTITION_PREMAKE  - future months created ahead of time (default 3)
+    AUDIT_RETENTION_MONTHS   - months kept online, including the current one (default 12)
+    AUDIT_ARCHIVE_DIR        - archive directory (default /var/backups/contacts-audit)
+'''
+
+import argparse
+import gzip
+import os
+import re
+import sys
+import tempfile
+from datetime import date
+from typing import Any, List, NamedTuple, Optional
+
+from shared import db
+
+TABLE = 'admin_actions'
+
+DEFAULT_PARTITION = TABLE + '_default'
+
+PARTITION_NAME = re.compile(r'^admin_actions_p(\d{4})(\d{2})$')
+
+
+class Partition(NamedTuple):
+    name: str
+    month: date
+    attached: bool
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def archive_dir() -> str:
+    return os.environ.get('AUDIT_ARCHIVE_DIR', '/var/backups/contacts-audit')
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return '%s_p%04d%02d' % (TABLE, month.year, month.month)
+
+
+def existing(cur: Any) -> List[Partition]:
+    """Every admin_actions_pYYYYMM table, attached or left detached by an interrupted run"""
+    cur.execute("""
+        SELECT c.relname, i.inhparent IS NOT NULL
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = %s::regclass
+        WHERE n.nspname = current_schema() AND c.relkind = 'r' AND c.relname LIKE %s
+    """, (TABLE, TABLE + r'\_p%'))
+    partitions = []
+    for name, attached in cur.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append(Partition(name, date(int(match.group(1)), int(match.group(2)), 1), attached))
+    return sorted(partitions, key=lambda partition: partition.month)
+
+
+def stranded(cur: Any) -> List[date]:
+    """Months with rows in the default partition, i.e. inserted before their partition existed"""
+    cur.execute('SELECT to_regclass(%s) IS NOT NULL', (DEFAULT_PARTITION,))
+    if not cur.fetchone()[0]:
+        return []
+    cur.execute(f"SELECT DISTINCT date_trunc('month', created_at)::date FROM {DEFAULT_PARTITION}")
+    return sorted(row[0] for row in cur.fetchall())
+
+
+def missing(cur: Any, today: date, premake: int) -> List[date]:
+    """Months to create: this one, the next premake ones and any with rows in the default partition"""
+    current = today.replace(day=1)
+    known = {partition.month for partition in existing(cur)}
+    months = {add_months(current, offset) for offset in range(max(premake, 0) + 1)}
+    months.update(stranded(cur))
+    return sorted(month for month in months if month not in known)
+
+
+def ensure(cur: Any, today: date, premake: int) -> List[str]:
+    """Create the partitions for this month and the next premake months; returns the new ones"""
+    moving = set(stranded(cur))
+    created = []
+    for month in missing(cur, today, premake):
+        name = partition_name(month)
+        bounds = (month, add_months(month, 1))
+        if month in moving:
+            # Attaching over rows still in the default partition would fail: move them first,
+            # holding off concurrent inserts into it until the transaction commits
+            cur.execute(f'LOCK TABLE {DEFAULT_PARTITION} IN EXCLUSIVE MODE')
+            cur.execute(f'CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+            cur.execute(f'WITH moved AS (DELETE FROM {DEFAULT_PARTITION} '
+                        'WHERE created_at >= %s AND created_at < %s RETURNING *) '
+                        f'INSERT INTO {name} SELECT * FROM moved', bounds)
+            cur.execute(f'ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)', bounds)
+        else:
+            cur.execute(
+                f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)',
+                bounds
+            )
+        created.append(name)
+    return created
+
+
+def expired(cur: Any, today: date, retention_months: int) -> List[Partition]:
+    """Partitions whose whole month lies before the retention window"""
+    cutoff = add_months(today.replace(day=1), -(max(retention_months, 1) - 1))
+    return [partition for partition in existing(cur) if partition.month < cutoff]
+
+
+def archive(cur: Any, partition: Partition) -> str:
+    """Write the partition as <name>.csv.gz (atomically, fsynced) and return the path"""
+    directory = archive_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, partition.name + '.csv.gz')
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + partition.name + '.')
+    try:
+        with os.fdopen(fd, 'wb') as raw:
+            with gzip.GzipFile(filename=partition.name + '.csv', mode='wb', fileobj=raw, compresslevel=9) as gz:
+                cur.copy_expert(f'COPY (SELECT * FROM {partition.name} ORDER BY created_at, id) '
+                                'TO STDOUT WITH (FORMAT csv, HEADER)', gz)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def retire(conn: Any, partition: Partition) -> str:
+    """Detach, archive and drop one partition; each step commits so a crash can resume"""
+    cur = conn.cursor()
+    try:
+        if partition.attached:
+            cur.execute(f'ALTER TABLE {TABLE} DETACH PARTITION {partition.name}')
+            conn.commit()
+        path = archive(cur, partition)
+        conn.rollback()
+        cur.execute(f'DROP TABLE {partition.name}')
+        conn.commit()
+        return path
+    finally:
+        cur.close()
+
+
+def run(today: Optional[date] = None, premake: Optional[int] = None,
+        retention_months: Optional[int] = None, dry_run: bool = False) -> List[str]:
+    """One maintenance pass; returns a line per action taken (or planned, with dry_run)"""
+    today = today or date.today()
+    premake = _env_int('AUDIT_PARTITION_PREMAKE', 3) if premake is None else premake
+    retention_months = _env_int('AUDIT_RETENTION_MONTHS', 12) if retention_months is None else retention_months
+    log = []
+    with db.connection() as conn:
+        cur = conn.cursor()
+        if dry_run:
+            log.extend('would create ' + partition_name(month) for month in missing(cur, today, premake))
+            log.extend('would archive and drop ' + partition.name for partition in expired(cur, today, retention_months))
+            conn.rollback()
+            cur.close()
+            return log
+        log.extend('created ' + name for name in ensure(cur, today, premake))
+        conn.commit()
+        retired = expired(cur, today, retention_months)
+        conn.rollback()
+        cur.close()
+        for partition in retired:
+            log.append('archived %s to %s and dropped it' % (partition.name, retire(conn, partition)))
+    return log
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Create, archive and drop admin_actions partitions')
+    parser.add_argument('--premake', type=int, help='future months to create (default AUDIT_PARTITION_PREMAKE or 3)')
+    parser.add_argument('--retention', type=int, help='months kept online (default AUDIT_RETENTION_MONTHS or 12)')
+    parser.add_argument('--dry-run', action='store_true', help='only print what would change')
+    args = parser.parse_args(argv)
+    for line in run(premake=args.premake, retention_months=args.retention, dry_run=args.dry_run):
+        print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+'''
+Business: bcrypt hashing and verification on a bounded worker pool, plus login throttling
+bcrypt runs in a process pool sized to the CPU count so a burst of logins cannot
+pin the request workers; where worker processes cannot be created or started it runs
+inline in the calling thread. When more than BCRYPT_MAX_PENDING jobs are in flight new
+ones are rejected immediately with Saturated (handlers answer 429). Failed logins
+are counted per username and per IP; abusive clients are rejected before any hashing.
+
+Configuration (environment):
+    BCRYPT_ROUNDS            - cost factor for new hashes; older hashes are upgraded on login (default 12)
+    BCRYPT_WORKERS           - pool processes, 0 runs bcrypt inline (default CPU count)
+    BCRYPT_MAX_PENDING       - in-flight jobs before rejecting (default 4 per worker)
+    BCRYPT_TIMEOUT           - seconds to wait for a job (default 10)
+    LOGIN_MAX_FAILURES_USER  - failed logins per username per window (default 5)
+    LOGIN_MAX_FAILURES_IP    - failed logins per IP per window (default 20)
+    LOGIN_WINDOW             - throttle window in seconds (default 300)
+'''
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Optional
+
+from shared import metrics
+
+
+class Saturated(Exception):
+    """Raised when the bcrypt pool already has BCRYPT_MAX_PENDING jobs in flight"""
+
+    def __init__(self, retry_after: int = 1):
+        super().__init__('Password hashing capacity exhausted')
+        self.retry_after = retry_after
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def rounds() -> int:
+    return _env_int('BCRYPT_ROUNDS', 12)
+
+
+# bcrypt and the process pool are imported on first use: most requests never hash a password
+def _hash(password: str, cost: int) -> str:
+    import bcrypt
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=cost)).decode('utf-8')
+
+
+def _check(password: str, password_hash: str) -> bool:
+    import bcrypt
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # Not a bcrypt hash (e.g. the legacy sha256 seed in V1__init_schema.sql)
+        return False
+
+
+_pool_lock = threading.Lock()
+_pool: Optional[Any] = None
+_pool_pid: Optional[int] = None
+_slots: Optional[threading.BoundedSemaphore] = None
+# Process whose runtime could not start pool workers; it hashes inline from then on
+_unavailable_pid: Optional[int] = None
+
+
+def _workers() -> int:
+    return _env_int('BCRYPT_WORKERS', os.cpu_count() or 1)
+
+
+def _get_pool() -> Optional[Any]:
+    global _pool, _pool_pid, _slots, _unavailable_pid
+    if _workers() <= 0 or _unavailable_pid == os.getpid():
+        return None
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            from concurrent.futures import ProcessPoolExecutor
+            from multiprocessing import get_context
+            workers = _workers()
+            try:
+                # spawn: the parent runs cache/audit threads, forking it is unsafe
+                _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context('spawn'))
+            except (OSError, NotImplementedError):
+                # No process support in this runtime (some serverless sandboxes)
+                _pool = None
+                _unavailable_pid = os.getpid()
+            _pool_pid = os.getpid()
+            _slots = threading.BoundedSemaphore(_env_int('BCRYPT_MAX_PENDING', workers * 4))
+    return _pool
+
+
+def _disable_pool(pool: Any) -> None:
+    """Drop a pool whose workers cannot run and hash inline in this process from now on"""
+    global _pool, _unavailable_pid
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+        _unavailable_pid = os.getpid()
+    try:
+        pool.shutdown(wait=False)
+    except Exception:
+        pass
+
+
+def _run(func: Any, *args: Any) -> Any:
+    pool = _get_pool()
+    if pool is None:
+        with metrics.phase('bcrypt'):
+            return func(*args)
+    from concurrent.futures.process import BrokenProcessPool
+    if not _slots.acquire(blocking=False):
+        raise Saturated()
+    try:
+        with metrics.phase('bcrypt'):
+            # Workers only start on the first submit(): a runtime without working fork or
+            # semaphores fails here rather than when the executor is constructed
+            return pool.submit(func, *args).result(timeout=_env_int('BCRYPT_TIMEOUT', 10))
+    except (BrokenProcessPool, OSError):
+        _disable_pool(pool)
+    finally:
+        _slots.release()
+    with metrics.phase('bcrypt'):
+        return func(*args)
+
+
+def hash_password(password: str) -> str:
+    """bcrypt hash at the configured cost factor"""
+    return _run(_hash, password, rounds())
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Verify password against bcrypt hash off the request thread"""
+    return _run(_check, password, password_hash)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """True when the hash was made with a different cost factor than BCRYPT_ROUNDS"""
+    parts = password_hash.split('$')
+    if len(parts) < 4 or not parts[2].isdigit():
+        return True
+    return int(parts[2]) != rounds()
+
+
+class AttemptLimiter:
+    """Sliding-window failure counter per key with bounded memory"""
+
+    def __init__(self, max_failures: int, window: float, max_keys: int = 10000):
+        self.max_failures = max_failures
+        self.window = window
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._failures: 'OrderedDict[str, Deque[float]]' = OrderedDict()
+
+    def _prune(self, key: str, now: float) -> Optional[Deque[float]]:
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and now - failures[0] >= self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def retry_after(self, key: str) -> int:
+        """Seconds until key may try again, 0 when allowed"""
+        if not key or self.max_failures <= 0:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            failures = self._prune(key, now)
+            if failures is None or len(failures) < self.max_failures:
+                return 0
+            return max(1, int(self.window - (now - failures[0])) + 1)
+
+    def fail(self, key: str) -> None:
+        if not key:
+            return
+        now = time.monotonic()
+        with self._lock:
+            failures = self._prune(key, now)
+            if failures is None:
+                failures = deque()
+                self._failures[key] = failures
+            failures.append(now)
+            self._failures.move_to_end(key)
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+login_by_username = AttemptLimiter(
+    _env_int('LOGIN_MAX_FAILURES_USER', 5), _env_int('LOGIN_WINDOW', 300)
+)
+login_by_ip = AttemptLimiter(
+    _env_int('LOGIN_MAX_FAILURES_IP', 20), _env_int('LOGIN_WINDOW', 300)
+)
@@ -0,0 +1,207 @@
+'''
+Business: Catalog of the SQL statements run by the handlers, prepared once per connection
+Every statement of contacts, auth, users, settings and audit (and of the session, cache and
+snapshot helpers they call) lives in CATALOG under a name. execute() sends PREPARE the
+first time a pooled connection meets a statement and EXECUTE name(...) afterwards, so
+Postgres parses and plans it once per session instead of once per request.
+
+Statements whose shape depends on the request (the columns of a partial update, the
+filters of an audit page) are templates; the caller fills the {placeholders} with SQL
+fragments and each distinct result is prepared under its own name. Values always go
+through %s parameters. Columns are listed explicitly, so adding a column to a table
+changes neither the responses nor the result type of an already prepared plan.
+
+Per-statement calls, time and rows are kept for the slow-query report on /_health and
+/_metrics.
+
+Configuration (environment):
+    DB_PREPARE     - 0 sends the statement text instead (e.g. behind pgbouncer in transaction mode) (default 1)
+    QUERY_SLOW_MS  - log statements slower than this to stderr; unset disables
+'''
+
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+CONTACT_COLUMNS = ('id, title, description, telegram_link, display_order, created_at, '
+                   'avatar_url, avatar_variants, row_version, updated_at')
+
+SETTINGS_COLUMNS = ('id, main_title, main_description, background_image_url, created_at, updated_at, '
+                    'background_variants, row_version')
+
+AUDIT_COLUMNS = 'id, admin_username, action_type, target_type, target_id, details, ip_address, created_at'
+
+CATALOG: Dict[str, str] = {
+    # contacts
+    'contacts.list': f'SELECT {CONTACT_COLUMNS} FROM contacts ORDER BY display_order ASC',
+    'contacts.changed_since':
+        f'SELECT {CONTACT_COLUMNS} FROM contacts WHERE row_version >= %s ORDER BY display_order ASC',
+    'contacts.deleted_since': 'SELECT contact_id FROM contacts_tombstones WHERE row_version >= %s',
+    'contacts.sync_mark': 'SELECT txid_snapshot_xmin(txid_current_snapshot())',
+    'contacts.version': 'SELECT title, row_version FROM contacts WHERE id = %s',
+    'contacts.insert':
+        'INSERT INTO contacts (title, description, telegram_link, display_order) VALUES (%s, %s, %s, %s) RETURNING id',
+    'contacts.patch':
+        'UPDATE contacts SET {assignments} WHERE id = %s AND ({differs}){condition} RETURNING title, row_version',
+    'contacts.reorder':
+        '''UPDATE contacts AS c
+           SET display_order = v.display_order
+           FROM unnest(%s::integer[], %s::integer[]) AS v(id, display_order)
+           WHERE c.id = v.id AND c.display_order IS DISTINCT FROM v.display_order
+           RETURNING c.id''',
+    'contacts.delete': 'DELETE FROM contacts WHERE id = %s',
+
+    # settings
+    'settings.get': f'SELECT {SETTINGS_COLUMNS} FROM page_settings ORDER BY id LIMIT 1',
+    'settings.version': 'SELECT main_title, row_version FROM page_settings ORDER BY id LIMIT 1',
+    'settings.upsert':
+        '''INSERT INTO page_settings AS p (id, {names})
+           VALUES (COALESCE((SELECT min(id) FROM page_settings),
+                            nextval(pg_get_serial_sequence('page_settings', 'id'))), {values})
+           ON CONFLICT (id) DO UPDATE SET {assignments}
+           WHERE ({differs}){condition}
+           RETURNING p.main_title, p.row_version''',
+
+    # users and auth
+    'users.credentials': 'SELECT id, username, role, password_hash FROM users WHERE username = %s',
+    'users.list': 'SELECT id, username, role FROM users ORDER BY id',
+    'users.exists': 'SELECT id FROM users WHERE username = %s',
+    'users.role': 'SELECT id, role FROM users WHERE username = %s',
+    'users.insert': 'INSERT INTO users (username, password_hash, role) VALUES (%s, %s, %s) RETURNING id',
+    'users.delete': 'DELETE FROM users WHERE username = %s',
+    'users.set_password': 'UPDATE users SET password_hash = %s WHERE id = %s',
+
+    # sessions
+    'sessions.lookup':
+        '''SELECT s.user_id, u.username, u.role, s.expires_at,
+                  EXTRACT(EPOCH FROM s.expires_at - CURRENT_TIMESTAMP) AS remaining
+           FROM sessions s
+           JOIN users u ON u.id = s.user_id
+           WHERE s.token = %s AND s.expires_at > CURRENT_TIMESTAMP''',
+    'sessions.insert':
+        '''INSERT INTO sessions (user_id, token, expires_at)
+           VALUES (%s, %s, CURRENT_TIMESTAMP + %s::integer * INTERVAL '1 second')
+           RETURNING expires_at''',
+    'sessions.revoke': 'DELETE FROM sessions WHERE token = ANY(%s)',
+    'sessions.revoke_user': 'DELETE FROM sessions WHERE user_id = %s',
+    'sessions.sweep':
+        '''DELETE FROM sessions
+           WHERE id IN (
+               SELECT id FROM sessions
+               WHERE expires_at <= CURRENT_TIMESTAMP
+               LIMIT %s
+           )''',
+
+    # response cache versions
+    'cache.version': 'SELECT version FROM cache_versions WHERE namespace = %s',
+    'cache.bump':
+        '''INSERT INTO cache_versions (namespace, version, updated_at)
+           VALUES (%s, 1, CURRENT_TIMESTAMP)
+           ON CONFLICT (namespace) DO UPDATE
+           SET version = cache_versions.version + 1, updated_at = CURRENT_TIMESTAMP
+           RETURNING version''',
+    'cache.notify': 'SELECT pg_notify(%s, %s)',
+
+    # audit journal
+    'audit.page':
+        f'''SELECT {AUDIT_COLUMNS}
+            FROM admin_actions
+            {{where}}
+            ORDER BY created_at DESC, id DESC
+            LIMIT %s''',
+}
+
+_PLACEHOLDER = re.compile(r'%(%|s)')
+
+_lock = threading.Lock()
+# statement name -> [calls, total seconds, max seconds, rows]
+_stats: Dict[str, List[float]] = {}
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    try:
+        value = os.environ.get(name)
+        return default if value in (None, '') else float(value)
+    except ValueError:
+        return default
+
+
+def _numbered(sql: str) -> str:
+    """%s placeholders as $1, $2, ... and %% as a literal %, as PREPARE expects them"""
+    counter = iter(range(1, sql.count('%s') + 1))
+    return _PLACEHOLDER.sub(lambda match: '%' if match.group(1) == '%' else '$%d' % next(counter), sql)
+
+
+def _statement_name(sql: str) -> str:
+    # Named by content: each filled-in template gets its own prepared statement
+    return 'q_' + hashlib.blake2b(sql.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def text(name: str, **parts: str) -> str:
+    """Statement text of name, with template placeholders filled from parts"""
+    sql = CATALOG[name]
+    return sql.format(**parts) if parts else sql
+
+
+def execute(cur: Any, name: str, params: Sequence[Any] = (), **parts: str) -> Any:
+    """
+    Run catalog statement name on cur with params; rows are fetched from cur as usual.
+    The first call on a connection prepares it, later calls only send EXECUTE.
+    """
+    sql = text(name, **parts)
+    params = tuple(params)
+    conn = cur.connection
+    prepared = getattr(conn, 'prepared', None)
+    started = time.perf_counter()
+    if prepared is None or os.environ.get('DB_PREPARE', '1') == '0':
+        result = cur.execute(sql, params) if params else cur.execute(sql)
+    else:
+        statement = _statement_name(sql)
+        if statement not in prepared:
+            # Not transactional: the statement outlives a rollback of the surrounding transaction
+            cur.execute('PREPARE %s AS %s' % (statement, _numbered(sql)))
+            prepared.add(statement)
+        if params:
+            result = cur.execute('EXECUTE %s (%s)' % (statement, ', '.join(['%s'] * len(params))), params)
+        else:
+            result = cur.execute('EXECUTE %s' % statement)
+    _observe(name, time.perf_counter() - started, cur.rowcount)
+    return result
+
+
+def _observe(name: str, elapsed: float, rows: int) -> None:
+    with _lock:
+        entry = _stats.get(name)
+        if entry is None:
+            entry = _stats[name] = [0, 0.0, 0.0, 0]
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] = max(entry[2], elapsed)
+        if rows > 0:
+            entry[3] += rows
+    slow_ms = _env_float('QUERY_SLOW_MS', None)
+    if slow_ms is not None and elapsed * 1000 >= slow_ms:
+        sys.stderr.write('slow-query %s %.1fms %d rows\n' % (name, elapsed * 1000, rows))
+        sys.stderr.flush()
+
+
+def report(limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Statements of this process by total time spent, slowest first"""
+    with _lock:
+        entries = [(name, list(entry)) for name, entry in _stats.items()]
+    entries.sort(key=lambda item: -item[1][1])
+    return [
+        {
+            'statement': name,
+            'calls': int(calls),
+            'total_ms': round(total * 1000, 3),
+            'mean_ms': round(total * 1000 / calls, 3) if calls else 0.0,
+            'max_ms': round(longest * 1000, 3),
+            'rows': int(rows),
+        }
+        for name, (calls, total, longest, rows) in entries[:limit]
+    ]
@@ -0,0 +1,187 @@
+'''
+Business: Token-bucket rate limits shared by every worker process through a memory-mapped table
+Each (route, key) pair - usually the client IP, or the username for login - owns a bucket
+holding up to burst tokens that refill at rate per second; a request takes one token or is
+answered 429 with Retry-After. Buckets live in a file-backed mmap (on /dev/shm by default),
+so the gunicorn workers enforce one shared limit without a database round-trip or an
+outside service. The table is split into groups of GROUP_SLOTS buckets; a key hashes to one
+group, which is guarded by a byte-range lockf on the file plus a thread lock, and a full
+group evicts its least recently used bucket. Without a usable file (e.g. in the function
+gateway) the table is an anonymous mapping and limits are per process.
+
+Configuration (environment):
+    RATE_LIMITS       - per-route "route=rate/burst" overrides, comma-separated; rate 0 disables a route
+                        (default contacts=20/100,settings=20/100,auth=2/20,login=0.1/5)
+    RATE_LIMIT_SLOTS  - buckets in the shared table (default 8192)
+    RATE_LIMIT_PATH   - backing file (default /dev/shm/contacts-ratelimit, or the temp dir)
+'''
+
+import fcntl
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+# Requests per second and bucket size per route
+DEFAULT_LIMITS = {
+    'contacts': (20.0, 100.0),
+    'settings': (20.0, 100.0),
+    'auth': (2.0, 20.0),
+    'login': (0.1, 5.0),
+}
+
+# key hash, tokens left, time of last update (CLOCK_MONOTONIC is shared by all processes)
+SLOT = struct.Struct('<Qdd')
+GROUP_SLOTS = 8
+GROUP_SIZE = SLOT.size * GROUP_SLOTS
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def limits() -> Dict[str, Tuple[float, float]]:
+    """DEFAULT_LIMITS with the RATE_LIMITS overrides applied"""
+    result = dict(DEFAULT_LIMITS)
+    for item in os.environ.get('RATE_LIMITS', '').split(','):
+        route, _, spec = item.strip().partition('=')
+        rate, _, burst = spec.partition('/')
+        try:
+            result[route.strip()] = (float(rate), float(burst or rate))
+        except ValueError:
+            continue
+    return result
+
+
+class Table:
+    """Fixed-size bucket table in a shared mapping"""
+
+    def __init__(self, groups: int, path: Optional[str]):
+        self.groups = max(groups, 1)
+        self.size = self.groups * GROUP_SIZE
+        self.path = path
+        self.fd: Optional[int] = None
+        self._locks = [threading.Lock() for _ in range(min(self.groups, 64))]
+        if path:
+            try:
+                self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+                fcntl.lockf(self.fd, fcntl.LOCK_EX)
+                try:
+                    # Only ever grown: shrinking would fault processes that still map the old size
+                    if os.fstat(self.fd).st_size < self.size:
+                        os.ftruncate(self.fd, self.size)
+                finally:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN)
+                self.map = mmap.mmap(self.fd, self.size, mmap.MAP_SHARED)
+                return
+            except OSError:
+                if self.fd is not None:
+                    os.close(self.fd)
+                self.fd = None
+        self.map = mmap.mmap(-1, self.size)
+
+    def take(self, key_hash: int, rate: float, burst: float, now: float) -> float:
+        """Take one token from the bucket; 0 when allowed, else seconds until a token is available"""
+        group = key_hash % self.groups
+        offset = group * GROUP_SIZE
+        with self._locks[group % len(self._locks)]:
+            if self.fd is not None:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, GROUP_SIZE, offset)
+            try:
+                slot, tokens, updated = self._find(offset, key_hash, burst, now)
+                tokens = min(burst, tokens + (now - updated) * rate)
+                if tokens >= 1.0:
+                    wait = 0.0
+                    tokens -= 1.0
+                else:
+                    wait = (1.0 - tokens) / rate
+                SLOT.pack_into(self.map, slot, key_hash, tokens, now)
+                return wait
+            finally:
+                if self.fd is not None:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, GROUP_SIZE, offset)
+
+    def _find(self, offset: int, key_hash: int, burst: float, now: float) -> Tuple[int, float, float]:
+        """Slot of key_hash in its group, else an empty or the least recently used slot with a full bucket"""
+        victim, victim_updated = offset, math.inf
+        for slot in range(offset, offset + GROUP_SIZE, SLOT.size):
+            stored_hash, tokens, updated = SLOT.unpack_from(self.map, slot)
+            if stored_hash == key_hash:
+                return slot, tokens, updated
+            if stored_hash == 0:
+                updated = -math.inf
+            if updated < victim_updated:
+                victim, victim_updated = slot, updated
+        return victim, burst, now
+
+
+_table: Optional[Table] = None
+_table_pid: Optional[int] = None
+_table_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _default_path() -> str:
+    if os.path.isdir('/dev/shm'):
+        return '/dev/shm/contacts-ratelimit'
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), 'contacts-ratelimit')
+
+
+def _get_table() -> Table:
+    global _table, _table_pid
+    if _table is not None and _table_pid == os.getpid():
+        return _table
+    with _table_lock:
+        if _table is None or _table_pid != os.getpid():
+            # lockf locks are not inherited across fork, so each worker opens its own handle
+            slots = max(_env_int('RATE_LIMIT_SLOTS', 8192), GROUP_SLOTS)
+            _table = Table(slots // GROUP_SLOTS, os.environ.get('RATE_LIMIT_PATH', _default_path()))
+            _table_pid = os.getpid()
+    return _table
+
+
+def _hash(route: str, key: str) -> int:
+    digest = hashlib.blake2b(('%s\0%s' % (route, key)).encode('utf-8'), digest_size=8).digest()
+    # 0 marks an empty slot
+    return int.from_bytes(digest, 'little') or 1
+
+
+def check(route: str, key: str) -> int:
+    """Count one request of key against route; 0 when allowed, else the Retry-After in whole seconds"""
+    rate, burst = limits().get(route, (0.0, 0.0))
+    if not key or rate <= 0 or burst < 1:
+        return 0
+    wait = _get_table().take(_hash(route, key), rate, burst, time.monotonic())
+    counters = _stats.setdefault(route, {'allowed': 0, 'limited': 0})
+    if wait <= 0:
+        counters['allowed'] += 1
+        return 0
+    counters['limited'] += 1
+    return max(1, math.ceil(wait))
+
+
+def too_many_requests(headers: Dict[str, str], retry_after: int,
+                      message: str = 'Too many requests') -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {**headers, 'Retry-After': str(retry_after)},
+        'body': json.dumps({'error': message}),
+        'isBase64Encoded': False
+    }
+
+
+def stats() -> Dict[str, Any]:
+    table = _table if _table_pid == os.getpid() else None
+    return {
+        'routes': {route: dict(counters) for route, counters in list(_stats.items())},
+        'shared': bool(table is not None and table.fd is not None),
+    }
@@ -0,0 +1,244 @@
+'''
+Business: HTTP validators, cache headers and content-coding for handler responses
+ETags are derived from the cache_versions counter, so a matching If-None-Match can be
+answered with 304 before the data is queried or serialized.
+
+@compressible wraps a handler: text bodies of at least RESPONSE_COMPRESS_MIN_BYTES are
+compressed with the best coding the client accepts (br when the brotli package is
+installed, else gzip) and returned base64-encoded with Content-Encoding and Vary, which
+both the function gateway and server.py decode into a binary body. A compressed 200 GET
+carrying an ETag is kept per (ETag, coding), so cached public pages are compressed once
+per version instead of once per request; its ETag becomes weak, as the bytes differ from
+the identity representation.
+
+Configuration (environment):
+    HTTP_CACHE_MAX_AGE           - browser max-age in seconds (default 0, always revalidate)
+    HTTP_CACHE_SWR               - stale-while-revalidate window in seconds (default 30)
+    HTTP_CACHE_PROXY_MAX_AGE     - X-Accel-Expires for the nginx proxy cache (default 5)
+    RESPONSE_COMPRESS_MIN_BYTES  - smallest body worth compressing; 0 disables compression (default 1024)
+    RESPONSE_COMPRESS_CACHE      - compressed ETag-tagged bodies kept per process (default 32)
+'''
+
+import base64
+import functools
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Content types worth compressing; images and exports are already compressed or streamed
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/x-ndjson')
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def get_header(event: Dict[str, Any], name: str) -> str:
+    """Case-insensitive request header lookup"""
+    headers = event.get('headers') or {}
+    value = headers.get(name)
+    if value is None:
+        lowered = name.lower()
+        for key, item in headers.items():
+            if key.lower() == lowered:
+                value = item
+                break
+    return value or ''
+
+
+def etag_for(namespace: str, version: int) -> str:
+    """Strong ETag for the representation of namespace at version"""
+    return '"%s-%d"' % (namespace, version)
+
+
+def if_none_match(event: Dict[str, Any], etag: str) -> bool:
+    """True when the request's If-None-Match matches etag (weak comparison per RFC 9110)"""
+    header = get_header(event, 'If-None-Match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    for candidate in header.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def expected_version(event: Dict[str, Any], body: Dict[str, Any]) -> Optional[int]:
+    """Row version a write is conditional on: If-Match: "<row_version>" or body "version"; None if absent"""
+    header = get_header(event, 'If-Match').strip()
+    value: Any = None
+    if header and header != '*':
+        value = header[2:] if header.startswith('W/') else header
+        value = value.strip('"')
+    elif body.get('version') is not None:
+        value = body['version']
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('If-Match / version must be a row version')
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    """Validator and freshness headers for cacheable public GET responses"""
+    max_age = _env_int('HTTP_CACHE_MAX_AGE', 0)
+    swr = _env_int('HTTP_CACHE_SWR', 30)
+    cache_control = 'public, max-age=%d' % max_age
+    if max_age == 0:
+        cache_control += ', must-revalidate'
+    if swr > 0:
+        cache_control += ', stale-while-revalidate=%d' % swr
+    return {
+        'ETag': etag,
+        'Cache-Control': cache_control,
+        'X-Accel-Expires': str(_env_int('HTTP_CACHE_PROXY_MAX_AGE', 5)),
+    }
+
+
+def not_modified(headers: Dict[str, str], etag: str) -> Dict[str, Any]:
+    """304 response carrying the same validators as the full response"""
+    return {
+        'statusCode': 304,
+        'headers': {**headers, **cache_headers(etag)},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+
+_compressed_lock = threading.Lock()
+# (etag, coding, identity length) -> base64 of the compressed body
+_compressed: 'OrderedDict[Tuple[str, str, int], str]' = OrderedDict()
+_compression_stats = {'compressed': 0, 'reused': 0, 'bytes_in': 0, 'bytes_out': 0}
+_brotli: Any = None
+
+
+def _load_brotli() -> Any:
+    """The brotli module, or False when it is not installed; imported on first use"""
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli
+
+
+def accepted_coding(event: Dict[str, Any]) -> Optional[str]:
+    """'br' or 'gzip' from the request's Accept-Encoding (honouring q=0), None for identity"""
+    header = get_header(event, 'Accept-Encoding')
+    if not header:
+        return None
+    weights: Dict[str, float] = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        weight = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[coding.strip().lower()] = weight
+    wildcard = weights.get('*', 0.0)
+    candidates = [('br', weights.get('br', wildcard)), ('gzip', weights.get('gzip', wildcard))]
+    if candidates[0][1] > 0 and not _load_brotli():
+        candidates = candidates[1:]
+    coding, weight = max(candidates, key=lambda item: item[1])
+    return coding if weight > 0 else None
+
+
+def _encode(data: bytes, coding: str) -> bytes:
+    if coding == 'br':
+        # Quality 5 compresses JSON close to gzip -9 at a fraction of the CPU of 11
+        return _load_brotli().compress(data, quality=5)
+    import gzip
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _append_vary(headers: Dict[str, str]) -> None:
+    for key in list(headers):
+        if key.lower() == 'vary':
+            if 'accept-encoding' not in headers[key].lower():
+                headers[key] = headers[key] + ', Accept-Encoding'
+            return
+    headers['Vary'] = 'Accept-Encoding'
+
+
+def compress(event: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+    """Content-code result's body for the client when it is text and large enough"""
+    min_bytes = _env_int('RESPONSE_COMPRESS_MIN_BYTES', 1024)
+    body = result.get('body')
+    if min_bytes <= 0 or result.get('isBase64Encoded') or not isinstance(body, (str, bytes)):
+        return result
+    headers = dict(result.get('headers') or {})
+    lowered = {key.lower(): value for key, value in headers.items()}
+    content_type = lowered.get('content-type', '')
+    if 'content-encoding' in lowered or not content_type.startswith(COMPRESSIBLE_TYPES):
+        return result
+    data = body.encode('utf-8') if isinstance(body, str) else body
+    if len(data) < min_bytes:
+        return result
+    _append_vary(headers)
+    coding = accepted_coding(event)
+    if coding is None:
+        return {**result, 'headers': headers}
+
+    etag = lowered.get('etag')
+    key = None
+    if etag and event.get('httpMethod', 'GET') == 'GET' and int(result.get('statusCode', 200)) == 200:
+        key = (etag, coding, len(data))
+    encoded = None
+    if key is not None:
+        with _compressed_lock:
+            encoded = _compressed.get(key)
+            if encoded is not None:
+                _compressed.move_to_end(key)
+                _compression_stats['reused'] += 1
+    if encoded is None:
+        packed = _encode(data, coding)
+        if len(packed) >= len(data):
+            return {**result, 'headers': headers}
+        encoded = base64.b64encode(packed).decode('ascii')
+        with _compressed_lock:
+            _compression_stats['compressed'] += 1
+            _compression_stats['bytes_in'] += len(data)
+            _compression_stats['bytes_out'] += len(packed)
+            limit = _env_int('RESPONSE_COMPRESS_CACHE', 32)
+            if key is not None and limit > 0:
+                _compressed[key] = encoded
+                while len(_compressed) > limit:
+                    _compressed.popitem(last=False)
+
+    headers['Content-Encoding'] = coding
+    for name, value in list(headers.items()):
+        if name.lower() == 'etag' and not value.startswith('W/'):
+            headers[name] = 'W/' + value
+    return {**result, 'headers': headers, 'body': encoded, 'isBase64Encoded': True}
+
+
+def compressible(handler: Callable[[Dict[str, Any], Any], Dict[str, Any]]) -> Callable:
+    """Decorator for handler(event, context) applying compress() to every response"""
+
+    @functools.wraps(handler)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        return compress(event, handler(event, context))
+
+    return wrapper
+
+
+def compression_stats() -> Dict[str, Any]:
+    with _compressed_lock:
+        data = dict(_compression_stats)
+        data['cached'] = len(_compressed)
+        return data
@@ -0,0 +1,90 @@
+'''
+Business: Fast JSON serialization of query results
+Handlers fetch plain tuples, map cur.description to keys once per query and encode
+straight to UTF-8 bytes. orjson is used when installed (datetimes, dates and Decimals
+are encoded natively); otherwise a precompiled stdlib encoder with a single default
+hook is used. Both produce the same document: ISO-8601 datetimes, non-ASCII text kept
+as UTF-8.
+
+Configuration (environment):
+    JSON_BACKEND  - auto (default), orjson or stdlib
+'''
+
+import json
+import os
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from shared import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, memoryview):
+        return obj.tobytes().decode('utf-8')
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+_encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def backend() -> str:
+    choice = os.environ.get('JSON_BACKEND', 'auto')
+    if choice == 'stdlib' or orjson is None:
+        return 'stdlib'
+    return 'orjson'
+
+
+def _orjson_default(obj: Any) -> Any:
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return _default(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """Encode obj as UTF-8 JSON bytes with the configured backend"""
+    if orjson is not None and backend() == 'orjson':
+        return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+    return _encoder.encode(obj).encode('utf-8')
+
+
+def columns(cur: Any) -> Tuple[str, ...]:
+    """Result column names of the last statement on cur"""
+    return tuple(column[0] for column in cur.description or ())
+
+
+def records(cur: Any, rows: Optional[Sequence[Sequence[Any]]] = None) -> List[Dict[str, Any]]:
+    """Tuple rows (fetched from cur unless given) as dicts keyed by the query's columns"""
+    keys = columns(cur)
+    if rows is None:
+        rows = cur.fetchall()
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def record(cur: Any, row: Optional[Sequence[Any]]) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    return dict(zip(columns(cur), row))
+
+
+def rows_json(cur: Any, rows: Optional[Sequence[Sequence[Any]]] = None) -> bytes:
+    """Fetch the remaining rows of cur and encode them as a JSON array of objects"""
+    if rows is None:
+        rows = cur.fetchall()
+    with metrics.phase('serialize'):
+        return dumps(records(cur, rows))
+
+
+def encode(obj: Any) -> bytes:
+    """dumps() attributed to the serialize phase of the current request"""
+    with metrics.phase('serialize'):
+        return dumps(obj)
@@ -0,0 +1,164 @@
+'''
+Business: Session tokens backed by the sessions table with an in-memory verification cache
+Tokens are stored as SHA-256 digests, so a leaked sessions table cannot be replayed.
+Recently verified tokens are kept in a small LRU, so admin-heavy workflows such as
+drag-reorder do not pay a database round-trip per request.
+
+Configuration (environment):
+    SESSION_TTL            - session lifetime in seconds (default 604800, one week)
+    SESSION_CACHE_SIZE     - verified tokens kept per process (default 256)
+    SESSION_CACHE_TTL      - seconds a verification is trusted before re-checking (default 30)
+    SESSION_SWEEP_INTERVAL - minimum seconds between expired-session sweeps (default 3600)
+'''
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, NamedTuple, Optional, Tuple
+
+from shared import db, queries
+
+
+class Session(NamedTuple):
+    user_id: int
+    username: str
+    role: str
+    expires_at: datetime
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+_lock = threading.Lock()
+# token digest -> (session, trusted_until on the monotonic clock)
+_verified: 'OrderedDict[str, Tuple[Session, float]]' = OrderedDict()
+_last_sweep = 0.0
+
+
+def _digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def get_token(event: Dict[str, Any]) -> str:
+    """Read X-Auth-Token regardless of header case"""
+    headers = event.get('headers') or {}
+    token = headers.get('X-Auth-Token') or headers.get('x-auth-token')
+    if token is None:
+        for key, value in headers.items():
+            if key.lower() == 'x-auth-token':
+                token = value
+                break
+    return token or ''
+
+
+def _remember(digest: str, session: Session, remaining: float) -> None:
+    limit = _env_int('SESSION_CACHE_SIZE', 256)
+    if limit <= 0:
+        return
+    trusted_until = time.monotonic() + min(_env_int('SESSION_CACHE_TTL', 30), remaining)
+    with _lock:
+        _verified[digest] = (session, trusted_until)
+        _verified.move_to_end(digest)
+        while len(_verified) > limit:
+            _verified.popitem(last=False)
+
+
+def _forget(digests: Iterable[str]) -> None:
+    with _lock:
+        for digest in digests:
+            _verified.pop(digest, None)
+
+
+def _lookup(cur: Any, digest: str) -> Tuple[Optional[Session], float]:
+    queries.execute(cur, 'sessions.lookup', (digest,))
+    row = cur.fetchone()
+    if not row:
+        return None, 0.0
+    if isinstance(row, dict):
+        row = (row['user_id'], row['username'], row['role'], row['expires_at'], row['remaining'])
+    return Session(*row[:4]), float(row[4])
+
+
+def verify(token: str, cur: Any = None) -> Optional[Session]:
+    """Return the live session for token, consulting the LRU before the database"""
+    if not token:
+        return None
+    digest = _digest(token)
+    with _lock:
+        cached = _verified.get(digest)
+        if cached is not None:
+            session, trusted_until = cached
+            if time.monotonic() < trusted_until:
+                _verified.move_to_end(digest)
+                return session
+            del _verified[digest]
+    if cur is not None:
+        session, remaining = _lookup(cur, digest)
+    else:
+        with db.connection() as conn:
+            lookup_cur = conn.cursor()
+            session, remaining = _lookup(lookup_cur, digest)
+            lookup_cur.close()
+    if session is not None:
+        _remember(digest, session, remaining)
+    return session
+
+
+def authenticate(event: Dict[str, Any], cur: Any = None) -> Optional[Session]:
+    """Session for the request's X-Auth-Token, or None when missing, unknown or expired"""
+    return verify(get_token(event), cur)
+
+
+def issue(cur: Any, user_id: int, username: str, role: str) -> Tuple[str, datetime]:
+    """Create a session inside the caller's transaction and return (token, expires_at)"""
+    token = secrets.token_urlsafe(32)
+    digest = _digest(token)
+    ttl = _env_int('SESSION_TTL', 604800)
+    queries.execute(cur, 'sessions.insert', (user_id, digest, ttl))
+    row = cur.fetchone()
+    expires_at = row['expires_at'] if isinstance(row, dict) else row[0]
+    _remember(digest, Session(user_id, username, role, expires_at), ttl)
+    return token, expires_at
+
+
+def revoke(cur: Any, tokens: Iterable[str]) -> int:
+    """Delete the given sessions in one statement; returns the number removed"""
+    digests = [_digest(token) for token in tokens if token]
+    if not digests:
+        return 0
+    _forget(digests)
+    queries.execute(cur, 'sessions.revoke', (digests,))
+    return cur.rowcount
+
+
+def revoke_user(cur: Any, user_id: int) -> int:
+    """Delete every session of a user, e.g. before the user itself is deleted"""
+    with _lock:
+        stale = [digest for digest, (session, _) in _verified.items() if session.user_id == user_id]
+    _forget(stale)
+    queries.execute(cur, 'sessions.revoke_user', (user_id,))
+    return cur.rowcount
+
+
+def sweep_expired(cur: Any, batch_size: int = 5000) -> int:
+    """Delete expired sessions in batches, at most once per SESSION_SWEEP_INTERVAL per process"""
+    global _last_sweep
+    now = time.monotonic()
+    with _lock:
+        if _last_sweep and now - _last_sweep < _env_int('SESSION_SWEEP_INTERVAL', 3600):
+            return 0
+        _last_sweep = now
+    removed = 0
+    while True:
+        queries.execute(cur, 'sessions.sweep', (batch_size,))
+        removed += cur.rowcount
+        if cur.rowcount < batch_size:
+            return removed
@@ -0,0 +1,171 @@
+'''
+Business: Precomputed static snapshot of the public page (contacts + page settings)
+After a successful write in contacts or settings, schedule() rebuilds one combined JSON
+document (plus .gz and, when the brotli package is installed, .br variants) and writes
+it atomically into SNAPSHOT_DIR, which nginx serves directly. Bursts of edits such as
+a drag reorder are debounced into a single rebuild.
+
+The debounce is per process, so rebuilds from several workers can finish out of order.
+Each document carries a version (the sum of the contacts and settings cache versions,
+read before the data), and the three files are replaced together under an fcntl lock
+only when the new document is not older than the published one.
+
+Rebuild from the database by hand:
+    cd backend && python -m shared.snapshot
+
+Configuration (environment):
+    SNAPSHOT_DIR       - output directory; unset disables snapshots (e.g. serverless)
+    SNAPSHOT_DEBOUNCE  - seconds to wait for further edits before rebuilding (default 0.5)
+'''
+
+import fcntl
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from shared import cache, db, queries, serialization
+
+FILENAME = 'public.json'
+
+DEFAULT_SETTINGS = {
+    'id': 1,
+    'main_title': 'Мои контакты',
+    'main_description': 'Свяжитесь со мной в Telegram',
+    'background_image_url': None
+}
+
+_lock = threading.Lock()
+_timer: Optional[threading.Timer] = None
+_stats = {'scheduled': 0, 'written': 0, 'superseded': 0, 'errors': 0}
+
+
+def snapshot_dir() -> Optional[str]:
+    return os.environ.get('SNAPSHOT_DIR') or None
+
+
+def build(cur: Any) -> Dict[str, Any]:
+    """Combined document with the same shapes as GET /contacts and GET /settings"""
+    # Versions only grow and are bumped in the writing transaction: read before the data,
+    # they never claim more than the document contains
+    version = cache.current_version(cur, 'contacts') + cache.current_version(cur, 'settings')
+    queries.execute(cur, 'contacts.list')
+    contacts = serialization.records(cur)
+    queries.execute(cur, 'settings.get')
+    settings = serialization.record(cur, cur.fetchone())
+    return {
+        'contacts': contacts,
+        'settings': settings or DEFAULT_SETTINGS,
+        'generated_at': datetime.now().isoformat(),
+        'version': version
+    }
+
+
+def _atomic_write(directory: str, name: str, data: bytes) -> None:
+    import tempfile
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + name, dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, os.path.join(directory, name))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def published_version(directory: str) -> Optional[int]:
+    """Version of the public.json currently in directory (None when absent or unversioned)"""
+    try:
+        with open(os.path.join(directory, FILENAME), 'rb') as fh:
+            version = json.loads(fh.read()).get('version')
+    except (OSError, ValueError, AttributeError):
+        return None
+    return version if isinstance(version, int) else None
+
+
+def write(document: Dict[str, Any], directory: Optional[str] = None) -> Optional[str]:
+    """
+    Write public.json and its pre-compressed variants; returns the JSON path, or None when
+    another worker already published a newer version
+    """
+    # Only writers need the compressors; the read handlers import this module for DEFAULT_SETTINGS
+    import gzip
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    directory = directory or snapshot_dir()
+    if not directory:
+        raise RuntimeError('SNAPSHOT_DIR is not configured')
+    os.makedirs(directory, exist_ok=True)
+    body = serialization.dumps(document)
+    gz = gzip.compress(body, compresslevel=9, mtime=0)
+    br = brotli.compress(body, quality=11) if brotli is not None else None
+    with open(os.path.join(directory, '.' + FILENAME + '.lock'), 'a') as lock:
+        fcntl.lockf(lock.fileno(), fcntl.LOCK_EX)
+        version = document.get('version')
+        current = published_version(directory)
+        if isinstance(version, int) and current is not None and version < current:
+            return None
+        # Compressed variants first, so nginx never serves a .gz newer than the .json it belongs to
+        _atomic_write(directory, FILENAME + '.gz', gz)
+        if br is not None:
+            _atomic_write(directory, FILENAME + '.br', br)
+        _atomic_write(directory, FILENAME, body)
+    return os.path.join(directory, FILENAME)
+
+
+def rebuild() -> Optional[str]:
+    """Read the current data and publish it; no-op when snapshots are disabled or already newer"""
+    if not snapshot_dir():
+        return None
+    with db.connection() as conn:
+        cur = conn.cursor()
+        document = build(cur)
+        cur.close()
+    return write(document)
+
+
+def _run_scheduled() -> None:
+    global _timer
+    with _lock:
+        _timer = None
+    try:
+        _stats['written' if rebuild() else 'superseded'] += 1
+    except Exception:
+        _stats['errors'] += 1
+
+
+def schedule() -> None:
+    """Debounced rebuild after a committed write"""
+    global _timer
+    if not snapshot_dir():
+        return
+    try:
+        delay = float(os.environ.get('SNAPSHOT_DEBOUNCE', 0.5))
+    except ValueError:
+        delay = 0.5
+    with _lock:
+        _stats['scheduled'] += 1
+        if _timer is not None:
+            _timer.cancel()
+        _timer = threading.Timer(delay, _run_scheduled)
+        _timer.daemon = True
+        _timer.start()
+
+
+def stats() -> Dict[str, Any]:
+    return dict(_stats)
+
+
+if __name__ == '__main__':
+    if not snapshot_dir():
+        sys.exit('SNAPSHOT_DIR is not configured')
+    path = rebuild()
+    print('Snapshot written to %s' % path if path else 'A newer snapshot is already published')
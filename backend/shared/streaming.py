@@ -0,0 +1,119 @@
+'''
+Business: Bounded-memory streaming of large query results as NDJSON or CSV
+A named (server-side) cursor on its own pooled connection is read EXPORT_CHUNK_ROWS at a
+time and each chunk is encoded and, optionally, gzip-compressed before the next one is
+fetched, so peak memory does not depend on the number of rows exported.
+
+Streaming bodies need the backend server (server.py marks its events with
+requestContext.streaming); the cloud-function gateway only accepts complete bodies.
+
+Configuration (environment):
+    EXPORT_CHUNK_ROWS  - rows fetched per round trip (default 5000)
+'''
+
+import csv
+import io
+import os
+import zlib
+from datetime import date, datetime, time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from shared import db, serialization
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+
+def _chunk_rows() -> int:
+    try:
+        return max(int(os.environ.get('EXPORT_CHUNK_ROWS', 5000)), 1)
+    except (TypeError, ValueError):
+        return 5000
+
+
+def supported(event: Dict[str, Any]) -> bool:
+    """True when the caller can send an iterable body (the backend server, not the gateway)"""
+    return bool((event.get('requestContext') or {}).get('streaming'))
+
+
+def query_chunks(sql: str, args: Sequence[Any], name: str = 'export') -> Iterator[Tuple[Tuple[str, ...], List[tuple]]]:
+    """Yield (columns, rows) chunks from a server-side cursor; the connection is held until exhausted or closed"""
+    with db.connection() as conn:
+        cur = conn.cursor(name=name)
+        cur.itersize = _chunk_rows()
+        try:
+            cur.execute(sql, args)
+            while True:
+                rows = cur.fetchmany(cur.itersize)
+                if not rows:
+                    break
+                yield serialization.columns(cur), rows
+        finally:
+            cur.close()
+            conn.rollback()
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+def ndjson(chunks: Iterator[Tuple[Tuple[str, ...], List[tuple]]]) -> Iterator[bytes]:
+    for keys, rows in chunks:
+        yield b''.join(serialization.dumps(dict(zip(keys, row))) + b'\n' for row in rows)
+
+
+def csv_rows(chunks: Iterator[Tuple[Tuple[str, ...], List[tuple]]]) -> Iterator[bytes]:
+    header_written = False
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    for keys, rows in chunks:
+        if not header_written:
+            writer.writerow(keys)
+            header_written = True
+        for row in rows:
+            writer.writerow([_csv_value(value) for value in row])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def gzipped(parts: Iterator[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def encode(export_format: str, chunks: Iterator[Tuple[Tuple[str, ...], List[tuple]]],
+           compress: bool = False) -> Iterator[bytes]:
+    parts = csv_rows(chunks) if export_format == 'csv' else ndjson(chunks)
+    return gzipped(parts) if compress else parts
+
+
+def response(export_format: str, filename: str, body: Iterator[bytes], compress: bool = False,
+             headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """Handler result with an iterable body for server.py to stream"""
+    content_type, extension = FORMATS[export_format]
+    name = '%s.%s' % (filename, extension)
+    if compress:
+        content_type = 'application/gzip'
+        name += '.gz'
+    return {
+        'statusCode': 200,
+        'headers': {
+            **(headers or {}),
+            'Content-Type': content_type,
+            'Content-Disposition': 'attachment; filename="%s"' % name,
+            'Cache-Control': 'no-store',
+            'X-Accel-Buffering': 'no',
+            'Access-Control-Expose-Headers': 'Content-Disposition',
+        },
+        'body': body,
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,644 @@
+'''
+Benchmark and load-test harness for the backend functions.
+
+Replays the per-function specs in backend/*/tests.json (plus bench/scenarios.json for
+authenticated and heavy requests) against each handler(event, context) in-process or
+over HTTP at a configurable concurrency, and reports p50/p95/p99 latency, requests/sec
+and database statements per request (from pg_stat_statements when available).
+
+    # throwaway Postgres seeded with synthetic data, in-process handlers
+    python bench/bench.py run --throwaway --contacts 10000 --audit-rows 1000000 --save bench/results.json
+
+    # the same with a streaming replica serving the read-only handler branches
+    python bench/bench.py run --throwaway --replica --save bench/results-replica.json
+
+    # an already running server (backend/server.py behind gunicorn)
+    python bench/bench.py run --url http://127.0.0.1:8001 --concurrency 32
+
+    # fail loudly when a run regresses against a stored baseline
+    python bench/bench.py compare bench/baseline.json bench/results.json --threshold 0.2
+
+    # cold start per function (fresh interpreter, -X importtime) against bench/startup_budget.json
+    python bench/bench.py startup --throwaway --runs 5
+'''
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND_DIR = os.path.join(ROOT, 'backend')
+MIGRATIONS_DIR = os.path.join(ROOT, 'db_migrations')
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scenarios.json')
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+
+BENCH_TOKEN = 'bench-token'
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench-password'
+
+
+# ---------------------------------------------------------------------------
+# Specs
+
+def load_specs(functions: Optional[List[str]] = None, include_scenarios: bool = True) -> List[Dict[str, Any]]:
+    """Flatten tests.json files (and scenarios.json) into a list of request specs"""
+    specs = []
+    for path in sorted(glob.glob(os.path.join(BACKEND_DIR, '*', 'tests.json'))):
+        function = os.path.basename(os.path.dirname(path))
+        if functions and function not in functions:
+            continue
+        with open(path, encoding='utf-8') as handle:
+            for test in json.load(handle).get('tests', []):
+                specs.append({**test, 'function': function})
+    if include_scenarios and os.path.exists(SCENARIOS_PATH):
+        with open(SCENARIOS_PATH, encoding='utf-8') as handle:
+            for test in json.load(handle).get('tests', []):
+                if not functions or test['function'] in functions:
+                    specs.append(test)
+    return specs
+
+
+def spec_key(spec: Dict[str, Any]) -> str:
+    return '%s: %s' % (spec['function'], spec['name'])
+
+
+def spec_headers(spec: Dict[str, Any]) -> Dict[str, str]:
+    headers = {'Content-Type': 'application/json', 'X-Real-IP': '127.0.0.1'}
+    for name, value in (spec.get('headers') or {}).items():
+        headers[name] = value.replace('{token}', BENCH_TOKEN)
+    return headers
+
+
+def spec_body(spec: Dict[str, Any]) -> str:
+    body = spec.get('body')
+    if body is None:
+        return ''
+    return body if isinstance(body, str) else json.dumps(body)
+
+
+def spec_event(spec: Dict[str, Any]) -> Dict[str, Any]:
+    parts = urlsplit(spec.get('path', '/'))
+    return {
+        'httpMethod': spec.get('method', 'GET'),
+        'path': parts.path or '/',
+        'headers': spec_headers(spec),
+        'queryStringParameters': dict(parse_qsl(parts.query, keep_blank_values=True)),
+        'body': spec_body(spec),
+        'isBase64Encoded': False,
+        'requestContext': {'requestId': 'bench', 'identity': {'sourceIp': '127.0.0.1'}},
+    }
+
+
+# ---------------------------------------------------------------------------
+# Drivers: each returns the HTTP status of one request
+
+class InProcessDriver:
+    def __init__(self) -> None:
+        # Replaying the same failed login must measure the handler, not the throttle
+        os.environ.setdefault('LOGIN_MAX_FAILURES_USER', '0')
+        os.environ.setdefault('LOGIN_MAX_FAILURES_IP', '0')
+        # Every replayed request comes from the same address
+        os.environ.setdefault('RATE_LIMITS', 'contacts=0,settings=0,auth=0,login=0')
+        sys.path.insert(0, BACKEND_DIR)
+        import server
+        self.server = server
+
+    def __call__(self, spec: Dict[str, Any]) -> int:
+        handler = self.server.load_handler(spec['function'])
+        result = handler(spec_event(spec), None)
+        return int(result.get('statusCode', 0))
+
+
+class HttpDriver:
+    def __init__(self, base_url: str, timeout: float = 30.0) -> None:
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def __call__(self, spec: Dict[str, Any]) -> int:
+        path = spec.get('path', '/')
+        url = '%s/%s%s' % (self.base_url, spec['function'], path if path != '/' else '')
+        body = spec_body(spec)
+        request = urllib.request.Request(
+            url,
+            data=body.encode('utf-8') if body else None,
+            headers=spec_headers(spec),
+            method=spec.get('method', 'GET'),
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+
+# ---------------------------------------------------------------------------
+# Statement counting
+
+class StatementCounter:
+    """Total statement executions from pg_stat_statements, or None when unavailable"""
+
+    def __init__(self, dsn: Optional[str]) -> None:
+        self.conn = None
+        if not dsn:
+            return
+        try:
+            import psycopg2
+            self.conn = psycopg2.connect(dsn)
+            self.conn.autocommit = True
+            self.read()
+        except Exception:
+            self.conn = None
+
+    def read(self) -> Optional[int]:
+        if self.conn is None:
+            return None
+        cur = self.conn.cursor()
+        cur.execute(
+            "SELECT coalesce(sum(calls), 0) FROM pg_stat_statements WHERE query NOT ILIKE '%%pg_stat_statements%%'"
+        )
+        total = int(cur.fetchone()[0])
+        cur.close()
+        return total
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def measure(driver: Any, spec: Dict[str, Any], requests: int, concurrency: int,
+            warmup: int, counter: StatementCounter) -> Dict[str, Any]:
+    for _ in range(warmup):
+        driver(spec)
+    latencies: List[float] = []
+    errors = 0
+    unexpected = 0
+    lock = threading.Lock()
+    expected = spec.get('expectedStatus')
+
+    def one(_: int) -> None:
+        nonlocal errors, unexpected
+        started = time.perf_counter()
+        try:
+            status = driver(spec)
+        except Exception:
+            status = None
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            if status is None or status >= 500:
+                errors += 1
+            elif expected is not None and status != expected:
+                unexpected += 1
+
+    before = counter.read()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    after = counter.read()
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'max_ms': round(latencies[-1], 3) if latencies else 0.0,
+        'rps': round(requests / wall, 1) if wall > 0 else 0.0,
+        'errors': errors,
+        'unexpected_status': unexpected,
+        'queries_per_request': (
+            round((after - before) / requests, 2) if before is not None and after is not None else None
+        ),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Throwaway Postgres
+
+def find_pg_bin(explicit: Optional[str]) -> str:
+    if explicit:
+        return explicit
+    initdb = shutil.which('initdb')
+    if initdb:
+        return os.path.dirname(initdb)
+    candidates = sorted(glob.glob('/usr/lib/postgresql/*/bin'), reverse=True)
+    if candidates:
+        return candidates[0]
+    raise SystemExit('initdb not found; pass --pg-bin or put the Postgres binaries on PATH')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def migration_order(path: str) -> Tuple[int, str]:
+    match = re.match(r'V0*(\d+)__', os.path.basename(path))
+    return (int(match.group(1)) if match else 0, os.path.basename(path))
+
+
+class ThrowawayPostgres:
+    """initdb + pg_ctl in a temp dir, with pg_stat_statements preloaded; removed on exit"""
+
+    def __init__(self, pg_bin: str) -> None:
+        self.pg_bin = pg_bin
+        self.dir = tempfile.mkdtemp(prefix='contacts-bench-pg-')
+        self.port = free_port()
+        self.dsn = 'postgresql://postgres@127.0.0.1:%d/bench' % self.port
+        self.replica_port: Optional[int] = None
+
+    def _run(self, *args: str) -> None:
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def __enter__(self) -> 'ThrowawayPostgres':
+        data = os.path.join(self.dir, 'data')
+        self._run(os.path.join(self.pg_bin, 'initdb'), '-D', data, '-U', 'postgres', '--auth=trust', '-E', 'UTF8')
+        options = '-p %d -k %s -c fsync=off -c synchronous_commit=off -c shared_preload_libraries=pg_stat_statements' % (
+            self.port, self.dir)
+        self._run(os.path.join(self.pg_bin, 'pg_ctl'), '-D', data, '-o', options, '-w', '-l',
+                  os.path.join(self.dir, 'postgres.log'), 'start')
+        import psycopg2
+        conn = psycopg2.connect('postgresql://postgres@127.0.0.1:%d/postgres' % self.port)
+        conn.autocommit = True
+        conn.cursor().execute('CREATE DATABASE bench')
+        conn.close()
+        return self
+
+    def start_replica(self) -> str:
+        """Streaming standby of the primary (pg_basebackup -R) on its own port; returns its DSN"""
+        data = os.path.join(self.dir, 'replica')
+        self._run(os.path.join(self.pg_bin, 'pg_basebackup'), '-h', '127.0.0.1', '-p', str(self.port),
+                  '-U', 'postgres', '-D', data, '-R', '-X', 'stream')
+        self.replica_port = free_port()
+        options = '-p %d -k %s -c hot_standby=on -c shared_preload_libraries=pg_stat_statements' % (
+            self.replica_port, self.dir)
+        self._run(os.path.join(self.pg_bin, 'pg_ctl'), '-D', data, '-o', options, '-w', '-l',
+                  os.path.join(self.dir, 'replica.log'), 'start')
+        return 'postgresql://postgres@127.0.0.1:%d/bench' % self.replica_port
+
+    def __exit__(self, *exc: Any) -> None:
+        for data in ('replica', 'data'):
+            if os.path.isdir(os.path.join(self.dir, data)):
+                subprocess.run([os.path.join(self.pg_bin, 'pg_ctl'), '-D', os.path.join(self.dir, data),
+                                '-m', 'immediate', 'stop'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def migrate(dsn: str) -> None:
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute('CREATE EXTENSION IF NOT EXISTS pg_stat_statements')
+    except psycopg2.Error:
+        pass
+    for path in sorted(glob.glob(os.path.join(MIGRATIONS_DIR, '*.sql')), key=migration_order):
+        with open(path, encoding='utf-8') as handle:
+            cur.execute(handle.read())
+    cur.close()
+    conn.close()
+
+
+def seed(dsn: str, contacts: int, audit_rows: int) -> None:
+    """Synthetic dataset plus a superadmin session usable via the {token} placeholder"""
+    import bcrypt
+    import psycopg2
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute('TRUNCATE contacts RESTART IDENTITY')
+    cur.execute(
+        """INSERT INTO contacts (title, description, telegram_link, display_order)
+           SELECT 'Contact ' || g,
+                  repeat('Описание контакта ', 4) || '|||https://example.com/avatars/' || g || '.png',
+                  'https://t.me/user' || g,
+                  g
+           FROM generate_series(1, %s) AS g""",
+        (contacts,)
+    )
+    cur.execute('TRUNCATE admin_actions')
+    cur.execute(
+        """INSERT INTO admin_actions (admin_username, action_type, target_type, target_id, details, ip_address, created_at)
+           SELECT 'admin' || (g %% 7),
+                  (ARRAY['login', 'create_contact', 'update_contact', 'delete_contact', 'reorder_contacts'])[1 + g %% 5],
+                  'contact', (g %% 1000)::text,
+                  'Synthetic audit event number ' || g,
+                  '10.0.' || (g %% 250) || '.' || (g %% 200),
+                  CURRENT_TIMESTAMP - g * INTERVAL '1 second'
+           FROM generate_series(1, %s) AS g""",
+        (audit_rows,)
+    )
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=12)).decode('utf-8')
+    cur.execute(
+        """INSERT INTO users (username, password_hash, role) VALUES (%s, %s, 'superadmin')
+           ON CONFLICT (username) DO UPDATE SET password_hash = EXCLUDED.password_hash, role = 'superadmin'
+           RETURNING id""",
+        (BENCH_USER, password_hash)
+    )
+    user_id = cur.fetchone()[0]
+    cur.execute(
+        """INSERT INTO sessions (user_id, token, expires_at)
+           VALUES (%s, %s, CURRENT_TIMESTAMP + INTERVAL '1 day')
+           ON CONFLICT (token) DO UPDATE SET expires_at = EXCLUDED.expires_at""",
+        (user_id, hashlib.sha256(BENCH_TOKEN.encode('utf-8')).hexdigest())
+    )
+    conn.commit()
+    cur.execute('ANALYZE')
+    cur.close()
+    conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Commands
+
+def run_suite(args: argparse.Namespace, dsn: Optional[str]) -> Dict[str, Any]:
+    driver = HttpDriver(args.url) if args.url else InProcessDriver()
+    counter = StatementCounter(dsn)
+    results = {}
+    for spec in load_specs(args.function, include_scenarios=not args.no_scenarios):
+        key = spec_key(spec)
+        results[key] = measure(driver, spec, args.requests, args.concurrency, args.warmup, counter)
+        row = results[key]
+        print('%-60s p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %8.1f rps  q/req %s  err %d' % (
+            key[:60], row['p50_ms'], row['p95_ms'], row['p99_ms'], row['rps'],
+            row['queries_per_request'], row['errors'] + row['unexpected_status']))
+    return {
+        'meta': {
+            'mode': 'http' if args.url else 'in-process',
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'contacts': args.contacts,
+            'audit_rows': args.audit_rows,
+            'replica': bool(os.environ.get('DATABASE_REPLICA_URLS')),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def cmd_run(args: argparse.Namespace) -> int:
+    if args.throwaway:
+        with ThrowawayPostgres(find_pg_bin(args.pg_bin)) as pg:
+            os.environ['DATABASE_URL'] = pg.dsn
+            migrate(pg.dsn)
+            seed(pg.dsn, args.contacts, args.audit_rows)
+            if args.replica:
+                os.environ['DATABASE_REPLICA_URLS'] = pg.start_replica()
+            report = run_suite(args, pg.dsn)
+    else:
+        dsn = os.environ.get('DATABASE_URL')
+        if args.seed:
+            if not dsn:
+                raise SystemExit('DATABASE_URL is required with --seed')
+            seed(dsn, args.contacts, args.audit_rows)
+        report = run_suite(args, dsn)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2, ensure_ascii=False)
+            handle.write('\n')
+    failures = sum(row['errors'] + row['unexpected_status'] for row in report['results'].values())
+    if args.baseline:
+        return compare(load_report(args.baseline), report, args.threshold) or (1 if failures else 0)
+    return 1 if failures else 0
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> int:
+    """Exit status 1 when p95 grows or rps/queries regress by more than threshold"""
+    regressions = []
+    for key, now in current['results'].items():
+        before = baseline.get('results', {}).get(key)
+        if before is None:
+            continue
+        if before['p95_ms'] > 0 and now['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            regressions.append('%s: p95 %.2fms -> %.2fms' % (key, before['p95_ms'], now['p95_ms']))
+        if before['rps'] > 0 and now['rps'] < before['rps'] * (1 - threshold):
+            regressions.append('%s: rps %.1f -> %.1f' % (key, before['rps'], now['rps']))
+        if (before.get('queries_per_request') is not None and now.get('queries_per_request') is not None
+                and now['queries_per_request'] > before['queries_per_request'] + 0.5):
+            regressions.append('%s: queries/request %.2f -> %.2f' % (
+                key, before['queries_per_request'], now['queries_per_request']))
+    for line in regressions:
+        print('REGRESSION ' + line, file=sys.stderr)
+    if not regressions:
+        print('No regressions beyond %.0f%% against baseline' % (threshold * 100))
+    return 1 if regressions else 0
+
+
+def cmd_compare(args: argparse.Namespace) -> int:
+    return compare(load_report(args.baseline), load_report(args.current), args.threshold)
+
+
+# ---------------------------------------------------------------------------
+# Cold start
+
+# Runs in a fresh interpreter: imports one handler the way the function gateway does and
+# times it together with the first request. Interpreter startup itself is not counted.
+STARTUP_SCRIPT = r"""
+import importlib.util, json, sys, time
+backend, name, event = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+sys.stderr.write('startup: begin\n')
+sys.stderr.flush()
+started = time.perf_counter()
+sys.path.insert(0, backend)
+spec = importlib.util.spec_from_file_location('index', '%s/%s/index.py' % (backend, name))
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+imported = time.perf_counter()
+result = module.handler(event, None)
+finished = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (finished - imported) * 1000,
+    'status': int(result.get('statusCode', 0)),
+}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """(module, self us, cumulative us) for the top-level imports made after the script began"""
+    lines = stderr.split('startup: begin\n', 1)[-1].splitlines()
+    modules = []
+    for line in lines:
+        match = IMPORTTIME_LINE.match(line)
+        # Nested imports are indented by two spaces per level under their importer
+        if match and len(match.group(3)) <= 3:
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return modules
+
+
+def startup_spec(function: str) -> Optional[Dict[str, Any]]:
+    """First request of a cold function: its first GET spec, else its first spec"""
+    specs = load_specs([function], include_scenarios=False)
+    gets = [spec for spec in specs if spec.get('method', 'GET') == 'GET']
+    return (gets or specs or [None])[0]
+
+
+def measure_startup(function: str, runs: int) -> Dict[str, Any]:
+    spec = startup_spec(function) or {'function': function, 'name': 'OPTIONS', 'method': 'OPTIONS'}
+    event = json.dumps(spec_event(spec))
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    samples, heaviest = [], {}
+    for _ in range(max(runs, 1)):
+        proc = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT, BACKEND_DIR, function, event],
+            capture_output=True, text=True, env=env, timeout=120)
+        if proc.returncode != 0:
+            raise SystemExit('%s: cold start failed\n%s' % (function, proc.stderr[-2000:]))
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        for module, _, cumulative in parse_importtime(proc.stderr):
+            heaviest[module] = max(heaviest.get(module, 0), cumulative)
+    import_ms = sorted(sample['import_ms'] for sample in samples)
+    first_ms = sorted(sample['first_request_ms'] for sample in samples)
+    return {
+        'spec': spec_key(spec),
+        'status': samples[-1]['status'],
+        'import_ms': round(percentile(import_ms, 0.5), 2),
+        'first_request_ms': round(percentile(first_ms, 0.5), 2),
+        'heaviest_imports': [
+            {'module': module, 'cumulative_ms': round(us / 1000, 2)}
+            for module, us in sorted(heaviest.items(), key=lambda item: -item[1])[:8]
+        ],
+    }
+
+
+def startup_functions(selected: Optional[List[str]]) -> List[str]:
+    paths = sorted(glob.glob(os.path.join(BACKEND_DIR, '*', 'index.py')))
+    names = [os.path.basename(os.path.dirname(path)) for path in paths]
+    return [name for name in names if not selected or name in selected]
+
+
+def check_budget(results: Dict[str, Any], budget: Dict[str, Any], with_database: bool) -> int:
+    """Exit status 1 when a function's median import or first request exceeds its budget"""
+    over = []
+    for function, row in results.items():
+        limits = {**budget.get('default', {}), **budget.get(function, {})}
+        if 'import_ms' in limits and row['import_ms'] > limits['import_ms']:
+            over.append('%s: import %.1fms > %.1fms' % (function, row['import_ms'], limits['import_ms']))
+        # Without a database the first request only measures a connection error
+        if with_database and 'first_request_ms' in limits and row['first_request_ms'] > limits['first_request_ms']:
+            over.append('%s: first request %.1fms > %.1fms' % (
+                function, row['first_request_ms'], limits['first_request_ms']))
+    for line in over:
+        print('OVER BUDGET ' + line, file=sys.stderr)
+    if not over:
+        print('Cold start within budget')
+    return 1 if over else 0
+
+
+def startup_suite(args: argparse.Namespace) -> Dict[str, Any]:
+    results = {}
+    for function in startup_functions(args.function):
+        row = results[function] = measure_startup(function, args.runs)
+        print('%-10s import %7.1fms  first request %7.1fms  (%s -> %d)' % (
+            function, row['import_ms'], row['first_request_ms'], row['spec'], row['status']))
+        print('           ' + ', '.join(
+            '%s %.1fms' % (item['module'], item['cumulative_ms']) for item in row['heaviest_imports'][:5]))
+    return {
+        'meta': {
+            'runs': args.runs,
+            'database': bool(os.environ.get('DATABASE_URL')),
+            'python': sys.version.split()[0],
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def cmd_startup(args: argparse.Namespace) -> int:
+    # Cold functions serve one request; the throttles would only add noise
+    os.environ.setdefault('RATE_LIMITS', 'contacts=0,settings=0,auth=0,login=0')
+    if args.throwaway:
+        with ThrowawayPostgres(find_pg_bin(args.pg_bin)) as pg:
+            os.environ['DATABASE_URL'] = pg.dsn
+            migrate(pg.dsn)
+            seed(pg.dsn, args.contacts, 0)
+            report = startup_suite(args)
+    else:
+        report = startup_suite(args)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as handle:
+            json.dump(report, handle, indent=2, ensure_ascii=False)
+            handle.write('\n')
+    if not args.budget:
+        return 0
+    return check_budget(report['results'], load_report(args.budget), report['meta']['database'])
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='replay specs and report latency/throughput')
+    run.add_argument('--url', help='base URL of a running server; default drives handlers in-process')
+    run.add_argument('--function', action='append', help='limit to a function (repeatable)')
+    run.add_argument('--requests', type=int, default=200, help='requests per spec')
+    run.add_argument('--concurrency', type=int, default=8)
+    run.add_argument('--warmup', type=int, default=10)
+    run.add_argument('--no-scenarios', action='store_true', help='only replay tests.json specs')
+    run.add_argument('--throwaway', action='store_true', help='start a temporary Postgres and seed it')
+    run.add_argument('--pg-bin', help='directory containing initdb/pg_ctl')
+    run.add_argument('--replica', action='store_true',
+                     help='with --throwaway, also start a streaming replica and route reads to it')
+    run.add_argument('--seed', action='store_true', help='seed DATABASE_URL before running')
+    run.add_argument('--contacts', type=int, default=1000)
+    run.add_argument('--audit-rows', type=int, default=100000)
+    run.add_argument('--save', help='write results JSON here')
+    run.add_argument('--baseline', help='compare against this results JSON and fail on regressions')
+    run.add_argument('--threshold', type=float, default=0.2)
+    run.set_defaults(func=cmd_run)
+
+    cmp_parser = sub.add_parser('compare', help='compare two results files')
+    cmp_parser.add_argument('baseline')
+    cmp_parser.add_argument('current')
+    cmp_parser.add_argument('--threshold', type=float, default=0.2)
+    cmp_parser.set_defaults(func=cmd_compare)
+
+    startup = sub.add_parser('startup', help='measure cold-start import time and first request per function')
+    startup.add_argument('--function', action='append', help='limit to a function (repeatable)')
+    startup.add_argument('--runs', type=int, default=5, help='fresh interpreters per function (median reported)')
+    startup.add_argument('--throwaway', action='store_true', help='start a temporary Postgres for the first request')
+    startup.add_argument('--pg-bin', help='directory containing initdb/pg_ctl')
+    startup.add_argument('--contacts', type=int, default=100)
+    startup.add_argument('--budget', default=BUDGET_PATH, help='budget JSON; empty string to only report')
+    startup.add_argument('--save', help='write results JSON here')
+    startup.set_defaults(func=cmd_startup)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
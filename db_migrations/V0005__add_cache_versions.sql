@@ -0,0 +1,10 @@
+-- Version counters used to invalidate cached public responses across workers
+CREATE TABLE IF NOT EXISTS cache_versions (
+    namespace VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (namespace, version)
+VALUES ('contacts', 0), ('settings', 0)
+ON CONFLICT (namespace) DO NOTHING;
@@ -0,0 +1,8 @@
+-- Session tokens are stored as SHA-256 digests; expired rows are swept in batches
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+
+-- Deleting a user removes their sessions
+ALTER TABLE sessions DROP CONSTRAINT IF EXISTS sessions_user_id_fkey;
+ALTER TABLE sessions
+    ADD CONSTRAINT sessions_user_id_fkey
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE;
@@ -0,0 +1,7 @@
+-- Keyset pagination on (created_at, id) for the audit log API
+CREATE INDEX IF NOT EXISTS idx_admin_actions_created_at_id ON admin_actions(created_at DESC, id DESC);
+
+-- Trigram indexes for the ILIKE text search over details and admin_username
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS idx_admin_actions_details_trgm ON admin_actions USING GIN (details gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_admin_actions_username_trgm ON admin_actions USING GIN (admin_username gin_trgm_ops);
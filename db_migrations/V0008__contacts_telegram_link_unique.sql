@@ -0,0 +1,34 @@
+-- Natural key for bulk import upserts (INSERT ... ON CONFLICT (telegram_link)).
+-- New contacts created from the admin page start with the placeholder link, so it is excluded.
+-- Existing duplicates would make the index build fail halfway through a deploy; stop with the
+-- conflicting rows instead so they can be merged or relinked by hand before re-running.
+DO $$
+DECLARE
+    conflicts text;
+BEGIN
+    IF to_regclass('idx_contacts_telegram_link_unique') IS NOT NULL THEN
+        RETURN;
+    END IF;
+
+    SELECT string_agg(format('%s (ids %s)', telegram_link, ids), '; ')
+    INTO conflicts
+    FROM (
+        SELECT telegram_link, string_agg(id::text, ', ' ORDER BY id) AS ids
+        FROM contacts
+        WHERE telegram_link <> 'https://t.me/username'
+        GROUP BY telegram_link
+        HAVING COUNT(*) > 1
+    ) duplicates;
+
+    IF conflicts IS NOT NULL THEN
+        RAISE EXCEPTION 'contacts share a telegram_link: %', conflicts
+            USING HINT = 'Merge or change these contacts, then re-run the deploy. '
+                         'List them with: SELECT telegram_link, array_agg(id) FROM contacts '
+                         'WHERE telegram_link <> ''https://t.me/username'' GROUP BY 1 HAVING COUNT(*) > 1';
+    END IF;
+END
+$$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_contacts_telegram_link_unique
+    ON contacts (telegram_link)
+    WHERE telegram_link <> 'https://t.me/username';
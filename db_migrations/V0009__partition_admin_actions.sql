@@ -0,0 +1,66 @@
+-- Range-partition admin_actions by month on created_at.
+-- Partitions are named admin_actions_pYYYYMM; shared/partitions.py creates future months ahead of
+-- time and detaches, archives and drops months past the retention window.
+-- Rows for a month without a partition go to admin_actions_default (V0014).
+-- Safe to re-run: the conversion only happens while admin_actions is still a plain table.
+
+DO $$
+DECLARE
+    first_month date;
+    last_month date := (date_trunc('month', now()) + interval '3 months')::date;
+    month date;
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('admin_actions')) IS DISTINCT FROM 'r' THEN
+        RETURN;
+    END IF;
+
+    LOCK TABLE admin_actions IN ACCESS EXCLUSIVE MODE;
+    ALTER TABLE admin_actions RENAME TO admin_actions_legacy;
+    ALTER SEQUENCE admin_actions_id_seq OWNED BY NONE;
+
+    CREATE TABLE admin_actions (
+        id INTEGER NOT NULL DEFAULT nextval('admin_actions_id_seq'),
+        admin_username VARCHAR(255) NOT NULL,
+        action_type VARCHAR(100) NOT NULL,
+        target_type VARCHAR(100),
+        target_id VARCHAR(255),
+        details TEXT,
+        ip_address VARCHAR(45),
+        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    ALTER SEQUENCE admin_actions_id_seq OWNED BY admin_actions.id;
+
+    SELECT LEAST(date_trunc('month', MIN(created_at)), date_trunc('month', now()))::date
+    INTO first_month
+    FROM admin_actions_legacy;
+    first_month := COALESCE(first_month, date_trunc('month', now())::date);
+
+    month := first_month;
+    WHILE month <= last_month LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF admin_actions FOR VALUES FROM (%L) TO (%L)',
+            'admin_actions_p' || to_char(month, 'YYYYMM'),
+            month,
+            (month + interval '1 month')::date
+        );
+        month := (month + interval '1 month')::date;
+    END LOOP;
+
+    INSERT INTO admin_actions (id, admin_username, action_type, target_type, target_id, details, ip_address, created_at)
+    SELECT id, admin_username, action_type, target_type, target_id, details, ip_address,
+           COALESCE(created_at, CURRENT_TIMESTAMP)
+    FROM admin_actions_legacy;
+
+    DROP TABLE admin_actions_legacy;
+END
+$$;
+
+-- Created on the parent so every current and future partition gets a local copy
+CREATE INDEX IF NOT EXISTS idx_admin_actions_created_at_id ON admin_actions(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_admin_actions_username ON admin_actions(admin_username);
+CREATE INDEX IF NOT EXISTS idx_admin_actions_type ON admin_actions(action_type);
+CREATE INDEX IF NOT EXISTS idx_admin_actions_details_trgm ON admin_actions USING GIN (details gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_admin_actions_username_trgm ON admin_actions USING GIN (admin_username gin_trgm_ops);
+
+COMMENT ON TABLE admin_actions IS 'Audit log for all admin actions, partitioned by month';
@@ -0,0 +1,14 @@
+-- Avatars get their own column instead of being packed into description after '|||'
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS avatar_url VARCHAR(500);
+-- Resized WebP/JPEG variant URLs of uploaded images (see backend/shared/images.py)
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS avatar_variants JSONB;
+ALTER TABLE page_settings ADD COLUMN IF NOT EXISTS background_variants JSONB;
+
+UPDATE contacts
+SET avatar_url = COALESCE(avatar_url, NULLIF(split_part(description, '|||', 2), '')),
+    description = split_part(description, '|||', 1)
+WHERE description LIKE '%|||%';
+
+-- Published responses and snapshots still carry the packed description
+UPDATE cache_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+WHERE namespace IN ('contacts', 'settings');
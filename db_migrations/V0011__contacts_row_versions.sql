@@ -0,0 +1,42 @@
+-- Delta sync for contacts (GET /contacts?since=<version>).
+-- row_version is the id of the transaction that last wrote the row. A reader returns rows with
+-- row_version >= since and hands out the xmin of its snapshot as the next high-water mark: every
+-- transaction below xmin has finished, so a write that commits late is never skipped.
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE contacts ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_contacts_row_version ON contacts(row_version);
+
+CREATE TABLE IF NOT EXISTS contacts_tombstones (
+    contact_id INTEGER PRIMARY KEY,
+    row_version BIGINT NOT NULL,
+    deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS idx_contacts_tombstones_row_version ON contacts_tombstones(row_version);
+
+CREATE OR REPLACE FUNCTION contacts_stamp_version() RETURNS trigger AS $$
+BEGIN
+    NEW.row_version := txid_current();
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION contacts_record_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO contacts_tombstones (contact_id, row_version, deleted_at)
+    VALUES (OLD.id, txid_current(), CURRENT_TIMESTAMP)
+    ON CONFLICT (contact_id) DO UPDATE
+    SET row_version = EXCLUDED.row_version, deleted_at = EXCLUDED.deleted_at;
+    RETURN OLD;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS contacts_stamp_version ON contacts;
+CREATE TRIGGER contacts_stamp_version
+    BEFORE INSERT OR UPDATE ON contacts
+    FOR EACH ROW EXECUTE FUNCTION contacts_stamp_version();
+
+DROP TRIGGER IF EXISTS contacts_record_tombstone ON contacts;
+CREATE TRIGGER contacts_record_tombstone
+    AFTER DELETE ON contacts
+    FOR EACH ROW EXECUTE FUNCTION contacts_record_tombstone();
@@ -0,0 +1,28 @@
+-- Live change feed: NOTIFY change_feed after every write statement (see backend/shared/events.py).
+-- Statement-level, so a bulk import, reorder or batched audit insert sends one notification;
+-- identical payloads within a transaction are collapsed by Postgres and delivered on commit.
+CREATE OR REPLACE FUNCTION change_feed_notify() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('change_feed', json_build_object(
+        'table', TG_TABLE_NAME,
+        'op', TG_OP,
+        'version', txid_current()
+    )::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS contacts_change_feed ON contacts;
+CREATE TRIGGER contacts_change_feed
+    AFTER INSERT OR UPDATE OR DELETE ON contacts
+    FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
+
+DROP TRIGGER IF EXISTS page_settings_change_feed ON page_settings;
+CREATE TRIGGER page_settings_change_feed
+    AFTER INSERT OR UPDATE OR DELETE ON page_settings
+    FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
+
+DROP TRIGGER IF EXISTS admin_actions_change_feed ON admin_actions;
+CREATE TRIGGER admin_actions_change_feed
+    AFTER INSERT ON admin_actions
+    FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
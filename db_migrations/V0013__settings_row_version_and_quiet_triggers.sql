@@ -0,0 +1,56 @@
+-- Optimistic concurrency for page settings: row_version / updated_at stamped like contacts (V0011)
+ALTER TABLE page_settings ADD COLUMN IF NOT EXISTS row_version BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION stamp_row_version() RETURNS trigger AS $$
+BEGIN
+    NEW.row_version := txid_current();
+    NEW.updated_at := CURRENT_TIMESTAMP;
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS page_settings_stamp_version ON page_settings;
+CREATE TRIGGER page_settings_stamp_version
+    BEFORE INSERT OR UPDATE ON page_settings
+    FOR EACH ROW EXECUTE FUNCTION stamp_row_version();
+
+-- Change feed (V0012) only for statements that changed rows, so skipped no-op writes stay silent.
+-- Transition tables allow a single event per trigger, hence one trigger per operation.
+CREATE OR REPLACE FUNCTION change_feed_notify() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM changed_rows) THEN
+        PERFORM pg_notify('change_feed', json_build_object(
+            'table', TG_TABLE_NAME,
+            'op', TG_OP,
+            'version', txid_current()
+        )::text);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS contacts_change_feed ON contacts;
+DROP TRIGGER IF EXISTS contacts_change_feed_insert ON contacts;
+DROP TRIGGER IF EXISTS contacts_change_feed_update ON contacts;
+DROP TRIGGER IF EXISTS contacts_change_feed_delete ON contacts;
+CREATE TRIGGER contacts_change_feed_insert AFTER INSERT ON contacts
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
+CREATE TRIGGER contacts_change_feed_update AFTER UPDATE ON contacts
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
+CREATE TRIGGER contacts_change_feed_delete AFTER DELETE ON contacts
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
+
+DROP TRIGGER IF EXISTS page_settings_change_feed ON page_settings;
+DROP TRIGGER IF EXISTS page_settings_change_feed_insert ON page_settings;
+DROP TRIGGER IF EXISTS page_settings_change_feed_update ON page_settings;
+DROP TRIGGER IF EXISTS page_settings_change_feed_delete ON page_settings;
+CREATE TRIGGER page_settings_change_feed_insert AFTER INSERT ON page_settings
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
+CREATE TRIGGER page_settings_change_feed_update AFTER UPDATE ON page_settings
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
+CREATE TRIGGER page_settings_change_feed_delete AFTER DELETE ON page_settings
+    REFERENCING OLD TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
+
+DROP TRIGGER IF EXISTS admin_actions_change_feed ON admin_actions;
+CREATE TRIGGER admin_actions_change_feed AFTER INSERT ON admin_actions
+    REFERENCING NEW TABLE AS changed_rows FOR EACH STATEMENT EXECUTE FUNCTION change_feed_notify();
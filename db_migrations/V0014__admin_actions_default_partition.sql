@@ -0,0 +1,10 @@
+-- Catch-all partition for admin_actions (V0009): an audit INSERT for a month nobody has created yet
+-- (the maintenance timer is missing or has not run, e.g. on the cloud-function deployment) lands
+-- here instead of failing. shared/partitions.py moves such rows into their month when it creates it.
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('admin_actions')) = 'p' THEN
+        CREATE TABLE IF NOT EXISTS admin_actions_default PARTITION OF admin_actions DEFAULT;
+    END IF;
+END
+$$;
@@ -0,0 +1,9 @@
+-- page_settings is saved with INSERT ... ON CONFLICT DO UPDATE, which runs BEFORE INSERT triggers
+-- for the proposed row even when the update is then skipped. Stamp row_version only on rows that
+-- really change (BEFORE UPDATE); the first insert takes it from the column default.
+ALTER TABLE page_settings ALTER COLUMN row_version SET DEFAULT txid_current();
+
+DROP TRIGGER IF EXISTS page_settings_stamp_version ON page_settings;
+CREATE TRIGGER page_settings_stamp_version
+    BEFORE UPDATE ON page_settings
+    FOR EACH ROW EXECUTE FUNCTION stamp_row_version();
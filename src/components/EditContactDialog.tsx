@@ -5,6 +5,7 @@ import { Label } from '@/components/ui/label';
 import { Textarea } from '@/components/ui/textarea';
 import { Avatar, AvatarFallback, AvatarImage } from '@/components/ui/avatar';
 import Icon from '@/components/ui/icon';
+import { ImageVariants, variantSrcSet } from '@/lib/images';
 
 export interface Contact {
   id: number;
@@ -13,7 +14,9 @@ export interface Contact {
   telegram_link: string;
   display_order: number;
   avatar_url?: string | null;
+  avatar_variants?: ImageVariants | null;
   telegram_username?: string | null;
+  row_version?: number | null;
 }
 
 interface EditContactDialogProps {
@@ -22,6 +25,7 @@ interface EditContactDialogProps {
   contact: Contact | null;
   onContactChange: (contact: Contact) => void;
   onSave: () => void;
+  onAvatarUpload?: (file: File) => void;
 }
 
 export default function EditContactDialog({
@@ -29,7 +33,8 @@ export default function EditContactDialog({
   onOpenChange,
   contact,
   onContactChange,
-  onSave
+  onSave,
+  onAvatarUpload
 }: EditContactDialogProps) {
   if (!contact) return null;
 
@@ -48,7 +53,12 @@ export default function EditContactDialog({
         <div className="space-y-4">
           <div className="flex flex-col items-center gap-3">
             <Avatar className="h-24 w-24 border-2 border-purple-200">
-              <AvatarImage src={contact.avatar_url || undefined} alt={contact.title} />
+              <AvatarImage
+                src={contact.avatar_url || undefined}
+                srcSet={variantSrcSet(contact.avatar_variants)}
+                sizes="96px"
+                alt={contact.title}
+              />
               <AvatarFallback className="bg-gradient-to-br from-purple-400 to-pink-400 text-white text-2xl font-bold">
                 {getInitials()}
               </AvatarFallback>
@@ -60,12 +70,29 @@ export default function EditContactDialog({
             <Input 
               id="edit-avatar-url"
               value={contact.avatar_url || ''}
-              onChange={(e) => onContactChange({ ...contact, avatar_url: e.target.value || null })}
+              onChange={(e) => onContactChange({ ...contact, avatar_url: e.target.value || null, avatar_variants: null })}
               placeholder="https://example.com/avatar.jpg"
             />
             <p className="text-sm text-gray-500 mt-1">Вставьте ссылку на изображение из интернета</p>
           </div>
 
+          {onAvatarUpload && (
+            <div>
+              <Label htmlFor="edit-avatar-file">Или загрузите фото</Label>
+              <Input
+                id="edit-avatar-file"
+                type="file"
+                accept="image/jpeg,image/png,image/webp,image/gif"
+                onChange={(e) => {
+                  const file = e.target.files?.[0];
+                  if (file) onAvatarUpload(file);
+                  e.target.value = '';
+                }}
+              />
+              <p className="text-sm text-gray-500 mt-1">Фото хранится на сервере и уменьшается до нужных размеров</p>
+            </div>
+          )}
+
           <div>
             <Label htmlFor="edit-title">Название</Label>
             <Input 
@@ -2,12 +2,15 @@ import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/u
 import { Button } from '@/components/ui/button';
 import { Input } from '@/components/ui/input';
 import { Label } from '@/components/ui/label';
+import { ImageVariants } from '@/lib/images';
 
 export interface PageSettings {
   id: number;
   main_title: string;
   main_description: string;
   background_image_url?: string | null;
+  background_variants?: ImageVariants | null;
+  row_version?: number | null;
 }
 
 interface PageSettingsDialogProps {
@@ -16,6 +19,7 @@ interface PageSettingsDialogProps {
   settings: PageSettings;
   onSettingsChange: (settings: PageSettings) => void;
   onSave: () => void;
+  onBackgroundUpload?: (file: File) => void;
 }
 
 export default function PageSettingsDialog({
@@ -23,7 +27,8 @@ export default function PageSettingsDialog({
   onOpenChange,
   settings,
   onSettingsChange,
-  onSave
+  onSave,
+  onBackgroundUpload
 }: PageSettingsDialogProps) {
   return (
     <Dialog open={isOpen} onOpenChange={onOpenChange}>
@@ -57,11 +62,26 @@ export default function PageSettingsDialog({
             <Input 
               id="background-image"
               value={settings.background_image_url || ''}
-              onChange={(e) => onSettingsChange({ ...settings, background_image_url: e.target.value || null })}
+              onChange={(e) => onSettingsChange({ ...settings, background_image_url: e.target.value || null, background_variants: null })}
               placeholder="https://example.com/image.jpg"
             />
             <p className="text-sm text-gray-500 mt-1">Оставьте пустым для стандартного градиента</p>
           </div>
+          {onBackgroundUpload && (
+            <div>
+              <Label htmlFor="background-file">Или загрузите изображение</Label>
+              <Input
+                id="background-file"
+                type="file"
+                accept="image/jpeg,image/png,image/webp,image/gif"
+                onChange={(e) => {
+                  const file = e.target.files?.[0];
+                  if (file) onBackgroundUpload(file);
+                  e.target.value = '';
+                }}
+              />
+            </div>
+          )}
           <Button 
             onClick={onSave}
             className="w-full bg-gradient-to-r from-purple-500 to-pink-500 hover:from-purple-600 hover:to-pink-600"
@@ -4,6 +4,7 @@ import { Avatar, AvatarFallback, AvatarImage } from '@/components/ui/avatar';
 import Icon from '@/components/ui/icon';
 import { useSortable } from '@dnd-kit/sortable';
 import { CSS } from '@dnd-kit/utilities';
+import { ImageVariants, variantSrcSet } from '@/lib/images';
 
 interface Contact {
   id: number;
@@ -12,6 +13,7 @@ interface Contact {
   telegram_link: string;
   display_order: number;
   avatar_url?: string | null;
+  avatar_variants?: ImageVariants | null;
   telegram_username?: string | null;
 }
 
@@ -62,7 +64,12 @@ export default function SortableContactCard({
       <CardHeader>
         <div className="flex items-center gap-4">
           <Avatar className="h-16 w-16 border-2 border-purple-200">
-            <AvatarImage src={getAvatarUrl() || undefined} alt={contact.title} />
+            <AvatarImage
+              src={getAvatarUrl() || undefined}
+              srcSet={variantSrcSet(contact.avatar_variants)}
+              sizes="64px"
+              alt={contact.title}
+            />
             <AvatarFallback className="bg-gradient-to-br from-purple-400 to-pink-400 text-white text-lg font-bold">
               {getInitials()}
             </AvatarFallback>
@@ -9,6 +9,65 @@ const API_URLS = {
   auth: func2url.auth
 };
 
+// Статический снимок публичной страницы (контакты + настройки), который отдаёт nginx
+const PUBLIC_SNAPSHOT_URL: string | undefined = import.meta.env.VITE_PUBLIC_SNAPSHOT_URL;
+
+const processContacts = (contacts: any[]): Contact[] =>
+  contacts
+    .map((c: any) => ({
+      ...c,
+      description: c.description || '',
+      avatar_url: c.avatar_url || null,
+      avatar_variants: c.avatar_variants || null
+    }))
+    .sort((a: Contact, b: Contact) => (a.display_order || 0) - (b.display_order || 0));
+
+export interface ContactsDelta {
+  contacts: Contact[];
+  deleted: number[];
+  version: number;
+  full: boolean;
+}
+
+// Применяем изменения из GET /contacts?since=... к уже загруженному списку
+export const applyContactsDelta = (current: Contact[], delta: ContactsDelta): Contact[] => {
+  const byId = new Map((delta.full ? [] : current).map((c) => [c.id, c]));
+  delta.deleted.forEach((id) => byId.delete(id));
+  delta.contacts.forEach((c) => byId.set(c.id, c));
+  return processContacts(Array.from(byId.values()));
+};
+
+const processSettings = (data: any): PageSettings => ({
+  id: data.id || 1,
+  main_title: data.main_title || 'Мои контакты',
+  main_description: data.main_description || 'Свяжитесь со мной в Telegram',
+  background_image_url: data.background_image_url || null,
+  background_variants: data.background_variants || null,
+  row_version: data.row_version ?? null
+});
+
+export interface SaveResult {
+  status: 'saved' | 'conflict' | 'failed';
+  version?: number;
+}
+
+// If-Match: сервер отклоняет запись (412), если строку успели изменить после нашего чтения
+const ifMatch = (rowVersion?: number | null): Record<string, string> =>
+  rowVersion ? { 'If-Match': `"${rowVersion}"` } : {};
+
+const EDITABLE_CONTACT_FIELDS = ['title', 'description', 'telegram_link', 'display_order', 'avatar_url'] as const;
+
+// PATCH отправляет только изменённые поля: остальные не перезаписываются чужими старыми значениями
+const changedContactFields = (contact: Contact, original: Contact): Partial<Contact> => {
+  const changes: Record<string, unknown> = {};
+  EDITABLE_CONTACT_FIELDS.forEach((field) => {
+    const value = field === 'avatar_url' ? contact[field] || null : contact[field];
+    const before = field === 'avatar_url' ? original[field] || null : original[field];
+    if (value !== before) changes[field] = value;
+  });
+  return changes as Partial<Contact>;
+};
+
 export function useContactsApi() {
   const { toast } = useToast();
 
@@ -17,37 +76,66 @@ export function useContactsApi() {
       const response = await fetch(API_URLS.contacts);
       if (!response.ok) throw new Error('Failed to fetch contacts');
       const contacts = await response.json();
-      
-      // Разделяем description на description и avatar_url
-      const processedContacts = contacts.map((c: any) => {
-        const parts = c.description.split('|||');
-        return {
-          ...c,
-          description: parts[0] || '',
-          avatar_url: parts[1] || null
-        };
-      });
-      
-      return processedContacts.sort((a: Contact, b: Contact) => (a.display_order || 0) - (b.display_order || 0));
+      return processContacts(contacts);
     } catch (error) {
       toast({ title: 'Ошибка', description: 'Не удалось загрузить контакты', variant: 'destructive' });
       return [];
     }
   };
 
+  // Только изменённые и удалённые контакты с версии since (0 — весь список)
+  const syncContacts = async (since: number): Promise<ContactsDelta | null> => {
+    try {
+      const response = await fetch(`${API_URLS.contacts}?since=${since}`);
+      if (!response.ok) throw new Error('Failed to sync contacts');
+      const data = await response.json();
+      return {
+        contacts: processContacts(data.contacts || []),
+        deleted: data.deleted || [],
+        version: data.version,
+        full: Boolean(data.full)
+      };
+    } catch (error) {
+      toast({ title: 'Ошибка', description: 'Не удалось загрузить контакты', variant: 'destructive' });
+      return null;
+    }
+  };
+
+  // Живые изменения контактов и настроек (Server-Sent Events); возвращает функцию отписки
+  const subscribeChanges = (
+    authToken: string,
+    handlers: { contacts?: () => void; settings?: () => void; reset?: () => void }
+  ): (() => void) => {
+    const source = new EventSource(`${API_URLS.contacts}?action=events&token=${encodeURIComponent(authToken)}`);
+    source.addEventListener('contacts', () => handlers.contacts?.());
+    source.addEventListener('page_settings', () => handlers.settings?.());
+    source.addEventListener('reset', () => handlers.reset?.());
+    return () => source.close();
+  };
+
   const fetchPageSettings = async (): Promise<PageSettings | null> => {
     try {
       const response = await fetch(API_URLS.settings);
       if (!response.ok) throw new Error('Failed to fetch settings');
       const data = await response.json();
+      return processSettings(data);
+    } catch (error) {
+      toast({ title: 'Ошибка', description: 'Не удалось загрузить настройки', variant: 'destructive' });
+      return null;
+    }
+  };
+
+  const fetchPublicSnapshot = async (): Promise<{ contacts: Contact[]; settings: PageSettings } | null> => {
+    if (!PUBLIC_SNAPSHOT_URL) return null;
+    try {
+      const response = await fetch(PUBLIC_SNAPSHOT_URL, { cache: 'no-cache' });
+      if (!response.ok) return null;
+      const data = await response.json();
       return {
-        id: data.id || 1,
-        main_title: data.main_title || 'Мои контакты',
-        main_description: data.main_description || 'Свяжитесь со мной в Telegram',
-        background_image_url: data.background_image_url || null
+        contacts: processContacts(data.contacts || []),
+        settings: processSettings(data.settings || {})
       };
     } catch (error) {
-      toast({ title: 'Ошибка', description: 'Не удалось загрузить настройки', variant: 'destructive' });
       return null;
     }
   };
@@ -75,35 +163,69 @@ export function useContactsApi() {
     }
   };
 
-  const updateContact = async (contact: Contact, authToken: string): Promise<boolean> => {
+  // original — контакт в том виде, в котором его открыли для редактирования
+  const updateContact = async (contact: Contact, original: Contact, authToken: string): Promise<SaveResult> => {
+    const changes = changedContactFields(contact, original);
+    if (Object.keys(changes).length === 0) {
+      return { status: 'saved', version: contact.row_version ?? undefined };
+    }
     try {
-      // Склеиваем description и avatar_url обратно
-      const payload = {
-        ...contact,
-        description: contact.avatar_url 
-          ? `${contact.description}|||${contact.avatar_url}` 
-          : contact.description
-      };
-      
       const response = await fetch(API_URLS.contacts, {
-        method: 'PUT',
+        method: 'PATCH',
         headers: {
           'Content-Type': 'application/json',
-          'X-Auth-Token': authToken
+          'X-Auth-Token': authToken,
+          ...ifMatch(contact.row_version)
         },
-        body: JSON.stringify(payload)
+        body: JSON.stringify({ id: contact.id, ...changes })
       });
       
+      if (response.status === 412) {
+        toast({ title: 'Конфликт', description: 'Контакт уже изменил другой администратор, загружена актуальная версия', variant: 'destructive' });
+        return { status: 'conflict' };
+      }
       if (!response.ok) throw new Error('Failed to update contact');
       
+      const data = await response.json();
       toast({ title: 'Успешно', description: 'Контакт обновлён' });
-      return true;
+      return { status: 'saved', version: data.version };
     } catch (error) {
       toast({ title: 'Ошибка', description: 'Не удалось обновить контакт', variant: 'destructive' });
-      return false;
+      return { status: 'failed' };
     }
   };
 
+  const uploadImage = async (url: string, file: File, authToken: string): Promise<any | null> => {
+    try {
+      const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+          'Content-Type': file.type || 'application/octet-stream',
+          'X-Auth-Token': authToken
+        },
+        body: file
+      });
+      
+      if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.error || 'Failed to upload image');
+      }
+      
+      toast({ title: 'Успешно', description: 'Изображение загружено' });
+      const { version, ...uploaded } = await response.json();
+      return { ...uploaded, row_version: version };
+    } catch (error) {
+      toast({ title: 'Ошибка', description: 'Не удалось загрузить изображение', variant: 'destructive' });
+      return null;
+    }
+  };
+
+  const uploadAvatar = async (contactId: number, file: File, authToken: string): Promise<Pick<Contact, 'avatar_url' | 'avatar_variants' | 'row_version'> | null> =>
+    uploadImage(`${API_URLS.contacts}?action=upload-avatar&id=${contactId}`, file, authToken);
+
+  const uploadBackground = async (file: File, authToken: string): Promise<Pick<PageSettings, 'background_image_url' | 'background_variants' | 'row_version'> | null> =>
+    uploadImage(`${API_URLS.settings}?action=upload-background`, file, authToken);
+
   const addContact = async (newContact: Partial<Contact>, authToken: string): Promise<boolean> => {
     try {
       const response = await fetch(API_URLS.contacts, {
@@ -149,53 +271,51 @@ export function useContactsApi() {
     return false;
   };
 
-  const updateSettings = async (settings: PageSettings, authToken: string): Promise<boolean> => {
+  const updateSettings = async (settings: PageSettings, authToken: string): Promise<SaveResult> => {
     try {
       const response = await fetch(API_URLS.settings, {
-        method: 'PUT',
+        method: 'PATCH',
         headers: {
           'Content-Type': 'application/json',
-          'X-Auth-Token': authToken
+          'X-Auth-Token': authToken,
+          ...ifMatch(settings.row_version)
         },
-        body: JSON.stringify(settings)
+        body: JSON.stringify({
+          main_title: settings.main_title,
+          main_description: settings.main_description,
+          background_image_url: settings.background_image_url || null
+        })
       });
       
+      if (response.status === 412) {
+        toast({ title: 'Конфликт', description: 'Настройки уже изменил другой администратор, загружена актуальная версия', variant: 'destructive' });
+        return { status: 'conflict' };
+      }
       if (!response.ok) throw new Error('Failed to update settings');
       
+      const data = await response.json();
       toast({ title: 'Успешно', description: 'Настройки сохранены' });
-      return true;
+      return { status: 'saved', version: data.version };
     } catch (error) {
       toast({ title: 'Ошибка', description: 'Не удалось сохранить настройки', variant: 'destructive' });
-      return false;
+      return { status: 'failed' };
     }
   };
 
   const updateContactsOrder = async (contacts: Contact[], authToken: string): Promise<void> => {
-    console.log('Updating order for contacts:', contacts.map(c => ({ id: c.id, order: c.display_order })));
-    
     try {
-      const promises = contacts.map((contact, index) => {
-        // Склеиваем description и avatar_url обратно
-        const payload = {
-          ...contact,
-          display_order: index + 1,
-          description: contact.avatar_url 
-            ? `${contact.description}|||${contact.avatar_url}` 
-            : contact.description
-        };
-        console.log('Sending PUT request:', payload);
-        return fetch(API_URLS.contacts, {
-          method: 'PUT',
-          headers: {
-            'Content-Type': 'application/json',
-            'X-Auth-Token': authToken
-          },
-          body: JSON.stringify(payload)
-        });
+      const response = await fetch(`${API_URLS.contacts}?action=reorder-contacts`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          'X-Auth-Token': authToken
+        },
+        body: JSON.stringify({
+          contacts: contacts.map((contact, index) => ({ id: contact.id, sort_order: index + 1 }))
+        })
       });
       
-      const results = await Promise.all(promises);
-      console.log('All requests completed:', results.map(r => r.status));
+      if (!response.ok) throw new Error('Failed to reorder contacts');
       
       toast({ title: 'Успешно', description: 'Порядок обновлён' });
     } catch (error) {
@@ -207,9 +327,14 @@ export function useContactsApi() {
 
   return {
     fetchContacts,
+    syncContacts,
+    subscribeChanges,
     fetchPageSettings,
+    fetchPublicSnapshot,
     login,
     updateContact,
+    uploadAvatar,
+    uploadBackground,
     addContact,
     deleteContact,
     changePassword,
@@ -0,0 +1,21 @@
+// Варианты загруженного изображения (см. backend/shared/images.py)
+export interface ImageVariants {
+  hash: string;
+  sizes: number[];
+  src: string;
+  webp: Record<string, string>;
+  jpeg: Record<string, string>;
+}
+
+// srcset для <img>: WebP всех размеров с дескрипторами ширины
+export function variantSrcSet(variants?: ImageVariants | null): string | undefined {
+  if (!variants) return undefined;
+  return variants.sizes.map((size) => `${variants.webp[String(size)]} ${size}w`).join(', ');
+}
+
+// Наименьший вариант не уже targetWidth (или самый большой, если таких нет)
+export function pickVariant(variants: ImageVariants, targetWidth: number, format: 'webp' | 'jpeg' = 'webp'): string {
+  const sizes = [...variants.sizes].sort((a, b) => a - b);
+  const size = sizes.find((s) => s >= targetWidth) ?? sizes[sizes.length - 1];
+  return variants[format][String(size)] || variants.src;
+}
@@ -1,4 +1,4 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { Button } from "@/components/ui/button";
 import { Card } from "@/components/ui/card";
@@ -20,7 +20,7 @@ interface AuditLog {
 
 const AuditLogPage = () => {
   const [logs, setLogs] = useState<AuditLog[]>([]);
-  const [filteredLogs, setFilteredLogs] = useState<AuditLog[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [searchTerm, setSearchTerm] = useState("");
   const [filterType, setFilterType] = useState("all");
   const navigate = useNavigate();
@@ -31,41 +31,45 @@ const AuditLogPage = () => {
     
     if (!token || role !== 'superadmin') {
       navigate('/auth/secure-login-portal');
-      return;
     }
-    
-    fetchLogs();
   }, [navigate]);
 
+  // Фильтрация и поиск выполняются на сервере
   useEffect(() => {
-    let filtered = logs;
-    
-    if (searchTerm) {
-      filtered = filtered.filter(log => 
-        log.admin_username.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        log.action_type.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        log.details?.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-    }
-    
-    if (filterType !== 'all') {
-      filtered = filtered.filter(log => log.action_type === filterType);
-    }
-    
-    setFilteredLogs(filtered);
-  }, [searchTerm, filterType, logs]);
+    const timer = setTimeout(() => fetchLogs(), searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm, filterType]);
 
-  const fetchLogs = async () => {
+  // Новые записи журнала приходят по SSE; перечитываем первую страницу с текущими фильтрами
+  const refreshLogs = useRef<() => void>(() => {});
+  refreshLogs.current = () => fetchLogs();
+
+  useEffect(() => {
+    const token = localStorage.getItem('auth_token');
+    if (!token) return;
+    const source = new EventSource(`/api/audit/logs?action=events&token=${encodeURIComponent(token)}`);
+    const refresh = () => refreshLogs.current();
+    source.addEventListener('admin_actions', refresh);
+    source.addEventListener('reset', refresh);
+    return () => source.close();
+  }, []);
+
+  const fetchLogs = async (cursor?: string) => {
     try {
       const token = localStorage.getItem('auth_token');
-      const response = await fetch('/api/audit/logs', {
+      const params = new URLSearchParams();
+      if (searchTerm) params.set('q', searchTerm);
+      if (filterType !== 'all') params.set('action_type', filterType);
+      if (cursor) params.set('cursor', cursor);
+      
+      const response = await fetch(`/api/audit/logs?${params.toString()}`, {
         headers: { 'X-Auth-Token': token || '' }
       });
       
       if (response.ok) {
         const data = await response.json();
-        setLogs(data.logs || []);
-        setFilteredLogs(data.logs || []);
+        setLogs(prev => cursor ? [...prev, ...(data.logs || [])] : (data.logs || []));
+        setNextCursor(data.next_cursor || null);
       }
     } catch (error) {
       console.error('Error fetching logs:', error);
@@ -169,7 +173,7 @@ const AuditLogPage = () => {
         </Card>
 
         <div className="space-y-3">
-          {filteredLogs.length === 0 ? (
+          {logs.length === 0 ? (
             <Card className="p-8 text-center bg-white/95 backdrop-blur">
               <Icon name="FileSearch" size={48} className="mx-auto text-gray-400 mb-4" />
               <p className="text-gray-600">
@@ -179,7 +183,7 @@ const AuditLogPage = () => {
               </p>
             </Card>
           ) : (
-            filteredLogs.map((log) => (
+            logs.map((log) => (
               <Card key={log.id} className="p-4 bg-white/95 backdrop-blur hover:shadow-lg transition-all">
                 <div className="flex items-start gap-4">
                   <div className={`p-3 rounded-lg bg-gray-100 ${getActionColor(log.action_type)}`}>
@@ -229,8 +233,16 @@ const AuditLogPage = () => {
           )}
         </div>
 
+        {nextCursor && (
+          <div className="mt-6 text-center">
+            <Button onClick={() => fetchLogs(nextCursor)} variant="outline">
+              Загрузить ещё
+            </Button>
+          </div>
+        )}
+
         <div className="mt-6 text-center text-sm text-slate-300">
-          Всего записей: {filteredLogs.length} {searchTerm || filterType !== 'all' ? `из ${logs.length}` : ''}
+          Загружено записей: {logs.length}
         </div>
       </div>
     </div>
@@ -1,11 +1,11 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useToast } from '@/hooks/use-toast';
 import { DragEndEvent } from '@dnd-kit/core';
 import { arrayMove } from '@dnd-kit/sortable';
 import { Contact } from '@/components/EditContactDialog';
 import { PageSettings } from '@/components/PageSettingsDialog';
-import { useContactsApi } from '@/hooks/useContactsApi';
+import { useContactsApi, applyContactsDelta } from '@/hooks/useContactsApi';
 import PageHeader from '@/components/PageHeader';
 import ContactsList from '@/components/ContactsList';
 import EditContactDialog from '@/components/EditContactDialog';
@@ -14,6 +14,7 @@ import PageSettingsDialog from '@/components/PageSettingsDialog';
 import { Button } from '@/components/ui/button';
 import { Dialog, DialogContent, DialogHeader, DialogTitle } from '@/components/ui/dialog';
 import Icon from '@/components/ui/icon';
+import { pickVariant } from '@/lib/images';
 
 export default function Index() {
   const navigate = useNavigate();
@@ -36,10 +37,11 @@ export default function Index() {
   const [newPassword, setNewPassword] = useState('');
   const { toast } = useToast();
   const api = useContactsApi();
+  // Версия, до которой список контактов синхронизирован (null — ещё не загружен)
+  const syncVersion = useRef<number | null>(null);
 
   useEffect(() => {
-    loadContacts();
-    loadPageSettings();
+    loadPublicPage();
     if (authToken) {
       setIsAdminMode(true);
       const savedRole = localStorage.getItem('user_role');
@@ -49,9 +51,43 @@ export default function Index() {
     }
   }, []);
 
+  // Изменения других админов приходят сразу, без ручного обновления
+  useEffect(() => {
+    if (!authToken) return;
+    return api.subscribeChanges(authToken, {
+      contacts: () => loadContacts(),
+      settings: () => loadPageSettings(),
+      reset: () => {
+        syncVersion.current = null;
+        loadContacts();
+        loadPageSettings();
+      }
+    });
+  }, [authToken]);
+
+  const loadPublicPage = async () => {
+    // Посетители читают статический снимок, админ — актуальные данные из API
+    const snapshot = authToken ? null : await api.fetchPublicSnapshot();
+    if (snapshot) {
+      setContacts(snapshot.contacts);
+      setPageSettings(snapshot.settings);
+      return;
+    }
+    loadContacts();
+    loadPageSettings();
+  };
+
   const loadContacts = async () => {
-    const data = await api.fetchContacts();
-    setContacts(data);
+    if (!authToken) {
+      const data = await api.fetchContacts();
+      setContacts(data);
+      return;
+    }
+    // После правок админ запрашивает только изменения с последней синхронизации
+    const delta = await api.syncContacts(syncVersion.current ?? 0);
+    if (!delta) return;
+    syncVersion.current = delta.version;
+    setContacts((current) => applyContactsDelta(current, delta));
   };
 
   const loadPageSettings = async () => {
@@ -72,8 +108,9 @@ export default function Index() {
 
   const handleSaveContact = async () => {
     if (!editingContact || !authToken) return;
-    const success = await api.updateContact(editingContact, authToken);
-    if (success) {
+    const original = contacts.find((c) => c.id === editingContact.id) ?? editingContact;
+    const result = await api.updateContact(editingContact, original, authToken);
+    if (result.status === 'saved') {
       await loadContacts();
       setIsEditDialogOpen(false);
       setEditingContact(null);
@@ -81,6 +118,16 @@ export default function Index() {
         title: 'Успех',
         description: 'Контакт обновлён'
       });
+    } else if (result.status === 'conflict') {
+      // Правки поверх чужих изменений не сохраняем: диалог остаётся открытым с актуальной версией контакта
+      const latest = (await api.fetchContacts()).find((c) => c.id === editingContact.id);
+      if (latest) {
+        setEditingContact(latest);
+      } else {
+        setIsEditDialogOpen(false);
+        setEditingContact(null);
+      }
+      await loadContacts();
     } else {
       toast({
         title: 'Ошибка',
@@ -90,6 +137,23 @@ export default function Index() {
     }
   };
 
+  const handleAvatarUpload = async (file: File) => {
+    if (!editingContact || !authToken) return;
+    const uploaded = await api.uploadAvatar(editingContact.id, file, authToken);
+    if (uploaded) {
+      setEditingContact({ ...editingContact, ...uploaded });
+      await loadContacts();
+    }
+  };
+
+  const handleBackgroundUpload = async (file: File) => {
+    if (!authToken) return;
+    const uploaded = await api.uploadBackground(file, authToken);
+    if (uploaded) {
+      setPageSettings({ ...pageSettings, ...uploaded });
+    }
+  };
+
   const handleAddContact = async () => {
     if (!authToken) return;
     const newContact = {
@@ -164,13 +228,17 @@ export default function Index() {
 
   const handleSaveSettings = async () => {
     if (!authToken) return;
-    const success = await api.updateSettings(pageSettings, authToken);
-    if (success) {
+    const result = await api.updateSettings(pageSettings, authToken);
+    if (result.status === 'saved') {
+      setPageSettings((current) => ({ ...current, row_version: result.version ?? current.row_version }));
       setIsSettingsDialogOpen(false);
       toast({
         title: 'Успех',
         description: 'Настройки сохранены'
       });
+    } else if (result.status === 'conflict') {
+      setIsSettingsDialogOpen(false);
+      await loadPageSettings();
     } else {
       toast({
         title: 'Ошибка',
@@ -204,13 +272,19 @@ export default function Index() {
       await api.updateContactsOrder(newContacts, authToken);
     } catch (error) {
       console.error('Error updating order, reloading:', error);
-      await loadContacts();
     }
+    // Перестановка меняет row_version строк: без перезагрузки следующая правка получила бы ложный 412
+    await loadContacts();
   };
 
-  const backgroundStyle = pageSettings.background_image_url 
+  // Загруженный фон отдаётся вариантом под ширину экрана
+  const backgroundUrl = pageSettings.background_variants
+    ? pickVariant(pageSettings.background_variants, window.innerWidth * (window.devicePixelRatio || 1))
+    : pageSettings.background_image_url;
+
+  const backgroundStyle = backgroundUrl 
     ? { 
-        backgroundImage: `linear-gradient(to bottom right, rgba(139, 92, 246, 0.6), rgba(236, 72, 153, 0.6), rgba(251, 146, 60, 0.6)), url(${pageSettings.background_image_url})`, 
+        backgroundImage: `linear-gradient(to bottom right, rgba(139, 92, 246, 0.6), rgba(236, 72, 153, 0.6), rgba(251, 146, 60, 0.6)), url(${backgroundUrl})`, 
         backgroundSize: 'cover', 
         backgroundPosition: 'center' 
       }
@@ -258,6 +332,7 @@ export default function Index() {
           contact={editingContact}
           onContactChange={setEditingContact}
           onSave={handleSaveContact}
+          onAvatarUpload={handleAvatarUpload}
         />
 
         <ChangePasswordDialog
@@ -276,6 +351,7 @@ export default function Index() {
           settings={pageSettings}
           onSettingsChange={setPageSettings}
           onSave={handleSaveSettings}
+          onBackgroundUpload={handleBackgroundUpload}
         />
 
         <Dialog open={isDisclaimerOpen} onOpenChange={setIsDisclaimerOpen}>
@@ -14,8 +14,8 @@ scp -r backend/ ${USER}@${SERVER}:/root/contacts-app/
 echo "🔄 Restarting services..."
 ssh ${USER}@${SERVER} << 'EOF'
 cd /root/contacts-app
-sudo systemctl restart contacts-api auth-api settings-api
-sudo systemctl status contacts-api auth-api settings-api --no-pager
+sudo systemctl restart contacts-backend
+sudo systemctl status contacts-backend --no-pager
 EOF
 
 echo "✅ Backend services updated successfully!"